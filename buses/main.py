@@ -0,0 +1,355 @@
+# Shared D-Bus connections for every D-Bus backed widget
+#
+# qtile's widgets open a connection each (and Mpris2 a new one per property
+# read), each with its own match rules and introspection. The pool keeps one
+# session and one system connection, and hands widgets a Lease instead: it
+# behaves like a connected MessageBus, but
+#   - AddMatch/RemoveMatch are reference counted, so a rule several widgets
+#     want is only sent to the daemon once
+#   - introspection data is cached per (destination, path)
+#   - message handlers are timed per owner, and every message is counted
+#   - proxy objects subscribe to their signals through the lease
+#   - disconnect() only drops the lease's handlers and rules, and the socket
+#     qtile closes after it is a stand-in, never the shared connection
+#
+# install() points the MessageBus, add_signal_receiver and _send_dbus_message
+# names of the already imported widget modules at the pool (again after a
+# config reload, replacing an older pool's wrappers), so it is called once
+# the bars are built. The leases the wrappers make are kept out of qtile's
+# dbus_bus_connections; one stand-in there releases them all when qtile
+# drops its D-Bus connections, on a config reload or at shutdown.
+# StatusNotifier exports objects and owns names on its connection, so it
+# keeps its own.
+#
+# stats() summarises message rates and handler time per widget, and is
+# logged when qtile shuts down.
+
+import functools
+import inspect
+import sys
+import time
+
+from dbus_fast import BusType, Message, MessageType
+from dbus_fast.aio import MessageBus
+from libqtile.log_utils import logger
+from libqtile.utils import create_task, dbus_bus_connections
+
+BUS_TYPES = {"session": BusType.SESSION, "system": BusType.SYSTEM}
+PATCHED_PACKAGES = ("libqtile.widget.", "qtile_extras.widget.")
+SKIP_MODULES = ("statusnotifier", "status_notifier")
+PROPERTIES = "org.freedesktop.DBus.Properties"
+
+
+def _bus_name(bus_type):
+    return "system" if bus_type == BusType.SYSTEM else "session"
+
+
+def match_rule(**match):
+    return ",".join(f"{k}='{v}'" for k, v in (("type", "signal"), *match.items()) if v)
+
+
+class _Socket:
+    """Closed by remove_dbus_rules() after disconnect(), there's nothing to close"""
+
+    def close(self):
+        pass
+
+
+class Lease:
+    """What a widget sees as its own connected MessageBus"""
+
+    def __init__(self, pool, name, owner):
+        self._pool = pool
+        self._name = name
+        self._owner = owner
+        self._bus = None
+        self._sock = _Socket()
+        self._handlers = {}
+        self._rules = []
+
+    async def connect(self):
+        self._bus = await self._pool.bus(self._name)
+        return self
+
+    def add_message_handler(self, handler):
+        timed = self._pool._timed(self._owner, handler)
+        self._handlers[handler] = timed
+        self._bus.add_message_handler(timed)
+
+    def remove_message_handler(self, handler):
+        timed = self._handlers.pop(handler, None)
+        if timed is not None:
+            self._bus.remove_message_handler(timed)
+
+    async def call(self, message):
+        if message.destination == "org.freedesktop.DBus" and message.member in (
+            "AddMatch",
+            "RemoveMatch",
+        ):
+            (rule,) = message.body
+            if message.member == "AddMatch":
+                self._rules.append(rule)
+                await self._pool.add_match(self._name, rule)
+            elif rule in self._rules:
+                self._rules.remove(rule)
+                await self._pool.remove_match(self._name, rule)
+            return Message.new_method_return(message)
+        return await self._bus.call(message)
+
+    async def introspect(self, destination, path, **kwargs):
+        return await self._pool.introspect(self._name, destination, path)
+
+    def get_proxy_object(self, bus_name, path, introspection):
+        proxy = self._bus.get_proxy_object(bus_name, path, introspection)
+        # Its interfaces add their signal handlers and rules through the
+        # lease, so disconnect() drops them too
+        proxy.bus = self
+        return proxy
+
+    # The proxy interfaces' match rules
+    def _add_match_rule(self, rule):
+        self._rules.append(rule)
+        create_task(self._pool.add_match(self._name, rule))
+
+    def _remove_match_rule(self, rule):
+        if rule in self._rules:
+            self._rules.remove(rule)
+            self._pool.release_match(self._name, rule)
+
+    def disconnect(self):
+        for timed in self._handlers.values():
+            self._bus.remove_message_handler(timed)
+        self._handlers.clear()
+        for rule in self._rules:
+            self._pool.release_match(self._name, rule)
+        self._rules.clear()
+
+    def __getattr__(self, attr):
+        return getattr(self._bus, attr)
+
+
+class _Released:
+    """Stands in dbus_bus_connections for the wrappers' leases
+
+    remove_dbus_rules() disconnects it when qtile drops its D-Bus connections,
+    which releases them all.
+    """
+
+    def __init__(self):
+        self.leases = []
+        self._sock = _Socket()
+
+    def add(self, lease):
+        self.leases.append(lease)
+        dbus_bus_connections.add(self)
+
+    def disconnect(self):
+        while self.leases:
+            self.leases.pop().disconnect()
+
+
+class BusPool:
+    def __init__(self):
+        self.buses = {}
+        self.matches = {}  # (bus, rule) -> users
+        self.introspection = {}
+        self.properties_cache = {}  # (bus, destination, path, interface) -> dict
+        self.messages = {"session": 0, "system": 0}
+        self.handlers = {}  # owner -> [calls, total ns, max ns]
+        self.released = _Released()
+        self.started = time.monotonic()
+
+    async def bus(self, name):
+        if name not in self.buses:
+            bus = await MessageBus(bus_type=BUS_TYPES[name]).connect()
+            if name in self.buses:  # another caller connected meanwhile
+                bus.disconnect()
+            else:
+                bus.add_message_handler(functools.partial(self._count, name))
+                self.buses[name] = bus
+        return self.buses[name]
+
+    def lease(self, name, owner):
+        return Lease(self, name, owner)
+
+    async def call(
+        self, name, destination, path, interface, member, signature="", body=()
+    ):
+        bus = await self.bus(name)
+        reply = await bus.call(
+            Message(
+                destination=destination,
+                path=path,
+                interface=interface,
+                member=member,
+                signature=signature,
+                body=list(body),
+            )
+        )
+        if reply.message_type == MessageType.ERROR:
+            raise RuntimeError(f"{member}: {reply.error_name} {reply.body}")
+        return reply.body
+
+    # Match rules
+    async def add_match(self, name, rule):
+        key = (name, rule)
+        self.matches[key] = self.matches.get(key, 0) + 1
+        if self.matches[key] == 1:
+            await self.call(
+                name,
+                "org.freedesktop.DBus",
+                "/org/freedesktop/DBus",
+                "org.freedesktop.DBus",
+                "AddMatch",
+                "s",
+                [rule],
+            )
+
+    async def remove_match(self, name, rule):
+        key = (name, rule)
+        self.matches[key] = self.matches.get(key, 1) - 1
+        if self.matches[key] <= 0:
+            del self.matches[key]
+            await self.call(
+                name,
+                "org.freedesktop.DBus",
+                "/org/freedesktop/DBus",
+                "org.freedesktop.DBus",
+                "RemoveMatch",
+                "s",
+                [rule],
+            )
+
+    def release_match(self, name, rule):
+        create_task(self.remove_match(name, rule))
+
+    # Caches
+    async def introspect(self, name, destination, path):
+        key = (name, destination, path)
+        if key not in self.introspection:
+            bus = await self.bus(name)
+            self.introspection[key] = await bus.introspect(destination, path)
+        return self.introspection[key]
+
+    async def properties(self, name, destination, path, interface):
+        """GetAll, served from a cache kept current by PropertiesChanged"""
+        key = (name, destination, path, interface)
+        if key not in self.properties_cache:
+            rule = match_rule(
+                sender=destination,
+                path=path,
+                interface=PROPERTIES,
+                member="PropertiesChanged",
+            )
+            await self.add_match(name, rule)
+            (props,) = await self.call(
+                name, destination, path, PROPERTIES, "GetAll", "s", [interface]
+            )
+            self.properties_cache[key] = {k: v.value for k, v in props.items()}
+        return self.properties_cache[key]
+
+    def _count(self, name, message):
+        self.messages[name] += 1
+        if (
+            message.message_type == MessageType.SIGNAL
+            and message.member == "PropertiesChanged"
+        ):
+            interface, changed, invalidated = message.body
+            for key, cached in self.properties_cache.items():
+                if key[0] == name and key[2] == message.path and key[3] == interface:
+                    cached.update({k: v.value for k, v in changed.items()})
+                    for prop in invalidated:
+                        cached.pop(prop, None)
+
+    # Stats
+    def _timed(self, owner, handler):
+        stats = self.handlers.setdefault(owner, [0, 0, 0])
+
+        def timed(message):
+            start = time.perf_counter_ns()
+            try:
+                return handler(message)
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+
+        return timed
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        lines = [
+            f"{name}: {count} messages, {count / elapsed:.2f}/s"
+            for name, count in self.messages.items()
+        ]
+        lines.append(
+            f"{len(self.matches)} match rules, {len(self.introspection)} introspections cached"
+        )
+        for owner, (calls, total, worst) in sorted(
+            self.handlers.items(), key=lambda i: -i[1][1]
+        ):
+            lines.append(
+                f"{owner}: {calls} calls, {total / 1e6:.1f} ms total, {worst / 1000:.0f} µs max"
+            )
+        return "\n".join(lines)
+
+    # Hooking up qtile's widgets
+    def _lease_factory(self, owner):
+        def factory(bus_address=None, bus_type=BusType.SESSION, **kwargs):
+            if bus_address is not None or kwargs.get("negotiate_unix_fd"):
+                return MessageBus(bus_address=bus_address, bus_type=bus_type, **kwargs)
+            return self.lease(_bus_name(bus_type), owner)
+
+        factory.pooled = True
+        return factory
+
+    def _with_bus(self, owner, original, bus_argument):
+        signature = inspect.signature(original)
+
+        @functools.wraps(original)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            if bound.arguments.get(bus_argument) is not None:
+                return await original(*bound.args, **bound.kwargs)
+            session = bound.arguments.get("session_bus", False)
+            lease = self.lease("session" if session else "system", owner)
+            bound.arguments[bus_argument] = await lease.connect()
+            if "preserve" in signature.parameters:
+                # Kept out of dbus_bus_connections, released by the pool's
+                # stand-in there instead
+                bound.arguments["preserve"] = True
+            try:
+                return await original(*bound.args, **bound.kwargs)
+            finally:
+                if lease._handlers or lease._rules:
+                    self.released.add(lease)
+
+        wrapper.pooled = True
+        return wrapper
+
+    def install(self):
+        patched = []
+        for module_name, module in list(sys.modules.items()):
+            if not module_name.startswith(PATCHED_PACKAGES) or module is None:
+                continue
+            owner = module_name.rsplit(".", 1)[-1]
+            if owner in SKIP_MODULES:
+                continue
+            factory = getattr(module, "MessageBus", None)
+            if factory is MessageBus or getattr(factory, "pooled", False):
+                module.MessageBus = self._lease_factory(owner)
+                patched.append(owner)
+            for name, bus_argument in (
+                ("add_signal_receiver", "use_bus"),
+                ("_send_dbus_message", "bus"),
+            ):
+                original = getattr(module, name, None)
+                if original is None:
+                    continue
+                if getattr(original, "pooled", False):
+                    # An earlier install's, possibly by a pool since replaced
+                    original = original.__wrapped__
+                setattr(module, name, self._with_bus(owner, original, bus_argument))
+                patched.append(f"{owner}.{name}")
+        logger.info("buses: pooled %s", ", ".join(patched))
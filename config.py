@@ -1,22 +1,34 @@
 import json
 import os
-import random
 import re
-import subprocess
 from datetime import datetime
 from pathlib import Path
-from zoneinfo import ZoneInfo
 
 from libqtile import bar, hook, layout, qtile, widget
 from libqtile.backend import base
-from libqtile.backend.wayland.inputs import InputConfig
 from libqtile.config import Click, Drag, DropDown, Group, Key, Match, ScratchPad, Screen
 from libqtile.lazy import lazy
+from libqtile.log_utils import logger
 from libqtile.widget.base import ThreadPoolText
 from qtile_extras import widget as extra_widget
-from qtile_extras.popup.toolkit import PopupGridLayout, PopupText
 
-import journaling.main as journal
+import buses.main as dbuspool
+import frames.main as frames
+import launcher.main as launching
+import menus.main as popupmenus
+import notes.main as notesearch
+import placement.main as placement
+import polling.main as polling
+import processes.main as processes
+import reloading.main as reloading
+import scratchpads.main as scratchpads
+import segments.main as segments
+import session.main as sessions
+import topology.main as topology
+import typesetting.main as typesetting
+import units.main as units
+import wallpaper.main as wallpaper
+import windowing.main as windowing
 
 # Set environment variables to ensure applications utilize correct settings
 os.environ["XDG_SESSION_DESKTOP"] = "qtile"
@@ -31,6 +43,12 @@ alt = "mod1"
 ctrl = "control"
 shift = "shift"
 
+# Obsidian vault searched by mod+o / mod+shift+o
+notes_vault = f"{home}/Obsidian"
+
+# Wallpapers offered by mod+w
+wallpaper_dir = f"{home}/Pictures/Wallpapers"
+
 # Set default apps
 terminal = "ghostty"
 browser = "firefox"
@@ -41,33 +59,161 @@ brightness = "brightnessctl"
 media = "playerctl"
 app_launcher = "rofi"
 
+# Services are built with reloading.keep(): an incremental reload evaluates
+# this file again, and a full one re-runs it, and both get the running ones
+# back instead of new copies. They are started from startup hooks (fired
+# again after a full reload), once each, as reloading.starting() says.
+
+# One session and one system bus connection shared by every D-Bus user
+bus_pool = reloading.keep("bus_pool", dbuspool.BusPool)
+
+# Everything the config starts goes through here. Helpers (scripts and
+# short-lived tools) are capped, apps are only tracked.
+procs = reloading.keep(
+    "procs",
+    lambda: processes.ProcessManager(
+        limits={"helpers": {"MemoryMax": 512 * 1024**2, "CPUQuota": 50}},
+        pool=bus_pool,
+    ),
+)
+
+
+@hook.subscribe.shutdown
+def log_bus_and_process_stats():
+    logger.info("D-Bus stats:\n%s", bus_pool.stats())
+    logger.info("Process stats:\n%s", procs.stats())
+    logger.info("Poll stats:\n%s", polling.stats())
+    logger.info("Redraw stats:\n%s", frame_scheduler.stats())
+    logger.info("Text layout cache: %s", layout_cache.stats())
+    logger.info("Screens:\n%s", screen_manager.stats())
+    logger.info("Placement: %s", placement_rules.stats())
+    logger.info("Wallpapers: %s", wallpapers.stats())
+
 
 # Custom Functions
-class CustomWiFiWidget(ThreadPoolText):
+class CustomWiFiWidget(polling.PollPolicy, ThreadPoolText):
+    """Signal strength of wlan0, parked while it's down and re-armed on link-up"""
+
     def __init__(self, **config):
+        config.setdefault("failure_text", "󰖪 0%")
         super().__init__("", **config)
-        self.add_callbacks({"Button1": lazy.spawn(f"{terminal} -e nmtui")})
+        self.add_callbacks(
+            {"Button1": lazy.function(procs.run, f"{terminal} -e nmtui")}
+        )
         self.update_interval = 5  # Refresh every 5 seconds
 
+    async def _config_async(self):
+        unit_monitor.watch_link("wlan0", self.link_changed)
+
+    def link_changed(self, up):
+        if up and self.parked:
+            self.rearm()
+
     def poll(self):
-        try:
-            # Get Signal Strength in dBm
-            signal_dbm = subprocess.check_output(
-                "iw dev wlan0 link | grep signal | awk '{print $2}'",
-                shell=True,
-                text=True,
-            ).strip()
-            signal_dbm = int(signal_dbm)
+        # Get Signal Strength in dBm, "signal: -52 dBm". Raises while the link
+        # is down, which backs off and eventually parks the widget.
+        link = procs.output(["iw", "dev", "wlan0", "link"])
+        signal_dbm = int(link.split("signal:")[1].split()[0])
+
+        # Convert dBm to percentage (approximate)
+        signal_percent = max(0, min(100, 2 * (signal_dbm + 100)))
 
-            # Convert dBm to percentage (approximate)
-            signal_percent = max(0, min(100, 2 * (signal_dbm + 100)))
+        return f" {signal_percent}%"
 
-            return f" {signal_percent}%"
-        except Exception as e:
-            return f"Wi-Fi: {str(e)}"
+
+class PolledCommand(polling.PollPolicy, widget.GenPollCommand):
+    """GenPollCommand without a shell, where a failing command backs off"""
+
+    def poll(self):
+        output = procs.output(self.cmd, check=True)
+        return self.parse(output) if self.parse else output.strip()
+
+
+class UnitStatusWidget(widget.TextBox):
+    """Colours its label from a UnitMonitor, optionally gated on a tunnel link"""
+
+    # Compared by reloading, they aren't in _user_config
+    positional_params = ("monitor", "unit", "label", "link", "colours")
+
+    def __init__(self, monitor, unit, label, link=None, colours=None, **config):
+        super().__init__(text=label, **config)
+        self.monitor = monitor
+        self.unit = unit
+        self.label = label
+        self.link = link
+        self.colours = colours or {}
+        self.state = ("inactive", "dead")
+        self.link_up = link is None
+        self.watching = False
+
+    async def _config_async(self):
+        self.monitor.watch(self.unit, self.unit_changed)
+        if self.link:
+            self.monitor.watch_link(self.link, self.link_changed)
+        self.watching = True
+
+    def finalize(self):
+        # The monitor outlives a config reload, this widget doesn't
+        if self.watching:
+            self.monitor.unwatch(self.unit, self.unit_changed)
+            if self.link:
+                self.monitor.unwatch_link(self.link, self.link_changed)
+        super().finalize()
+
+    def unit_changed(self, active_state, sub_state):
+        self.state = (active_state, sub_state)
+        self.recolour()
+
+    def link_changed(self, up):
+        self.link_up = up
+        self.recolour()
+
+    def recolour(self):
+        active_state, sub_state = self.state
+        if active_state == "failed":
+            status = "failed"
+        elif active_state == "active" and self.link_up:
+            status = "active"
+        elif active_state == "inactive" and sub_state == "dead":
+            status = "dead"
+        else:
+            # Starting, stopping, or running without the tunnel up yet
+            status = "inactive"
+        colour = self.colours.get(status, self.foreground)
+        if colour != self.foreground and self.can_draw():
+            self.foreground = self.layout.colour = colour
+            self.draw()
 
 
+# The popup toolkit, journal prompts and zoneinfo are only imported on the
+# first click, they aren't needed to get the bars on screen.
 def show_journal_ideas(qtile):
+    from qtile_extras.popup.toolkit import PopupGridLayout, PopupText
+
+    import journaling.main as journal
+
+    prompt_type, prompt = journal.next_prompt()
+
+    def write_entry():
+        # Click the prompt to answer it, the entry goes to journaling/entries.py
+        layout.kill()
+        if prompt_type is None:
+            return
+        procs.spawn(
+            [
+                terminal,
+                f"--working-directory={home}/.config/qtile",
+                "-e",
+                "python",
+                "-m",
+                "journaling.entries",
+                "write",
+                prompt_type,
+                "--prompt",
+                prompt,
+            ]
+        )
+
     controls = [
         PopupText(
             row=0,
@@ -82,7 +228,8 @@ def show_journal_ideas(qtile):
             font="JetBrainsMono NFP",
             fontsize=14,
             h_align="left",
-            text=journal.journal_prompt(random.randint(0, 4)),
+            text=prompt,
+            mouse_callbacks={"Button1": write_entry},
         )
     ]
     layout = PopupGridLayout(
@@ -101,6 +248,10 @@ def show_journal_ideas(qtile):
 
 
 def show_clocks(qtile):
+    from zoneinfo import ZoneInfo
+
+    from qtile_extras.popup.toolkit import PopupGridLayout, PopupText
+
     time_display = []
     timezones = {
         "Pacific": "America/Los_Angeles",
@@ -144,83 +295,83 @@ def show_clocks(qtile):
     layout.show(centered=True)
 
 
+# Note search, indexed in-process and kept fresh with inotify
+notes = reloading.keep(
+    "notes",
+    lambda: notesearch.NoteService(
+        notes_vault, os.path.expanduser("~/.cache/qtile/notes.idx"), procs
+    ),
+)
+
+
+@hook.subscribe.startup
+def start_note_search():
+    if reloading.starting("notes"):
+        notes.start(qtile)
+
+
+@hook.subscribe.shutdown
+def save_note_index():
+    notes.stop()
+
+
+# App launcher, desktop entries and $PATH served from memory, frecency ranked
+launcher = reloading.keep(
+    "launcher",
+    lambda: launching.Launcher(
+        terminal,
+        os.path.expanduser("~/.cache/qtile/launcher.idx"),
+        os.path.expanduser("~/.local/share/qtile/launcher-frecency.json"),
+        procs,
+    ),
+)
+
+
+@hook.subscribe.startup
+def start_launcher():
+    if reloading.starting("launcher"):
+        launcher.start(qtile)
+
+
 # Custom Window Behaviour
 @lazy.group.function
 def cycle_windows(group, forwards=True):
-    current = group.current_window
-    if current:
-        current.change_layer()
-
-        if forwards:
-            group.next_window()
-        else:
-            group.previous_window()
-
-    current = group.current_window
-    if current:
-        current.bring_to_front()
+    windowing.cycle_windows(group, forwards)
 
 
 @lazy.function
 def window_to_prev_group(qtile):
-    i = qtile.groups.index(qtile.current_group)
-    if qtile.current_window is not None and i != 0:
-        qtile.current_window.togroup(qtile.groups[i - 1].name)
-        qtile.current_screen.prev_group()
+    windowing.window_to_prev_group(qtile)
 
 
 @lazy.function
 def window_to_next_group(qtile):
-    i = qtile.groups.index(qtile.current_group)
-    if qtile.current_window is not None and i != 6:
-        qtile.current_window.togroup(qtile.groups[i + 1].name)
-        qtile.current_screen.next_group()
+    windowing.window_to_next_group(qtile)
 
 
 @lazy.function
 def float_to_front(qtile):
     """Bring all floating windows of the group to front"""
-    for window in qtile.current_group.windows:
-        if window.floating:
-            window.bring_to_front()
+    windowing.float_to_front(qtile)
 
 
 # Sticky Window Functionality
-sticky_windows = []
+sticky_windows = windowing.sticky_windows
 
 
 @lazy.function
 def toggle_sticky_windows(qtile, window=None):
-    if window is None:
-        window = qtile.current_screen.group.current_window
-    if window in sticky_windows:
-        sticky_windows.remove(window)
-    else:
-        sticky_windows.append(window)
-    return window
+    return windowing.toggle_sticky_windows(qtile, window)
 
 
 @hook.subscribe.setgroup
 def move_sticky_windows():
-    for window in sticky_windows:
-        window.togroup()
-        window.bring_to_front()
-        qtile.current_screen.group.focus_back()
-    return
+    windowing.move_sticky_windows(qtile)
 
 
 @hook.subscribe.client_killed
 def remove_sticky_windows(window):
-    if window in sticky_windows:
-        sticky_windows.remove(window)
-
-
-# @hook.subscribe.client_managed
-# def auto_sticky_windows(window):
-#     info = window.info()
-#     if info["wm_class"] == ["firefox"] and info["name"] == "Picture-in-Picture":
-#         window.set_position_floating(1164, 38)
-#         sticky_windows.append(window)
+    windowing.remove_sticky_windows(window)
 
 
 keys = [
@@ -228,45 +379,56 @@ keys = [
     Key(
         [],
         "XF86AudioMute",
-        lazy.spawn(f"{vol} -q sset Master toggle"),
+        lazy.function(procs.run_helper, f"{vol} -q sset Master toggle"),
         desc="Mute/Unmute Media",
     ),
     Key(
         [],
         "XF86AudioLowerVolume",
-        lazy.spawn(f"{vol} -q sset Master,0 3%-"),
+        lazy.function(procs.run_helper, f"{vol} -q sset Master,0 3%-"),
         desc="Lower Volume by 3%",
     ),
     Key(
         [],
         "XF86AudioRaiseVolume",
-        lazy.spawn(f"{vol} -q sset Master,0 3%+"),
+        lazy.function(procs.run_helper, f"{vol} -q sset Master,0 3%+"),
         desc="Increase Voume by 3%",
     ),
     Key(
         [],
         "XF86AudioMicMute",
-        lazy.spawn(f"{vol} -q sset 'Capture' toggle"),
+        lazy.function(procs.run_helper, f"{vol} -q sset 'Capture' toggle"),
         desc="Mute/Unmute Microphone",
     ),
     Key(
         [],
         "XF86MonBrightnessUp",
-        lazy.spawn(f"{brightness} set +10%"),
+        lazy.function(procs.run_helper, f"{brightness} set +10%"),
         desc="Increase Brightness by 10%",
     ),
     Key(
         [],
         "XF86MonBrightnessDown",
-        lazy.spawn(f"{brightness} set 10%-"),
+        lazy.function(procs.run_helper, f"{brightness} set 10%-"),
         desc="Decrease Brightness by 10%",
     ),
     Key(
-        [], "XF86AudioPlay", lazy.spawn(f"{media} play-pause"), desc="Play/Pause Media"
+        [],
+        "XF86AudioPlay",
+        lazy.function(procs.run_helper, f"{media} play-pause"),
+        desc="Play/Pause Media",
     ),
-    Key([], "XF86AudioNext", lazy.spawn(f"{media} next"), desc="Play Next Media"),
     Key(
-        [], "XF86AudioPrev", lazy.spawn(f"{media} previous"), desc="Play Previous Media"
+        [],
+        "XF86AudioNext",
+        lazy.function(procs.run_helper, f"{media} next"),
+        desc="Play Next Media",
+    ),
+    Key(
+        [],
+        "XF86AudioPrev",
+        lazy.function(procs.run_helper, f"{media} previous"),
+        desc="Play Previous Media",
     ),
     # Switch between windows
     Key([mod], "Left", lazy.layout.left(), desc="Move focus to left"),
@@ -291,30 +453,43 @@ keys = [
     # Cycle Windows
     Key([mod, shift], "Tab", cycle_windows(), desc="Cycle through windows"),
     # App Launcher
-    Key([mod], "Return", lazy.spawn(terminal), desc="Launch terminal"),
-    Key([mod], "g", lazy.spawn(browser), desc="Launch browser"),
-    Key([mod], "e", lazy.spawn(explorer), desc="Launch File Explorer"),
-    Key([mod], "r", lazy.spawncmd(), desc="Spawn a command using a prompt widget"),
-    Key(
-        [mod], "space", lazy.spawn(f"{home}/scripts/applauncher.sh"), desc="Launch rofi"
-    ),
+    Key([mod], "Return", lazy.function(procs.run, terminal), desc="Launch terminal"),
+    Key([mod], "g", lazy.function(procs.run, browser), desc="Launch browser"),
+    Key([mod], "e", lazy.function(procs.run, explorer), desc="Launch File Explorer"),
+    Key([mod], "r", lazy.function(launcher.pick_command), desc="Run a command"),
+    Key([mod], "space", lazy.function(launcher.pick_app), desc="Launch an app"),
     Key(
         [mod],
         "t",
-        lazy.spawn(f"{home}/scripts/controlcenter.sh"),
+        lazy.function(procs.run_helper, f"{home}/scripts/controlcenter.sh"),
         desc="Launch notification center",
     ),
-    Key([mod], "home", lazy.spawn(f"{home}/scripts/tasks.sh"), desc="Add Task"),
+    Key(
+        [mod],
+        "home",
+        lazy.function(procs.run_helper, f"{home}/scripts/tasks.sh"),
+        desc="Add Task",
+    ),
     # Kill Window with SUPER+q
     Key([mod], "q", lazy.window.kill(), desc="Kill focused window"),
     # Reload the config and then apply themes
     Key(
         [mod, ctrl],
         "r",
-        lazy.spawn(f"{home}/scripts/updatewal.sh"),  # Update the colorscheme
-        lazy.spawn(f"{home}/scripts/calcurseupdate.sh"),  # Update the calendar widget
+        lazy.function(
+            procs.run_helper, f"{home}/scripts/updatewal.sh"
+        ),  # Update the colorscheme
+        lazy.function(
+            procs.run_helper, f"{home}/scripts/calcurseupdate.sh"
+        ),  # Update the calendar widget
         desc="Reload the config",
     ),
+    Key(
+        [mod, alt],
+        "r",
+        lazy.function(reloading.reload_changed),
+        desc="Apply config changes without rebuilding untouched widgets",
+    ),
     Key(
         [mod, ctrl, shift], "q", lazy.shutdown(), desc="Shutdown QTile"
     ),  # Same as logout
@@ -322,7 +497,7 @@ keys = [
     Key(
         [mod, shift],
         "s",
-        lazy.spawn(f"{home}/scripts/screenshot.sh"),
+        lazy.function(procs.run_helper, f"{home}/scripts/screenshot.sh"),
         desc="Take screenshot of area and save to Pictures",
     ),
     # Fullscreen & Floating
@@ -336,7 +511,7 @@ keys = [
         desc="Toggle Window Floating Mode",
     ),
     # Lock Screen
-    Key([mod], "l", lazy.spawn(lock), desc="Lock Computer"),
+    Key([mod], "l", lazy.function(procs.run, lock), desc="Lock Computer"),
     # Tree Tab Key Bindings
     Key(
         [mod, shift],
@@ -354,8 +529,6 @@ keys = [
     ),
     # Bring Floating Windows to Front
     Key([mod], "d", lazy.function(float_to_front)),
-    # Wallpaper Selector
-    Key([mod], "w", lazy.spawn(f"{home}/scripts/wallpaper.sh select")),
     Key(
         [mod, shift],
         "f",
@@ -363,8 +536,13 @@ keys = [
         desc="Toggle Sticky Windows",
     ),
     # Search Obsidian Notes
-    Key([mod], "o", lazy.spawn(f"{home}/scripts/notes.sh")),
-    Key([mod, shift], "o", lazy.spawn(f"{home}/scripts/notegrep.sh")),
+    Key([mod], "o", lazy.function(notes.pick_title), desc="Open a note by title"),
+    Key(
+        [mod, shift],
+        "o",
+        lazy.function(notes.pick_content),
+        desc="Search note contents",
+    ),
 ]
 
 # ----------------------
@@ -385,38 +563,8 @@ groups = [
 ]
 
 
-def go_to_group(name: str):
-    def _inner(qtile):
-        if len(qtile.screens) == 1:
-            qtile.groups_map[name].toscreen()
-            return
-
-        if name in "12345":
-            qtile.focus_screen(0)
-            qtile.groups_map[name].toscreen()
-        else:
-            qtile.focus_screen(1)
-            qtile.groups_map[name].toscreen()
-
-    return _inner
-
-
-def go_to_group_and_move_window(name: str):
-    def _inner(qtile):
-        if len(qtile.screens) == 1:
-            qtile.current_window.togroup(name, switch_group=True)
-            return
-
-        if name in "12345":
-            qtile.current_window.togroup(name, switch_group=False)
-            qtile.focus_screen(0)
-            qtile.groups_map[name].toscreen()
-        else:
-            qtile.current_window.togroup(name, switch_group=False)
-            qtile.focus_screen(1)
-            qtile.groups_map[name].toscreen()
-
-    return _inner
+go_to_group = windowing.go_to_group
+go_to_group_and_move_window = windowing.go_to_group_and_move_window
 
 
 keys.extend(
@@ -538,16 +686,38 @@ groups.append(
     )
 )
 
+# Heavy apps are started hidden after login, and closed again when idle
+# dropdowns use more than the memory budget.
+dropdowns = reloading.keep(
+    "dropdowns",
+    lambda: scratchpads.DropDownManager(
+        prewarm=["dynalist", "chatgpt"],
+        memory_budget=3 * 1024**3,
+    ),
+)
+
+
+@hook.subscribe.startup
+def prewarm_dropdowns():
+    if reloading.starting("dropdowns"):
+        dropdowns.startup(qtile)
+
+
+@hook.subscribe.client_managed
+def track_dropdowns(window):
+    dropdowns.client_managed(qtile, window)
+
+
 keys.extend(
     [
-        Key([mod], "F1", lazy.group["6"].dropdown_toggle("daynote")),
-        Key([mod], "F5", lazy.group["6"].dropdown_toggle("chatgpt")),
-        Key([mod], "F6", lazy.group["6"].dropdown_toggle("dynalist")),
-        Key([mod], "F9", lazy.group["6"].dropdown_toggle("spotify")),
-        Key([mod], "F10", lazy.group["6"].dropdown_toggle("btop")),
-        Key([mod], "F11", lazy.group["6"].dropdown_toggle("calendar")),
-        Key([mod], "F12", lazy.group["6"].dropdown_toggle("whiteboard")),
-        Key([mod, shift], "Escape", lazy.group["6"].dropdown_toggle("missioncenter")),
+        Key([mod], "F1", lazy.function(dropdowns.toggle, "daynote")),
+        Key([mod], "F5", lazy.function(dropdowns.toggle, "chatgpt")),
+        Key([mod], "F6", lazy.function(dropdowns.toggle, "dynalist")),
+        Key([mod], "F9", lazy.function(dropdowns.toggle, "spotify")),
+        Key([mod], "F10", lazy.function(dropdowns.toggle, "btop")),
+        Key([mod], "F11", lazy.function(dropdowns.toggle, "calendar")),
+        Key([mod], "F12", lazy.function(dropdowns.toggle, "whiteboard")),
+        Key([mod, shift], "Escape", lazy.function(dropdowns.toggle, "missioncenter")),
     ]
 )
 
@@ -579,21 +749,28 @@ Color15 = colordict["colors"]["color15"]
 # --------------------------
 
 
-def window_sorter(win):
-    patterns = (
-        ("Zulip", "MESSAGING"),
-        ("Microsoft Teams", "MESSAGING"),
-        ("thunderbird", "MESSAGING"),
-        ("LibreOffice", "OFFICE"),
-        ("Thunderbird", "EMAIL"),
-    )
-    for k, v in patterns:
-        if k in win.name:
-            return v
-    return "APPS"
+# Where new windows go: group, floating geometry, sticky, TreeTab section.
+# For each of those the first matching rule wins; titles are regexes.
+placement_rules = placement.PlacementRules(
+    [
+        *placement.SECTION_RULES,
+        # placement.Rule(
+        #     wm_class="firefox",
+        #     title="^Picture-in-Picture$",
+        #     floating=(1164, 38),
+        #     sticky=True,
+        # ),
+    ],
+    skip_groups=["6"],
+)
+
 
+@hook.subscribe.client_managed
+def place_window(window):
+    placement_rules.apply(qtile, window)
 
-keys.extend([Key([alt], "r", lazy.layout.sort_windows(window_sorter))])
+
+keys.extend([Key([alt], "r", lazy.layout.sort_windows(placement_rules.section))])
 
 
 layout_theme = {
@@ -645,247 +822,334 @@ widget_defaults = dict(
 )
 extension_defaults = widget_defaults.copy()
 
-# ----------------------
-# Widgets
-# ----------------------
-
+# Shaped text layouts shared by the text widgets, reused as titles come round
+layout_cache = reloading.keep("layout_cache", typesetting.LayoutCache)
+if not reloading.evaluating():
+    layout_cache.install(
+        [widget.TaskList, widget.GroupBox, widget.Clock, widget.TextBox]
+    )
 
-widget_list = [
-    widget.TextBox(text="|", foreground=Color4),
-    widget.TextBox(
-        text="󰣇",
-        foreground="FFFFFF",
-        mouse_callbacks={"Button1": lambda: qtile.hide_show_bar("bottom")},
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.GroupBox(
-        visible_groups=["1", "2", "3", "4", "5"],
-        active="FFFFFF",
-        block_highlight_text_color="000000",
-        block_border="FFFFFFF",
-        foreground="FFFFFF",
-        highlight_method="block",
-        highlight="FFFFFF",
-        highlight_color=["FFFFFFF", "FFFFFF"],
-        inactive="808080",
-        rounded=False,
-        this_current_screen_border="FFFFFF",
-        this_screen_border=Color1,
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.OpenWeather(
-        location="Winnipeg",
-        format="{icon} {main_temp:.0f} °{units_temperature}",
-        mouse_callbacks={
-            "Button1": lambda: qtile.cmd_spawn(
-                f"{terminal} -e \
-                            firefox \
-                           --new-tab \
-                           'https://openweathermap.org/city/6183235'"
-            )
-        },
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.GenPollCommand(
-        cmd="/home/stephen/pyproj/calimport/main.py",
-        fmt=" {}",
-        max_chars=25,
-        update_interval=300,
-        mouse_callbacks={
-            "Button1": lazy.group["6"].dropdown_toggle("calendar"),
-            "Button3": lazy.function(show_journal_ideas),
-        },
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.Pomodoro(
-        color_active=Color7,
-        color_break=Color7,
-        color_inactive="FFFFFF",
-        fmt="{}",
-        length_pomodori=30,
-        length_short_break=10,
-        length_long_break=20,
-        notification_on=True,
-        num_pomodori=3,
-        prefix_active="󱎫 ",
-        prefix_break="󱋒 ",
-        prefix_inactive="󱎫",
-        prefix_long_break="󰤄 ",
-        prefix_paused="󱎫 ",
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.Spacer(),
-    widget.Clock(
-        format="%Y-%m-%d | %I:%M %p  ",  # Spacing required
-        timezone="US/Central",
-        mouse_callbacks={
-            "Button1": lambda: qtile.spawn(f"{home}/scripts/controlcenter.sh"),
-            "Button2": lazy.group["6"].dropdown_toggle("calendar"),
-            "Button3": lazy.function(show_clocks),
-        },
-    ),
-    widget.Spacer(),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.CheckUpdates(
-        custom_command="checkupdates",
-        display_format="󰚰 {updates}",
-        update_interval=900,
-        no_update_string="󰚰 0",
-        mouse_callbacks={"Button1": lazy.spawn(f"{terminal} -e yay")},
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.Volume(
-        fmt="󰕾 {}",
-        mouse_callbacks={"Button3": lazy.spawn(f"{home}/scripts/sound-output.sh")},
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.Bluetooth(
-        adapter_format="󰂳 {name} [{powered}{discovery}]",
-        # device="/dev_A4_C6_F0_C2_30_BD",
-        device="/dev_10_91_D1_05_CD_54",
-        default_text=" {num_connected_devices}",
-        device_format="{symbol} {name}",
-        symbol_connected="",
-        symbol_discovery=("󰂱", ""),
-        symbol_paired="󰂲",
-        symbol_powered=("⏼", "⭘"),
-        hide_unnamed_devices=True,
-        mouse_callbacks={"Button1": lazy.spawn(f"{home}/scripts/bluetooth.sh")},
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    CustomWiFiWidget(
-        mouse_callbacks={"Button1": lazy.spawn(f"{terminal} -e nmtui")},
-    ),
-    # extra_widget.Net(
-    #     interface="wlan0",
-    #     format="{down:.0f}{down_suffix} ↓↑ {up:.0f}{up_suffix}",
-    #     mouse_callbacks={"Button1": lazy.spawn(f"{terminal} -e nmtui")},
-    # ),
-    # widget.Wlan(
-    #     interface="wlan0",
-    #     format=" {percent:2.0%}",
-    #     disconnected_message="󰖪 0%",
-    #     update_interval=1,
-    #     use_ethernet=True,
-    #     mouse_callbacks={"Button1": lazy.spawn(f"{terminal} -e nmtui")},
-    # ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.CPU(
-        update_interval=15,
-        format=" {load_percent}%",
-        mouse_callbacks={"Button1": lazy.group["6"].dropdown_toggle("btop")},
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.Memory(
-        measure_mem="G",
-        format=" {MemUsed:.0f}{mm}B",
-        mouse_callbacks={"Button1": lazy.group["6"].dropdown_toggle("btop")},
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.Battery(
-        format="{char} {percent:2.0%}",
-        charge_char="󰂄",
-        discharge_char="󰂁",
-        full_char="󰁹",
-        empty_char="X",
-        not_charging_char="󰁹",
-        notify_below=0.1,
-        show_short_text=False,
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.TextBox(
-        text="⏻",
-        mouse_callbacks={"Button1": lazy.spawn(f"{home}/scripts/powermenu.sh")},
+# Power, Bluetooth and audio output menus, built from state kept in-process
+menus = reloading.keep(
+    "menus",
+    lambda: popupmenus.Menus(
+        bus_pool,
+        procs,
+        lock_command=lock,
+        border=Color3,
+        background="#1C1B1A",
+        highlight="#1C1B1A",
+        highlight_radius=0,
+        background_highlighted="#282726",
+        foreground=Color4,
+        foreground_highlighted=Color5,
+        font="JetBrainsMono NFP",
+        fontsize=16,
     ),
-    widget.TextBox(text="|", foreground=Color4),
-]
+)
 
-widget_list_second = [
-    widget.CurrentLayoutIcon(scale=0.75),
-    widget.Spacer(),
-    widget.Clock(
-        format="%Y-%m-%d | %I:%M %p  ",
-        mouse_callbacks={
-            "Button1": lambda: qtile.spawn(f"{home}/scripts/controlcenter.sh"),
-        },
-    ),
-    widget.Spacer(),
-    widget.GroupBox(
-        visible_groups=["11", "12", "13"],
-        active="FFFFFF",
-        block_highlight_text_color="000000",
-        block_border="FFFFFFF",
-        foreground="FFFFFF",
-        highlight_method="block",
-        highlight="FFFFFF",
-        highlight_color=["FFFFFFF", "FFFFFF"],
-        inactive="808080",
-        rounded=False,
-        this_current_screen_border="FFFFFF",
-        this_screen_border=Color1,
-    ),
-]
 
-widget_list_bottom = [
-    widget.TextBox(text="|", foreground=Color4),
-    widget.TaskList(
+@hook.subscribe.startup
+def start_menus():
+    if reloading.starting("menus"):
+        menus.start(qtile)
+
+
+def swap_palette(qtile, colors):
+    """A new wallpaper's colours, swapped in wherever the old palette's were"""
+    old, new = colordict["colors"], colors["colors"]
+    # pywal repeats colours (color15 is often color7): the lowest name wins
+    mapping = {old[name]: new[name] for name in reversed(old) if name in new}
+    reloading.recolour(
+        qtile,
+        mapping,
+        screens=screen_manager.pool.values(),
+        styles=[menus.style, wallpapers.style],
+    )
+    colordict.update(colors)
+
+
+# Wallpaper selector, thumbnails and palettes cached per image and kept fresh
+# with inotify; a new wallpaper's colours are applied in place
+wallpapers = reloading.keep(
+    "wallpapers",
+    lambda: wallpaper.Wallpapers(
+        wallpaper_dir,
+        os.path.expanduser("~/.cache/qtile/wallpapers"),
+        procs,
+        transition=["--transition-type", "grow", "--transition-fps", "60"],
+        on_change=swap_palette,
         border=Color3,
-        borderwidth=1,
-        font="JetBrainsMono Nerd Font Propo",
-        margin_y=1,
-        max_title_width=300,
-        padding_y=1,
-        highlight_method="block",
-        rounded=False,
-        theme_mode="preferred",
-    ),
-    widget.Spacer(),
-    widget.TextBox(text="|", foreground=Color4),
-    extra_widget.UnitStatus(
-        bus_name="system",
-        unitname="openfortivpn.service",
-        label="VPN",
-        colour_active="66800B",
-        colour_inactive="403E3C",
-        colour_dead="AF3029",
-        colour_failed="A02F6F",
+        background="#1C1B1A",
+        highlight=Color5,
+        highlight_radius=0,
     ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.GenPollCommand(
-        update_interval=1,
-        cmd=f"{home}/scripts/idleinhibit.sh",
-        fmt="{}",
-        mouse_callbacks={
-            "Button1": lambda: qtile.cmd_spawn(
-                f"{home}/scripts/idleinhibit.sh toggle",
+)
+
+
+@hook.subscribe.startup
+def start_wallpapers():
+    if reloading.starting("wallpapers"):
+        wallpapers.start(qtile)
+
+
+@hook.subscribe.shutdown
+def save_wallpaper_index():
+    wallpapers.stop()
+
+
+keys.extend(
+    [Key([mod], "w", lazy.function(wallpapers.show), desc="Wallpaper Selector")]
+)
+
+
+# Unit and link state for the status widgets, one subscription for all units
+unit_monitor = reloading.keep("unit_monitor", lambda: units.UnitMonitor(bus_pool))
+
+
+@hook.subscribe.startup
+def start_unit_monitor():
+    if reloading.starting("unit_monitor"):
+        unit_monitor.start(qtile)
+
+
+@hook.subscribe.shutdown
+def stop_unit_monitor():
+    unit_monitor.stop()
+
+
+# ----------------------
+# Widgets
+# ----------------------
+
+
+def main_screen():
+    """The laptop's bars, or whichever output comes first"""
+    widget_list = segments.compose(
+        [
+            segments.SEP,
+            widget.TextBox(
+                text="󰣇",
+                foreground="FFFFFF",
+                mouse_callbacks={"Button1": lambda: qtile.hide_show_bar("bottom")},
             ),
-        },
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.Mpris2(
-        format="{xesam:title}",
-        scroll=False,
-        paused_text=" {track}",
-        playing_text=" {track}",
-        stopped_text="  ",
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    extra_widget.StatusNotifier(
-        menu_font="JetBrainsMono Nerd Font Propo",
-        menu_foreground="#FFFFFF",
-        menu_border=Color1,
-    ),
-    widget.TextBox(text="|", foreground=Color4),
-    widget.CurrentLayoutIcon(scale=0.65),
-    widget.TextBox(text="|", foreground=Color4),
-]
+            segments.SEP,
+            widget.GroupBox(
+                visible_groups=["1", "2", "3", "4", "5"],
+                active="FFFFFF",
+                block_highlight_text_color="000000",
+                block_border="FFFFFFF",
+                foreground="FFFFFF",
+                highlight_method="block",
+                highlight="FFFFFF",
+                highlight_color=["FFFFFFF", "FFFFFF"],
+                inactive="808080",
+                rounded=False,
+                this_current_screen_border="FFFFFF",
+                this_screen_border=Color1,
+            ),
+            segments.SEP,
+            widget.OpenWeather(
+                location="Winnipeg",
+                format="{icon} {main_temp:.0f} °{units_temperature}",
+                mouse_callbacks={
+                    "Button1": lambda: procs.spawn(
+                        [
+                            browser,
+                            "--new-tab",
+                            "https://openweathermap.org/city/6183235",
+                        ]
+                    )
+                },
+            ),
+            segments.SEP,
+            PolledCommand(
+                cmd="/home/stephen/pyproj/calimport/main.py",
+                probe_interval=1800,
+                fmt=" {}",
+                max_chars=25,
+                update_interval=300,
+                mouse_callbacks={
+                    "Button1": lazy.function(dropdowns.toggle, "calendar"),
+                    "Button3": lazy.function(show_journal_ideas),
+                },
+            ),
+            segments.SEP,
+            widget.Pomodoro(
+                color_active=Color7,
+                color_break=Color7,
+                color_inactive="FFFFFF",
+                fmt="{}",
+                length_pomodori=30,
+                length_short_break=10,
+                length_long_break=20,
+                notification_on=True,
+                num_pomodori=3,
+                prefix_active="󱎫 ",
+                prefix_break="󱋒 ",
+                prefix_inactive="󱎫",
+                prefix_long_break="󰤄 ",
+                prefix_paused="󱎫 ",
+            ),
+            segments.SEP,
+            widget.Spacer(),
+            widget.Clock(
+                format="%Y-%m-%d | %I:%M %p  ",  # Spacing required
+                timezone="US/Central",
+                mouse_callbacks={
+                    "Button1": lambda: procs.spawn(
+                        f"{home}/scripts/controlcenter.sh", "helpers"
+                    ),
+                    "Button2": lazy.function(dropdowns.toggle, "calendar"),
+                    "Button3": lazy.function(show_clocks),
+                },
+            ),
+            widget.Spacer(),
+            segments.SEP,
+            widget.CheckUpdates(
+                custom_command="checkupdates",
+                display_format="󰚰 {updates}",
+                update_interval=900,
+                no_update_string="󰚰 0",
+                mouse_callbacks={
+                    "Button1": lazy.function(procs.run, f"{terminal} -e yay")
+                },
+            ),
+            segments.SEP,
+            widget.Volume(
+                fmt="󰕾 {}",
+                mouse_callbacks={"Button3": lazy.function(menus.show_audio)},
+            ),
+            segments.SEP,
+            widget.Bluetooth(
+                adapter_format="󰂳 {name} [{powered}{discovery}]",
+                # device="/dev_A4_C6_F0_C2_30_BD",
+                device="/dev_10_91_D1_05_CD_54",
+                default_text=" {num_connected_devices}",
+                device_format="{symbol} {name}",
+                symbol_connected="",
+                symbol_discovery=("󰂱", ""),
+                symbol_paired="󰂲",
+                symbol_powered=("⏼", "⭘"),
+                hide_unnamed_devices=True,
+                mouse_callbacks={"Button1": lazy.function(menus.show_bluetooth)},
+            ),
+            segments.SEP,
+            CustomWiFiWidget(
+                mouse_callbacks={
+                    "Button1": lazy.function(procs.run, f"{terminal} -e nmtui")
+                },
+            ),
+            # extra_widget.Net(
+            #     interface="wlan0",
+            #     format="{down:.0f}{down_suffix} ↓↑ {up:.0f}{up_suffix}",
+            #     mouse_callbacks={"Button1": lazy.spawn(f"{terminal} -e nmtui")},
+            # ),
+            # widget.Wlan(
+            #     interface="wlan0",
+            #     format=" {percent:2.0%}",
+            #     disconnected_message="󰖪 0%",
+            #     update_interval=1,
+            #     use_ethernet=True,
+            #     mouse_callbacks={"Button1": lazy.spawn(f"{terminal} -e nmtui")},
+            # ),
+            segments.SEP,
+            widget.CPU(
+                update_interval=15,
+                format=" {load_percent}%",
+                mouse_callbacks={"Button1": lazy.function(dropdowns.toggle, "btop")},
+            ),
+            segments.SEP,
+            widget.Memory(
+                measure_mem="G",
+                format=" {MemUsed:.0f}{mm}B",
+                mouse_callbacks={"Button1": lazy.function(dropdowns.toggle, "btop")},
+            ),
+            segments.SEP,
+            widget.Battery(
+                format="{char} {percent:2.0%}",
+                charge_char="󰂄",
+                discharge_char="󰂁",
+                full_char="󰁹",
+                empty_char="X",
+                not_charging_char="󰁹",
+                notify_below=0.1,
+                show_short_text=False,
+            ),
+            segments.SEP,
+            widget.TextBox(
+                text="⏻",
+                mouse_callbacks={"Button1": lazy.function(menus.show_power)},
+            ),
+            segments.SEP,
+        ],
+        foreground=Color4,
+        **widget_defaults,
+    )
 
-# --------------------
-# Screen Configuration
-# --------------------
+    widget_list_bottom = segments.compose(
+        [
+            segments.SEP,
+            widget.TaskList(
+                border=Color3,
+                borderwidth=1,
+                font="JetBrainsMono Nerd Font Propo",
+                margin_y=1,
+                max_title_width=300,
+                padding_y=1,
+                highlight_method="block",
+                rounded=False,
+                theme_mode="preferred",
+            ),
+            widget.Spacer(),
+            segments.SEP,
+            UnitStatusWidget(
+                unit_monitor,
+                "openfortivpn.service",
+                "VPN",
+                link="ppp0",
+                colours={
+                    "active": "66800B",
+                    "inactive": "403E3C",
+                    "dead": "AF3029",
+                    "failed": "A02F6F",
+                },
+            ),
+            segments.SEP,
+            PolledCommand(
+                update_interval=1,
+                probe_interval=300,
+                cmd=f"{home}/scripts/idleinhibit.sh",
+                fmt="{}",
+                mouse_callbacks={
+                    "Button1": lambda: procs.spawn(
+                        f"{home}/scripts/idleinhibit.sh toggle", "helpers"
+                    ),
+                },
+            ),
+            segments.SEP,
+            widget.Mpris2(
+                format="{xesam:title}",
+                scroll=False,
+                paused_text=" {track}",
+                playing_text=" {track}",
+                stopped_text="  ",
+            ),
+            segments.SEP,
+            extra_widget.StatusNotifier(
+                menu_font="JetBrainsMono Nerd Font Propo",
+                menu_foreground="#FFFFFF",
+                menu_border=Color1,
+            ),
+            segments.SEP,
+            widget.CurrentLayoutIcon(scale=0.65),
+            segments.SEP,
+        ],
+        foreground=Color4,
+        **widget_defaults,
+    )
 
-screens = [
-    Screen(
+    return Screen(
         top=bar.Bar(
             widget_list,
             24,
@@ -902,8 +1166,45 @@ screens = [
             border_width=[2, 0, 2, 0],
             margin=[0, 0, 0, 0],
         ),
-    ),
-    Screen(
+    )
+
+
+# --------------------
+# Screen Configuration
+# --------------------
+
+
+def second_screen():
+    """Bars for the second output, and any further ones"""
+    widget_list_second = [
+        widget.CurrentLayoutIcon(scale=0.75),
+        widget.Spacer(),
+        widget.Clock(
+            format="%Y-%m-%d | %I:%M %p  ",
+            mouse_callbacks={
+                "Button1": lambda: procs.spawn(
+                    f"{home}/scripts/controlcenter.sh", "helpers"
+                ),
+            },
+        ),
+        widget.Spacer(),
+        widget.GroupBox(
+            visible_groups=["11", "12", "13"],
+            active="FFFFFF",
+            block_highlight_text_color="000000",
+            block_border="FFFFFFF",
+            foreground="FFFFFF",
+            highlight_method="block",
+            highlight="FFFFFF",
+            highlight_color=["FFFFFFF", "FFFFFF"],
+            inactive="808080",
+            rounded=False,
+            this_current_screen_border="FFFFFF",
+            this_screen_border=Color1,
+        ),
+    ]
+
+    return Screen(
         top=bar.Bar(
             widget_list_second,
             24,
@@ -911,8 +1212,38 @@ screens = [
             border_width=[2, 0, 2, 0],
             margin=[0, 0, 0, 0],
         ),
-    ),
-]
+    )
+
+
+# One Screen per output and role, built once and kept across dock/undock
+screen_manager = reloading.keep(
+    "screen_manager", lambda: topology.ScreenManager([main_screen, second_screen])
+)
+if reloading.evaluating():
+    # Bars to compare the running ones with, never shown
+    screens = screen_manager.preview([main_screen, second_screen])
+else:
+    screens = screen_manager.initial(qtile)
+
+
+@hook.subscribe.screen_change
+def reconfigure_screens_for_outputs(event):
+    screen_manager.reconfigure(qtile)
+
+
+# The widget modules are imported by now, point their D-Bus helpers at the pool
+if not reloading.evaluating():
+    bus_pool.install()
+
+# Widget and bar redraws, merged to one flush per frame
+frame_scheduler = reloading.keep("frame_scheduler", frames.FrameScheduler)
+
+
+@hook.subscribe.startup
+@hook.subscribe.screens_reconfigured
+def install_frame_scheduler():
+    frame_scheduler.install(qtile)
+
 
 # ----------------------
 # Mouse Controls
@@ -935,13 +1266,13 @@ mouse = [
 # ------------------
 #
 dgroups_key_binder = None
-dgroups_app_rules = []  # type: list
+dgroups_app_rules = []  # type: list  # placement_rules does this
 follow_mouse_focus = False
 bring_front_click = False
 cursor_warp = False
 auto_fullscreen = True
 focus_on_window_activation = "smart"
-reconfigure_screens = True
+reconfigure_screens = False  # screen_manager does it, keeping the bars
 
 # ------------------------
 # Floating Layout Ruleset
@@ -1026,31 +1357,34 @@ floating_types = [
 auto_minimize = True
 
 # When using the Wayland backend, this can be used to configure input devices.
-# wl_input_rules = None
-wl_input_rules = {
-    "*": InputConfig(
-        dwt=True, natural_scroll=True, tap=True, tap_button_map="lrm", drag=True
-    ),
-    "1133:16500:Logitech G305": InputConfig(
-        dwt=False,
-        natural_scroll=False,
-        drag=True,
-        drag_lock=True,
-    ),
-    "5426:120:Razer Razer Viper": InputConfig(
-        dwt=False,
-        natural_scroll=False,
-        drag=True,
-        drag_lock=False,
-    ),
-    "1578:16642:MOSART Semi. 2.4G Wireless Mouse": InputConfig(
-        dwt=False,
-        natural_scroll=False,
-        drag=True,
-        drag_lock=True,
-        pointer_accel=-0.3,
-    ),
-}
+wl_input_rules = None
+if qtile is not None and qtile.core.name == "wayland":
+    from libqtile.backend.wayland.inputs import InputConfig
+
+    wl_input_rules = {
+        "*": InputConfig(
+            dwt=True, natural_scroll=True, tap=True, tap_button_map="lrm", drag=True
+        ),
+        "1133:16500:Logitech G305": InputConfig(
+            dwt=False,
+            natural_scroll=False,
+            drag=True,
+            drag_lock=True,
+        ),
+        "5426:120:Razer Razer Viper": InputConfig(
+            dwt=False,
+            natural_scroll=False,
+            drag=True,
+            drag_lock=False,
+        ),
+        "1578:16642:MOSART Semi. 2.4G Wireless Mouse": InputConfig(
+            dwt=False,
+            natural_scroll=False,
+            drag=True,
+            drag_lock=True,
+            pointer_accel=-0.3,
+        ),
+    }
 
 wmname = "QTILE"
 
@@ -1060,16 +1394,132 @@ wmname = "QTILE"
 @hook.subscribe.startup_once
 def autostart():
     autorun = os.path.expanduser("~/.config/qtile/autostart.sh")
-    subprocess.Popen([autorun])
+    procs.spawn([autorun])
 
 
 @hook.subscribe.startup
 def logon():
     refresh = os.path.expanduser("~/scripts/calcurseupdate.sh")
-    subprocess.Popen([refresh])
+    procs.spawn([refresh], "helpers")
     qtile.hide_show_bar("bottom")
 
 
+@hook.subscribe.startup_complete
+def log_startup_time():
+    logger.info("config: bars up %.0f ms after qtile started", processes.age() * 1000)
+
+
+# --------------------------
+# Event Tracing
+# --------------------------
+# Replay with: python -m tracing.main replay ~/.cache/qtile/events.trace
+# Off unless QTILE_TRACE=1 is in qtile's environment: the trace holds window
+# titles. Off, nothing is wrapped or subscribed and key presses cost nothing
+# extra.
+trace_events = os.environ.get("QTILE_TRACE") == "1"
+
+if trace_events:
+    import tracing.main as tracing
+
+    tracer = reloading.keep(
+        "tracer",
+        lambda: tracing.Recorder(os.path.expanduser("~/.cache/qtile/events.trace")),
+    )
+
+    def trace_key(qtile, spec):
+        tracer.key(spec)
+
+    for key in keys:
+        key.commands = (
+            lazy.function(trace_key, tracing.key_spec(key.modifiers, key.key)),
+            *key.commands,
+        )
+
+    @hook.subscribe.setgroup
+    def trace_setgroup():
+        tracer.group(qtile.current_group.name)
+
+    @hook.subscribe.client_managed
+    def trace_client_managed(window):
+        tracer.window_mapped(window)
+
+    @hook.subscribe.client_killed
+    def trace_client_killed(window):
+        tracer.window_killed(window)
+
+    @hook.subscribe.client_focus
+    def trace_client_focus(window):
+        tracer.window_focused(window)
+
+    @hook.subscribe.screen_change
+    def trace_screen_change(event):
+        tracer.screens_changed(len(qtile.screens))
+
+
+# --------------------------
+# Session Persistence
+# --------------------------
+
+session = reloading.keep(
+    "session",
+    lambda: sessions.Session(
+        os.path.expanduser("~/.cache/qtile/session.log"), skip_groups=["6"]
+    ),
+)
+
+
+@hook.subscribe.startup
+def restore_session():
+    if not reloading.starting("session"):
+        return  # A full reload, qtile restores its own state
+    session.load()
+    session.restore_groups(qtile)
+    for window in qtile.windows_map.values():
+        if hasattr(window, "group") and window.group is not None:
+            session.restore_window(qtile, window)
+    # Anything that hasn't come back after a minute isn't coming back
+    qtile.call_later(60, session.forget_unmatched, qtile)
+
+
+@hook.subscribe.client_managed
+def session_client_managed(window):
+    session.restore_window(qtile, window)
+    session.changed(qtile, window)
+
+
+@hook.subscribe.client_killed
+def session_client_killed(window):
+    session.removed(qtile, window)
+
+
+@hook.subscribe.client_name_updated
+def session_client_name_updated(window):
+    session.changed(qtile, window)
+
+
+@hook.subscribe.group_window_add
+def session_group_window_add(group, window):
+    session.changed(qtile, window)
+
+
+@hook.subscribe.float_change
+def session_float_change():
+    session.changed(qtile, qtile.current_window)
+
+
+@hook.subscribe.layout_change
+def session_layout_change(layout, group):
+    session.changed(qtile)
+
+
+@hook.subscribe.shutdown
+def save_session():
+    for window in qtile.windows_map.values():
+        if hasattr(window, "group"):
+            session.dirty.add(window)
+    session.flush(qtile)
+
+
 # Settings that work, but we don't need anymore
 #
 # def task_list_fix(text):
@@ -0,0 +1,321 @@
+# Bar redraws coalesced to one flush per display frame
+#
+# Widgets draw themselves whenever they update (clock, pollers, Mpris2,
+# TaskList on every window event), and every draw copies the widget into the
+# bar's buffer and hands the buffer to the compositor with its damage. A
+# widget updated several times within a frame is drawn each time, and a
+# widget drawn just before its bar redraws everything is drawn twice.
+#
+# install() points each bar's and widget's draw() at the scheduler instead,
+# keeping the draw it replaces (a decoration's or the widget's own override
+# included):
+#   - widget.draw() marks the widget dirty, bar.draw() marks the whole bar
+#   - at most once per frame interval, flush() draws every dirty widget once,
+#     and redraws dirty bars through the bar's own draw() (a dirty bar
+#     swallows its dirty widgets, it redraws them all anyway)
+#   - widgets a bar gained since (a WidgetBox opening) are taken over after
+#     that bar's next redraw, and on every screen reconfiguration
+#   - on Wayland the bar windows' drawers copy into the window's buffer
+#     without handing it over, and each window's buffer is handed over once
+#     per frame with the rects drawn as its damage; pywlroots has no pixman
+#     union, so rects that join into one (neighbouring widgets) are merged
+#     and each remaining rect goes in as its own damage
+#   - bars finalized by a screen change or a reload are dropped at the next
+#     install or frame, and config.py installs again after every reload
+# stats() reports requests against draws, i.e. how many redraws were merged.
+#
+#     python -m frames.main --bench     # simulated bar, requests vs draws
+
+import asyncio
+import functools
+import time
+
+FULL = object()
+
+
+def _join(a, b):
+    """The rect covering exactly a and b, or None if there is none"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    if (ay, ah) == (by, bh) and ax <= bx + bw and bx <= ax + aw:
+        left = min(ax, bx)
+        return left, ay, max(ax + aw, bx + bw) - left, ah
+    if (ax, aw) == (bx, bw) and ay <= by + bh and by <= ay + ah:
+        top = min(ay, by)
+        return ax, top, aw, max(ay + ah, by + bh) - top
+    if bx <= ax and by <= ay and ax + aw <= bx + bw and ay + ah <= by + bh:
+        return b
+    if ax <= bx and ay <= by and bx + bw <= ax + aw and by + bh <= ay + ah:
+        return a
+    return None
+
+
+def merged(rects):
+    """rects with every pair that joins into one rect replaced by it"""
+    rects = sorted(set(rects))
+    joined = True
+    while joined:
+        joined = False
+        for i, a in enumerate(rects):
+            for j in range(i + 1, len(rects)):
+                union = _join(a, rects[j])
+                if union is not None:
+                    rects[i] = union
+                    del rects[j]
+                    joined = True
+                    break
+            if joined:
+                break
+    return rects
+
+
+@functools.lru_cache(maxsize=None)
+def collecting(drawer_class):
+    """drawer_class, copying into its window but leaving the hand-over to a scheduler"""
+
+    class FrameDrawer(drawer_class):
+        def _draw(
+            self, offsetx=0, offsety=0, width=None, height=None, src_x=0, src_y=0
+        ):
+            if self.scheduler.damage is None:
+                return super()._draw(offsetx, offsety, width, height, src_x, src_y)
+            self.scheduler._copy(self, offsetx, offsety, width, height, src_x, src_y)
+
+    FrameDrawer.__name__ = FrameDrawer.__qualname__ = f"Frame{drawer_class.__name__}"
+    return FrameDrawer
+
+
+class FrameScheduler:
+    def __init__(self, fps=60):
+        self.interval = 1 / fps
+        self.dirty = {}  # bar -> {widget: draw}, or FULL
+        self.bar_draws = {}  # bar -> the draw() it had before install
+        self.redrawing = set()  # bars redrawn through their own draw() this frame
+        self.handle = None
+        self.last_flush = 0
+        self.flushing = False
+        self.wayland = False
+        self.damage = None  # window -> [rects] while a frame is drawn
+        self.requested = 0
+        self.drawn = 0
+        self.flushes = 0
+        self.damage_rects = 0
+        self.damage_pushes = 0
+        self.worst = 0
+
+    def install(self, qtile):
+        """Take over the draws of every bar and widget, again on screen changes"""
+        self.wayland = qtile.core.name == "wayland"
+        self._prune()
+        for screen in qtile.screens:
+            for bar in (screen.top, screen.bottom, screen.left, screen.right):
+                if bar is not None and hasattr(bar, "widgets"):
+                    self._adopt(bar)
+
+    def _prune(self):
+        for bar in [bar for bar in self.bar_draws if bar.window is None]:
+            del self.bar_draws[bar]
+            self.dirty.pop(bar, None)
+
+    def _ours(self, draw):
+        return isinstance(draw, functools.partial) and draw.func == self._request
+
+    def _adopt(self, bar):
+        if not self._ours(bar.draw):
+            self.bar_draws[bar] = bar.draw
+            bar.draw = functools.partial(self._request, bar, None, None)
+        self._collect(getattr(bar, "drawer", None))
+        for widget in bar.widgets:
+            if not self._ours(widget.draw):
+                widget.draw = functools.partial(self._request, bar, widget, widget.draw)
+            self._collect(getattr(widget, "drawer", None))
+
+    def _collect(self, drawer):
+        if not self.wayland or drawer is None:
+            return
+        if not hasattr(drawer, "scheduler"):
+            # A subclass with the same layout, only _draw differs
+            drawer.__class__ = collecting(type(drawer))
+        drawer.scheduler = self
+
+    def _request(self, bar, widget, draw):
+        if widget is not None and (self.flushing or bar in self.redrawing):
+            # Drawn as part of this frame, or the bar redrawing its widgets
+            draw()
+            return
+        if widget is None and bar in self.redrawing:
+            return  # Its redraw is already queued
+        self.requested += 1
+        if widget is None:
+            self.dirty[bar] = FULL
+        else:
+            pending = self.dirty.setdefault(bar, {})
+            if pending is not FULL:
+                pending[widget] = draw
+        if self.handle is None:
+            loop = asyncio.get_running_loop()
+            due = max(loop.time(), self.last_flush + self.interval)
+            self.handle = loop.call_at(due, self.flush)
+
+    def flush(self):
+        self.handle = None
+        loop = asyncio.get_running_loop()
+        self.last_flush = loop.time()
+        dirty, self.dirty = self.dirty, {}
+        start = time.perf_counter_ns()
+        self.flushing = True
+        self.damage = {} if self.wayland else None
+        try:
+            for bar, widgets in dirty.items():
+                if bar.window is None:
+                    continue  # finalized by a screen change
+                if widgets is FULL:
+                    self.redrawing.add(bar)
+                    self.bar_draws[bar]()
+                    self.drawn += 1
+                    continue
+                for widget, draw in widgets.items():
+                    if widget.configured and not widget.finalized:
+                        draw()
+                        self.drawn += 1
+        finally:
+            self.flushing = False
+            if self.redrawing:
+                # Bar.draw() queues the redraw with call_soon, end the frame
+                # behind it
+                loop.call_soon(self._end_frame, start)
+            else:
+                self._end_frame(start)
+
+    def _end_frame(self, start):
+        try:
+            for bar in self.redrawing:
+                if bar.window is not None:
+                    self._adopt(bar)
+            self._prune()
+            self._push_damage()
+        finally:
+            self.redrawing.clear()
+            self.damage = None
+        self.flushes += 1
+        self.worst = max(self.worst, time.perf_counter_ns() - start)
+
+    # Wayland: keep each bar window's damage, hand the buffer over once
+    def _copy(self, drawer, offsetx, offsety, width, height, src_x, src_y):
+        # The first half of the Wayland drawer's _draw, the damage is kept
+        import cairocffi
+
+        win = drawer._win
+        if offsetx > win.width:
+            return
+        width = min(drawer.width if width is None else width, win.width - offsetx)
+        height = min(drawer.height if height is None else height, win.height - offsety)
+        with cairocffi.Context(win.surface) as context:
+            context.set_operator(cairocffi.OPERATOR_SOURCE)
+            context.set_source_surface(drawer.surface, offsetx - src_x, offsety - src_y)
+            context.rectangle(offsetx, offsety, width, height)
+            context.fill()
+        self.damage.setdefault(win, []).append((offsetx, offsety, width, height))
+
+    def _push_damage(self):
+        if not self.damage:
+            return
+        from wlroots.util.region import PixmanRegion32
+
+        for win, rects in self.damage.items():
+            self.damage_rects += len(rects)
+            # The first hand-over swaps the buffer in, the rest only add damage
+            for rect in merged(rects):
+                with PixmanRegion32() as damage:
+                    damage.init_rect(*rect)
+                    win._scene_buffer.set_buffer_with_damage(win.wlr_buffer, damage)
+                self.damage_pushes += 1
+
+    def stats(self):
+        merged = self.requested - self.drawn
+        share = merged / self.requested if self.requested else 0
+        return (
+            f"{self.requested} draws requested, {self.drawn} done in {self.flushes} frames, "
+            f"{merged} merged ({share:.0%}), worst frame {self.worst / 1000:.0f} µs\n"
+            f"{self.damage_rects} damaged rects pushed as {self.damage_pushes} after merging"
+        )
+
+
+def bench(seconds, fps):
+    """A bar of stand-in widgets updating the way a busy session's do"""
+    import random
+
+    class Widget:
+        configured, finalized = True, False
+
+        def __init__(self, bar):
+            self.bar = bar
+
+        def draw(self):
+            self.bar.widget_draws += 1
+
+    class Bar:
+        window = object()
+
+        def __init__(self, count):
+            self.widget_draws = 0
+            self.widgets = [Widget(self) for _ in range(count)]
+
+        def draw(self):
+            asyncio.get_running_loop().call_soon(self._actual_draw)
+
+        def _actual_draw(self):
+            for widget in self.widgets:
+                widget.draw()
+
+    class Screen:
+        def __init__(self, bar):
+            self.top, self.bottom, self.left, self.right = bar, None, None, None
+
+    async def run(scheduled):
+        bar = Bar(20)
+        clock, cpu, net, tasklist, groupbox = bar.widgets[:5]
+        if scheduled is not None:
+            qtile = type("Qtile", (), {"screens": [Screen(bar)]})()
+            qtile.core = type("Core", (), {"name": "bench"})()
+            scheduled.install(qtile)
+        rng = random.Random(0)
+        loop = asyncio.get_running_loop()
+        end = loop.time() + seconds
+        tick = 0
+        while loop.time() < end:
+            tick += 1
+            if tick % 100 == 0:
+                clock.draw()
+            if tick % 10 == 0:
+                cpu.draw()
+                net.draw()
+            if rng.random() < 0.2:
+                # A window event: TaskList and GroupBox redraw, a few times over
+                for _ in range(rng.randint(1, 4)):
+                    tasklist.draw()
+                    groupbox.draw()
+                if rng.random() < 0.1:
+                    bar.draw()  # a widget changed width
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        return bar.widget_draws
+
+    plain = asyncio.run(run(None))
+    scheduler = FrameScheduler(fps)
+    scheduled = asyncio.run(run(scheduler))
+    print(f"{seconds} s of updates, a 20 widget bar, {fps} fps")
+    print(f"widget draws without the scheduler: {plain}")
+    print(f"widget draws with it:               {scheduled}")
+    print(scheduler.stats())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bar redraw scheduling")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--fps", type=int, default=60)
+    args = parser.parse_args()
+    bench(args.seconds, args.fps)
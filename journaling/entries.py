@@ -0,0 +1,325 @@
+# Journal entry log with a full-text index
+#
+# Entries are appended to a single log file, each one framed as
+#     length (u32) | crc32 (u32) | json {"ts", "type", "text"}
+# and fsynced before the append returns. On open, a torn or corrupt tail
+# left by a crash is cut off, so the log only ever holds whole entries.
+#
+# An inverted index (term -> entry ids), plus per-type postings and entry
+# timestamps, is kept in a sidecar file together with the log size it covers.
+# Opening the store loads the sidecar and only indexes entries appended since,
+# so queries stay in the millisecond range however many years of entries
+# there are.
+#
+#     python -m journaling.entries write VENT
+#     python -m journaling.entries search anxious meeting --since 2025-01-01
+
+import argparse
+import bisect
+import contextlib
+import fcntl
+import json
+import os
+import pickle
+import re
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+
+FRAME = struct.Struct("<II")
+INDEX_VERSION = 1
+TOKEN = re.compile(r"\w+")
+
+DATA_DIR = os.path.expanduser("~/.local/share/journal")
+
+# Everything up to and including this line is the prompt, not the entry
+TEMPLATE_END = (
+    "<!-- journal: write below this line, it and the prompt above are not saved -->"
+)
+
+
+def tokenize(text):
+    return set(TOKEN.findall(text.lower()))
+
+
+@dataclass
+class Entry:
+    id: int
+    timestamp: float
+    type: str
+    text: str
+
+    @property
+    def date(self):
+        return datetime.fromtimestamp(self.timestamp)
+
+
+class EntryStore:
+    def __init__(self, directory=DATA_DIR, save_every=20):
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, "entries.log")
+        self.index_path = os.path.join(directory, "entries.idx")
+        self.save_every = save_every
+        self.fd = os.open(self.log_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+        self._reset()
+        self._load_index()
+        # Catching up can cut off a torn tail, not while someone is appending
+        with self._locked():
+            self._catch_up()
+        if self.unsaved:
+            self.save_index()
+
+    def _reset(self):
+        self.offsets = array("Q")
+        self.timestamps = array("d")
+        self.terms = {}
+        self.by_type = {}
+        self.covered = 0
+        self.unsaved = 0
+
+    # Index persistence
+    def _load_index(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return
+        if state.get("version") != INDEX_VERSION:
+            return
+        if state["covered"] > os.fstat(self.fd).st_size:
+            return  # Log was truncated or replaced, rebuild from scratch
+        self.offsets = state["offsets"]
+        self.timestamps = state["timestamps"]
+        self.terms = state["terms"]
+        self.by_type = state["by_type"]
+        self.covered = state["covered"]
+
+    def save_index(self):
+        state = {
+            "version": INDEX_VERSION,
+            "covered": self.covered,
+            "offsets": self.offsets,
+            "timestamps": self.timestamps,
+            "terms": self.terms,
+            "by_type": self.by_type,
+        }
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.index_path)
+        self.unsaved = 0
+
+    # Log
+    @contextlib.contextmanager
+    def _locked(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _frames(self, start):
+        """Yield (offset, payload) for every whole, valid record after start"""
+        size = os.fstat(self.fd).st_size
+        offset = start
+        while offset + FRAME.size <= size:
+            length, crc = FRAME.unpack(os.pread(self.fd, FRAME.size, offset))
+            end = offset + FRAME.size + length
+            if end > size:
+                break
+            payload = os.pread(self.fd, length, offset + FRAME.size)
+            if zlib.crc32(payload) != crc:
+                break
+            yield offset, payload
+            offset = end
+        self._valid_end = offset
+
+    def _catch_up(self):
+        for offset, payload in self._frames(self.covered):
+            self._index(offset, json.loads(payload))
+        if self._valid_end < os.fstat(self.fd).st_size:
+            # Partial write from a crash, drop it
+            os.ftruncate(self.fd, self._valid_end)
+        self.covered = self._valid_end
+
+    def _index(self, offset, record):
+        entry_id = len(self.offsets)
+        self.offsets.append(offset)
+        self.timestamps.append(record["ts"])
+        self.by_type.setdefault(record["type"], array("I")).append(entry_id)
+        for term in tokenize(record["text"]):
+            self.terms.setdefault(term, array("I")).append(entry_id)
+        self.unsaved += 1
+        return entry_id
+
+    def append(self, prompt_type, text, timestamp=None):
+        # Keep timestamps non-decreasing so date ranges can be bisected
+        ts = max(
+            timestamp or time.time(), self.timestamps[-1] if self.timestamps else 0
+        )
+        payload = json.dumps({"ts": ts, "type": prompt_type, "text": text}).encode()
+        with self._locked():
+            # Another writer may have appended since we last looked
+            self._catch_up()
+            offset = os.fstat(self.fd).st_size
+            os.write(self.fd, FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            os.fsync(self.fd)
+        entry_id = self._index(offset, json.loads(payload))
+        self.covered = offset + FRAME.size + len(payload)
+        if self.unsaved >= self.save_every:
+            self.save_index()
+        return entry_id
+
+    def get(self, entry_id):
+        offset = self.offsets[entry_id]
+        length, _ = FRAME.unpack(os.pread(self.fd, FRAME.size, offset))
+        record = json.loads(os.pread(self.fd, length, offset + FRAME.size))
+        return Entry(entry_id, record["ts"], record["type"], record["text"])
+
+    # Queries
+    def search(self, text=None, since=None, until=None, prompt_type=None, limit=50):
+        """Newest first entries matching every word in text, within the range"""
+        lo = 0 if since is None else bisect.bisect_left(self.timestamps, _ts(since))
+        hi = (
+            len(self.offsets)
+            if until is None
+            else bisect.bisect_right(self.timestamps, _ts(until))
+        )
+        if lo >= hi:
+            return []
+
+        postings = []
+        for term in tokenize(text or ""):
+            posting = self.terms.get(term)
+            if posting is None:
+                return []
+            postings.append(posting)
+        if prompt_type is not None:
+            if prompt_type not in self.by_type:
+                return []
+            postings.append(self.by_type[prompt_type])
+
+        if not postings:
+            ids = range(hi - 1, lo - 1, -1)
+        else:
+            postings.sort(key=len)
+            candidates = postings[0]
+            start = bisect.bisect_left(candidates, lo)
+            end = bisect.bisect_left(candidates, hi)
+            others = postings[1:]
+            ids = (
+                i
+                for i in reversed(candidates[start:end])
+                if all(_contains(other, i) for other in others)
+            )
+
+        results = []
+        for i in ids:
+            results.append(self.get(i))
+            if len(results) >= limit:
+                break
+        return results
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        if self.unsaved:
+            self.save_index()
+        os.close(self.fd)
+
+
+def _contains(posting, entry_id):
+    i = bisect.bisect_left(posting, entry_id)
+    return i < len(posting) and posting[i] == entry_id
+
+
+def _ts(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return value
+
+
+def strip_template(text):
+    """The entry written below the template, all of it if the marker was deleted"""
+    _, marker, after = text.partition(TEMPLATE_END + "\n")
+    return (after if marker else text).strip()
+
+
+def write(prompt_type, prompt=None):
+    """Open $EDITOR with the prompt, and store whatever gets written
+
+    Without a prompt, the first one of the type is shown.
+    """
+    if prompt is None:
+        from journaling.store import PromptStore
+
+        import journaling.main as journal
+
+        store = PromptStore(journal.PROMPT_DIR, journal.PROMPT_CACHE)
+        prompt = next(
+            (
+                store.read(i)
+                for i in range(len(store))
+                if store.prompt_type(i) == prompt_type
+            ),
+            "",
+        )
+    with tempfile.NamedTemporaryFile("w+", suffix=".md", delete=False) as f:
+        f.write("".join(f"# {line}\n" for line in prompt.strip().splitlines()))
+        f.write(TEMPLATE_END + "\n\n")
+        path = f.name
+    try:
+        subprocess.run([os.environ.get("EDITOR", "nvim"), path])
+        with open(path) as f:
+            text = strip_template(f.read())
+    finally:
+        os.unlink(path)
+    if not text:
+        print("Nothing written, not saving")
+        return
+    entries = EntryStore()
+    entries.append(prompt_type, text)
+    entries.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Journal entries")
+    commands = parser.add_subparsers(dest="command", required=True)
+    write_cmd = commands.add_parser("write", help="write an entry for a prompt type")
+    write_cmd.add_argument("type")
+    write_cmd.add_argument("--prompt", help="the prompt text, as shown")
+    search_cmd = commands.add_parser("search", help="search entries")
+    search_cmd.add_argument("words", nargs="*")
+    search_cmd.add_argument("--since")
+    search_cmd.add_argument("--until")
+    search_cmd.add_argument("--type")
+    search_cmd.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "write":
+        write(args.type.upper(), args.prompt)
+        sys.exit()
+
+    entries = EntryStore()
+    start = time.perf_counter()
+    results = entries.search(
+        " ".join(args.words),
+        args.since,
+        args.until,
+        args.type and args.type.upper(),
+        args.limit,
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    for entry in results:
+        print(f"{entry.date:%Y-%m-%d %H:%M} {entry.type}\n{entry.text}\n")
+    print(f"{len(results)} of {len(entries)} entries in {elapsed:.1f} ms")
+    entries.close()
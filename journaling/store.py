@@ -0,0 +1,204 @@
+# Journal prompt store
+#
+# Prompts live in text files under journaling/prompts/, one file per prompt
+# type (vent.txt -> VENT). A file can hold any number of prompts separated
+# by a line with a single "%", like fortune(6). "% 3" gives the prompt that
+# follows it three times the default weight.
+#
+# The directory is scanned once into an offset index (file, offset, length,
+# weight per prompt) that is cached on disk and only rebuilt when a file's
+# size or mtime changes. Picking a prompt is a bisect over the cumulative
+# weights plus a single seek and read, so it costs the same for five prompts
+# or fifty thousand.
+#
+#     python -m journaling.store --bench
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from array import array
+from collections import deque
+
+SEPARATOR = b"%"
+
+
+def scan(path):
+    """Return [(offset, length, weight)] for every prompt in a prompt file"""
+    prompts = []
+    offset, start, weight = 0, 0, 1
+    with open(path, "rb") as f:
+        for line in f:
+            # "%" or "% 3" alone on the line, not a prompt that opens with "% "
+            stripped = line.rstrip()
+            rest = stripped[1:].strip()
+            if stripped == SEPARATOR or (
+                stripped.startswith(SEPARATOR + b" ") and rest.isdigit()
+            ):
+                if offset > start:
+                    prompts.append((start, offset - start, weight))
+                weight = int(rest) if rest else 1
+                start = offset + len(line)
+            offset += len(line)
+    if offset > start:
+        prompts.append((start, offset - start, weight))
+    return prompts
+
+
+class PromptStore:
+    def __init__(self, directory, cache=None, recent=3, rng=None):
+        self.directory = directory
+        self.cache = cache
+        self.rng = rng or random.Random()
+        self.files = []
+        self.file_ids = array("H")
+        self.offsets = array("Q")
+        self.lengths = array("I")
+        self.weights = array("I")
+        self.cumulative = []
+        self.recent = deque(maxlen=recent)
+        self.load()
+
+    # Index
+    def signature(self):
+        sig = []
+        for entry in sorted(os.scandir(self.directory), key=lambda e: e.name):
+            if entry.is_file() and entry.name.endswith(".txt"):
+                st = entry.stat()
+                sig.append([entry.name, st.st_size, st.st_mtime_ns])
+        return sig
+
+    def load(self):
+        signature = self.signature()
+        if not (self.cache and self._read_cache(signature)):
+            self._build(signature)
+            if self.cache:
+                self._write_cache(signature)
+        self.cumulative = list(itertools.accumulate(self.weights))
+
+    def _build(self, signature):
+        self.files = [name for name, _, _ in signature]
+        self.file_ids, self.offsets = array("H"), array("Q")
+        self.lengths, self.weights = array("I"), array("I")
+        for file_id, name in enumerate(self.files):
+            for offset, length, weight in scan(os.path.join(self.directory, name)):
+                self.file_ids.append(file_id)
+                self.offsets.append(offset)
+                self.lengths.append(length)
+                self.weights.append(weight)
+
+    def _read_cache(self, signature):
+        try:
+            with open(self.cache, "rb") as f:
+                header = json.loads(f.readline())
+                if header["signature"] != signature:
+                    return False
+                count = header["count"]
+                arrays = (array("H"), array("Q"), array("I"), array("I"))
+                for a in arrays:
+                    a.fromfile(f, count)
+        except (OSError, ValueError, KeyError, EOFError):
+            return False
+        self.files = [name for name, _, _ in signature]
+        self.file_ids, self.offsets, self.lengths, self.weights = arrays
+        return True
+
+    def _write_cache(self, signature):
+        os.makedirs(os.path.dirname(self.cache), exist_ok=True)
+        tmp = self.cache + ".tmp"
+        with open(tmp, "wb") as f:
+            header = {"signature": signature, "count": len(self.offsets)}
+            f.write(json.dumps(header).encode() + b"\n")
+            for a in (self.file_ids, self.offsets, self.lengths, self.weights):
+                a.tofile(f)
+        os.replace(tmp, self.cache)
+
+    # Lookup
+    def __len__(self):
+        return len(self.offsets)
+
+    def prompt_type(self, index):
+        return os.path.splitext(self.files[self.file_ids[index]])[0].upper()
+
+    def types(self):
+        return [os.path.splitext(name)[0].upper() for name in self.files]
+
+    def read(self, index):
+        path = os.path.join(self.directory, self.files[self.file_ids[index]])
+        with open(path, "rb") as f:
+            f.seek(self.offsets[index])
+            return f.read(self.lengths[index]).decode().strip("\n")
+
+    def pick(self):
+        """Weighted random index, skipping the last few prompts shown
+
+        None if there are no prompts at all.
+        """
+        if not self.cumulative:
+            return None
+        total = self.cumulative[-1]
+        index = 0
+        for _ in range(8):
+            index = bisect.bisect_right(self.cumulative, self.rng.random() * total)
+            if index not in self.recent:
+                break
+        self.recent.append(index)
+        return index
+
+    def sample(self):
+        index = self.pick()
+        return "" if index is None else self.read(index)
+
+
+def _corpus(directory, count, files=5):
+    for f in range(files):
+        with open(os.path.join(directory, f"type{f}.txt"), "w") as out:
+            for i in range(f, count, files):
+                out.write(f"% {1 + i % 3}\nPROMPT {i}\n\n" + "Write about it.\n" * 5)
+
+
+def bench(sizes=(5, 100, 1000, 10000, 100000), calls=2000):
+    print(f"{'prompts':>8}{'build ms':>10}{'load ms':>10}{'mean µs':>10}{'p99 µs':>10}")
+    for size in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            _corpus(directory, size)
+            cache = os.path.join(directory, "cache", "prompts.idx")
+            start = time.perf_counter()
+            PromptStore(directory, cache)
+            build = time.perf_counter() - start
+            start = time.perf_counter()
+            store = PromptStore(directory, cache, rng=random.Random(0))
+            load = time.perf_counter() - start
+
+            latencies = []
+            for _ in range(calls):
+                t = time.perf_counter_ns()
+                store.sample()
+                latencies.append(time.perf_counter_ns() - t)
+            latencies.sort()
+            print(
+                f"{len(store):>8}{build * 1000:>10.1f}{load * 1000:>10.1f}"
+                f"{statistics.fmean(latencies) / 1000:>10.1f}"
+                f"{latencies[int(len(latencies) * 0.99)] / 1000:>10.1f}"
+            )
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Journal prompt store")
+    parser.add_argument(
+        "--bench", action="store_true", help="time sampling as the corpus grows"
+    )
+    args = parser.parse_args()
+    if args.bench:
+        bench()
+    else:
+        print(PromptStore(os.path.join(os.path.dirname(__file__), "prompts")).sample())
@@ -0,0 +1,355 @@
+# App launcher backend, replacing applauncher.sh and the spawncmd prompt
+#
+# Desktop entries and $PATH executables are indexed per directory and the
+# index is saved between sessions. A directory is only rescanned when its
+# mtime changes at startup or inotify reports a change in it, so opening the
+# launcher never touches the disk. Results are ranked by frecency: every
+# launch adds 1 to an item's score, and scores halve every week.
+#
+#     python -m launcher.main
+
+import asyncio
+import json
+import os
+import pickle
+import re
+import shlex
+import time
+
+from libqtile.log_utils import logger
+from libqtile.utils import create_task
+
+import watcher.main as watcher
+from pickers.main import rofi
+
+INDEX_VERSION = 2
+HALF_LIFE = 7 * 24 * 3600
+FIELD_CODE = re.compile(r"%(.)")
+# Files, URLs and deprecated codes: nothing to pass, the argument goes
+FILE_CODES = set("fFuUdDnNvm")
+
+
+def application_dirs():
+    data_home = os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
+    data_dirs = os.environ.get("XDG_DATA_DIRS", "/usr/local/share:/usr/share").split(
+        ":"
+    )
+    dirs = [data_home, *data_dirs, "/var/lib/flatpak/exports/share"]
+    seen, result = set(), []
+    for d in dirs:
+        path = os.path.join(d, "applications")
+        if d and path not in seen:
+            seen.add(path)
+            result.append(path)
+    return result
+
+
+def path_dirs():
+    return list(dict.fromkeys(d for d in os.environ.get("PATH", "").split(":") if d))
+
+
+def parse_desktop_entry(path):
+    """Return {name, exec, icon, terminal} or None for hidden/non-app entries"""
+    fields, in_entry = {}, False
+    try:
+        with open(path, errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    if in_entry:
+                        break
+                    in_entry = line == "[Desktop Entry]"
+                elif in_entry and "=" in line:
+                    key, value = line.split("=", 1)
+                    fields.setdefault(key.strip(), value.strip())
+    except OSError:
+        return None
+    if fields.get("Type", "Application") != "Application" or "Exec" not in fields:
+        return None
+    if fields.get("NoDisplay") == "true" or fields.get("Hidden") == "true":
+        return None
+    name = fields.get("Name", os.path.basename(path))
+    icon = fields.get("Icon", "")
+    argv = parse_exec(fields["Exec"], name, icon, path)
+    if not argv:
+        return None
+    return {
+        "name": name,
+        "exec": argv,
+        "icon": icon,
+        "terminal": fields.get("Terminal") == "true",
+    }
+
+
+def parse_exec(value, name, icon, path):
+    """argv for an Exec= line, launched with no files or URLs
+
+    %c and %k become the name and the desktop file, %i the icon option and %%
+    a literal %. An argument holding a file or URL code is dropped, alone or
+    not (--file=%f).
+    """
+    try:
+        tokens = shlex.split(value)
+    except ValueError:
+        return None
+    argv = []
+    for token in tokens:
+        if token == "%i":
+            if icon:
+                argv += ["--icon", icon]
+            continue
+        if FILE_CODES.intersection(FIELD_CODE.findall(token)):
+            continue
+        codes = {"%": "%", "c": name, "k": path}
+        argv.append(FIELD_CODE.sub(lambda m: codes.get(m[1], ""), token))
+    return argv
+
+
+def scan_applications(directory):
+    entries = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".desktop"):
+                # Desktop file ids are relative paths with / replaced by -
+                desktop_id = os.path.relpath(
+                    os.path.join(root, name), directory
+                ).replace("/", "-")
+                entry = parse_desktop_entry(os.path.join(root, name))
+                entries[desktop_id] = entry
+    return entries
+
+
+def scan_executables(directory):
+    found = set()
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() and os.access(entry.path, os.X_OK):
+                        found.add(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return found
+
+
+def mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class LauncherIndex:
+    def __init__(self, cache, frecency_path):
+        self.cache = cache
+        self.frecency_path = frecency_path
+        self.app_dirs = {}  # dir -> (mtime, {desktop id: entry})
+        self.bin_dirs = {}  # dir -> (mtime, {names})
+        self.frecency = {}  # key -> [score, last used]
+        self._ranked = {}
+
+    # Index
+    def load(self):
+        try:
+            with open(self.cache, "rb") as f:
+                state = pickle.load(f)
+            if state["version"] == INDEX_VERSION:
+                self.app_dirs, self.bin_dirs = state["app_dirs"], state["bin_dirs"]
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, ValueError):
+            pass
+        try:
+            with open(self.frecency_path) as f:
+                self.frecency = json.load(f)
+        except (OSError, ValueError):
+            pass
+        self.refresh()
+
+    def refresh(self):
+        """Rescan only the directories whose mtime changed"""
+        changed = False
+        for dirs, known in (
+            (application_dirs(), self.app_dirs),
+            (path_dirs(), self.bin_dirs),
+        ):
+            for directory in dirs:
+                if directory not in known or known[directory][0] != mtime(directory):
+                    self.rescan(directory)
+                    changed = True
+        if changed:
+            self.save()
+
+    def rescan(self, directory):
+        if directory in application_dirs():
+            self.app_dirs[directory] = (mtime(directory), scan_applications(directory))
+        else:
+            self.bin_dirs[directory] = (mtime(directory), scan_executables(directory))
+        self._ranked.clear()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache), exist_ok=True)
+        tmp = self.cache + ".tmp"
+        with open(tmp, "wb") as f:
+            state = {
+                "version": INDEX_VERSION,
+                "app_dirs": self.app_dirs,
+                "bin_dirs": self.bin_dirs,
+            }
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.cache)
+
+    def applications(self):
+        # Earlier directories override later ones for the same desktop id
+        merged = {}
+        for directory in reversed(application_dirs()):
+            merged.update(self.app_dirs.get(directory, (None, {}))[1])
+        return {f"app:{k}": v for k, v in merged.items() if v is not None}
+
+    def executables(self):
+        names = set()
+        for directory in path_dirs():
+            names |= self.bin_dirs.get(directory, (None, set()))[1]
+        return names
+
+    # Frecency
+    def score(self, key, now):
+        score, last = self.frecency.get(key, (0, now))
+        return score * 0.5 ** ((now - last) / HALF_LIFE)
+
+    def used(self, key):
+        now = time.time()
+        self.frecency[key] = [self.score(key, now) + 1, now]
+        self._ranked.clear()
+        os.makedirs(os.path.dirname(self.frecency_path), exist_ok=True)
+        tmp = self.frecency_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.frecency, f)
+        os.replace(tmp, self.frecency_path)
+
+    def ranked(self, kind):
+        """[(key, label, entry)] sorted by frecency, then name; cached"""
+        if kind not in self._ranked:
+            now = time.time()
+            if kind == "apps":
+                items = [(k, e["name"], e) for k, e in self.applications().items()]
+            else:
+                items = [(f"bin:{n}", n, None) for n in self.executables()]
+            items.sort(key=lambda i: (-self.score(i[0], now), i[1].lower()))
+            self._ranked[kind] = items
+        return self._ranked[kind]
+
+
+class Launcher:
+    """Serves the launcher pickers from a LauncherIndex kept fresh by inotify"""
+
+    def __init__(self, terminal, cache, frecency_path, procs):
+        self.terminal = terminal
+        self.index = LauncherIndex(cache, frecency_path)
+        self.procs = procs
+        self.watcher = None
+        self._loading = None
+
+    def start(self, qtile):
+        self.qtile = qtile
+        self.watcher = watcher.Watcher()
+        for directory in application_dirs() + path_dirs():
+            if os.path.isdir(directory):
+                self.watcher.add(directory)
+        asyncio.get_running_loop().add_reader(self.watcher.fd, self._on_events)
+        # A cold index walks every application and $PATH directory, load it
+        # off the event loop and swap it in; directories changed meanwhile are
+        # rescanned after
+        self._loading = set()
+        future = qtile.run_in_executor(
+            self._load, self.index.cache, self.index.frecency_path
+        )
+        future.add_done_callback(self._loaded)
+
+    @staticmethod
+    def _load(cache, frecency_path):
+        index = LauncherIndex(cache, frecency_path)
+        index.load()
+        return index
+
+    def _loaded(self, future):
+        changed, self._loading = self._loading, None
+        try:
+            self.index = future.result()
+        except Exception:
+            logger.exception(
+                "launcher: loading the index failed, rescanning everything"
+            )
+            changed = set(self.watcher.watches)
+        self._rescan(changed)
+
+    def _on_events(self):
+        directories, overflow = set(), False
+        for path, _ in self.watcher.read():
+            if path is None:
+                overflow = True
+            else:
+                directories.add(os.path.dirname(path))
+        if self._loading is not None:
+            self._loading |= set(self.watcher.watches) if overflow else directories
+        elif overflow:
+            self.index.refresh()
+        else:
+            self._rescan(directories)
+
+    def _rescan(self, directories):
+        directories &= set(self.watcher.watches)
+        for directory in directories:
+            self.index.rescan(directory)
+        if directories:
+            self.index.save()
+
+    def _launch(self, key, command, terminal=False):
+        """command is an argv, or a command line typed at the Run prompt"""
+        self.index.used(key)
+        if terminal:
+            command = [self.terminal, "-e", *command]
+        self.procs.spawn(command)
+
+    async def _pick_app(self):
+        items = self.index.ranked("apps")
+        lines = [f"{label}\0icon\x1f{entry['icon']}" for _, label, entry in items]
+        choice = await rofi(lines, "Apps", "-show-icons", "-format", "i")
+        if choice.isdigit():
+            key, _, entry = items[int(choice)]
+            self._launch(key, entry["exec"], entry["terminal"])
+
+    async def _pick_command(self):
+        items = self.index.ranked("bin")
+        command = await rofi([label for _, label, _ in items], "Run")
+        if command:
+            self._launch(f"bin:{command.split()[0]}", command)
+
+    def pick_app(self, qtile):
+        create_task(self._pick_app())
+
+    def pick_command(self, qtile):
+        create_task(self._pick_command())
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    index = LauncherIndex(os.path.join(tmp, "idx"), os.path.join(tmp, "frecency.json"))
+    start = time.perf_counter()
+    index.load()
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    index = LauncherIndex(os.path.join(tmp, "idx"), os.path.join(tmp, "frecency.json"))
+    index.load()
+    warm = time.perf_counter() - start
+    start = time.perf_counter()
+    apps, bins = index.ranked("apps"), index.ranked("bin")
+    rank = time.perf_counter() - start
+    start = time.perf_counter()
+    index.ranked("apps"), index.ranked("bin")
+    served = time.perf_counter() - start
+    print(f"{len(apps)} apps, {len(bins)} executables")
+    print(f"cold index {cold * 1000:.1f} ms, warm load {warm * 1000:.1f} ms")
+    print(f"first ranking {rank * 1000:.1f} ms, cached open {served * 1e6:.0f} µs")
@@ -0,0 +1,308 @@
+# Power, Bluetooth and audio output menus, replacing powermenu.sh,
+# bluetooth.sh and sound-output.sh
+#
+# Each menu is backed by state that lives in the qtile process and is kept
+# current by signals, so opening a menu only lays out a popup:
+#   - logind's Can* answers are read once at startup
+#   - BlueZ objects are read once with GetManagedObjects, then followed with
+#     InterfacesAdded/InterfacesRemoved/PropertiesChanged
+#   - PipeWire has no D-Bus API for sinks, so sinks are read with pactl and
+#     re-read whenever a long-lived `pactl subscribe` reports a sink change;
+#     it is started again if it exits (say, the audio server restarted)
+#
+# D-Bus traffic goes through a lease on the shared buses.BusPool. The popups
+# use qtile_extras' popup toolkit, imported on first use.
+
+import asyncio
+import json
+
+from dbus_fast import Message, MessageType, Variant
+from libqtile.log_utils import logger
+from libqtile.utils import create_task
+
+LOGIND = "org.freedesktop.login1"
+LOGIND_PATH = "/org/freedesktop/login1"
+LOGIND_MANAGER = "org.freedesktop.login1.Manager"
+BLUEZ = "org.bluez"
+BLUEZ_ADAPTER = "org.bluez.Adapter1"
+BLUEZ_DEVICE = "org.bluez.Device1"
+OBJECT_MANAGER = "org.freedesktop.DBus.ObjectManager"
+PROPERTIES = "org.freedesktop.DBus.Properties"
+PACTL_RESTART_DELAY = 5
+
+
+def _plain(props):
+    return {k: v.value if isinstance(v, Variant) else v for k, v in props.items()}
+
+
+async def call(bus, destination, path, interface, member, signature="", body=()):
+    reply = await bus.call(
+        Message(
+            destination=destination,
+            path=path,
+            interface=interface,
+            member=member,
+            signature=signature,
+            body=list(body),
+        )
+    )
+    if reply.message_type == MessageType.ERROR:
+        raise RuntimeError(f"{member}: {reply.error_name} {reply.body}")
+    return reply.body
+
+
+async def add_match(bus, rule):
+    await call(
+        bus,
+        "org.freedesktop.DBus",
+        "/org/freedesktop/DBus",
+        "org.freedesktop.DBus",
+        "AddMatch",
+        "s",
+        [rule],
+    )
+
+
+class Power:
+    ACTIONS = [
+        ("PowerOff", "⏻  Shut down"),
+        ("Reboot", "  Reboot"),
+        ("Suspend", "󰤄  Suspend"),
+        ("Hibernate", "󰒲  Hibernate"),
+    ]
+
+    def __init__(self):
+        self.bus = None
+        self.available = {}
+
+    async def start(self, bus):
+        self.bus = bus
+        for member, _ in self.ACTIONS:
+            try:
+                (answer,) = await call(
+                    bus, LOGIND, LOGIND_PATH, LOGIND_MANAGER, f"Can{member}"
+                )
+            except RuntimeError:
+                answer = "na"
+            self.available[member] = answer in ("yes", "challenge")
+
+    def run(self, member):
+        create_task(
+            call(self.bus, LOGIND, LOGIND_PATH, LOGIND_MANAGER, member, "b", [True])
+        )
+
+
+class Bluetooth:
+    def __init__(self):
+        self.bus = None
+        self.adapters = {}  # path -> properties
+        self.devices = {}  # path -> properties
+
+    async def start(self, bus):
+        self.bus = bus
+        bus.add_message_handler(self._on_message)
+        await add_match(
+            bus, f"type='signal',sender='{BLUEZ}',interface='{OBJECT_MANAGER}'"
+        )
+        await add_match(bus, f"type='signal',sender='{BLUEZ}',interface='{PROPERTIES}'")
+        (objects,) = await call(bus, BLUEZ, "/", OBJECT_MANAGER, "GetManagedObjects")
+        for path, interfaces in objects.items():
+            self._added(path, interfaces)
+
+    def _added(self, path, interfaces):
+        if BLUEZ_ADAPTER in interfaces:
+            self.adapters[path] = _plain(interfaces[BLUEZ_ADAPTER])
+        if BLUEZ_DEVICE in interfaces:
+            self.devices[path] = _plain(interfaces[BLUEZ_DEVICE])
+
+    def _on_message(self, message):
+        if message.message_type != MessageType.SIGNAL or not message.path:
+            return
+        if message.member == "InterfacesAdded":
+            self._added(*message.body)
+        elif message.member == "InterfacesRemoved":
+            path, interfaces = message.body
+            if BLUEZ_ADAPTER in interfaces:
+                self.adapters.pop(path, None)
+            if BLUEZ_DEVICE in interfaces:
+                self.devices.pop(path, None)
+        elif message.member == "PropertiesChanged" and message.interface == PROPERTIES:
+            interface, changed, _ = message.body
+            target = {BLUEZ_ADAPTER: self.adapters, BLUEZ_DEVICE: self.devices}.get(
+                interface
+            )
+            if target is not None and message.path in target:
+                target[message.path].update(_plain(changed))
+
+    @property
+    def powered(self):
+        return any(a.get("Powered") for a in self.adapters.values())
+
+    def paired(self):
+        devices = [
+            (p, d) for p, d in self.devices.items() if d.get("Paired") and d.get("Name")
+        ]
+        return sorted(
+            devices, key=lambda item: (not item[1].get("Connected"), item[1]["Name"])
+        )
+
+    def toggle_power(self):
+        for path in self.adapters:
+            create_task(
+                call(
+                    self.bus,
+                    BLUEZ,
+                    path,
+                    PROPERTIES,
+                    "Set",
+                    "ssv",
+                    [BLUEZ_ADAPTER, "Powered", Variant("b", not self.powered)],
+                )
+            )
+
+    def toggle_device(self, path):
+        member = "Disconnect" if self.devices[path].get("Connected") else "Connect"
+        create_task(call(self.bus, BLUEZ, path, BLUEZ_DEVICE, member))
+
+
+class Audio:
+    def __init__(self):
+        self.sinks = []
+        self.default = None
+        self._refreshing = None
+
+    async def start(self):
+        await self.refresh()
+        create_task(self._follow())
+
+    @staticmethod
+    async def _pactl(*args):
+        proc = await asyncio.create_subprocess_exec(
+            "pactl",
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        out, _ = await proc.communicate()
+        return out.decode()
+
+    async def refresh(self):
+        sinks = json.loads(await self._pactl("-f", "json", "list", "sinks") or "[]")
+        self.sinks = [(s["name"], s.get("description") or s["name"]) for s in sinks]
+        self.default = (await self._pactl("get-default-sink")).strip()
+
+    async def _follow(self):
+        while True:
+            proc = await asyncio.create_subprocess_exec(
+                "pactl", "subscribe", stdout=asyncio.subprocess.PIPE
+            )
+            async for line in proc.stdout:
+                if b" sink #" in line or b" server" in line:
+                    # Events come in bursts, re-read once per burst
+                    if self._refreshing is None or self._refreshing.done():
+                        self._refreshing = create_task(self.refresh())
+            await proc.wait()
+            logger.info(
+                "menus: pactl subscribe exited (%s), restarting", proc.returncode
+            )
+            await asyncio.sleep(PACTL_RESTART_DELAY)
+            # Whatever changed while nobody was listening
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("menus: reading sinks failed: %s", e)
+
+    def select(self, name):
+        self.default = name
+        create_task(self._pactl("set-default-sink", name))
+
+
+class Menus:
+    """Serves the power, Bluetooth and audio output popups"""
+
+    def __init__(self, pool, procs, lock_command=None, **style):
+        self.pool = pool
+        self.procs = procs
+        self.power = Power()
+        self.bluetooth = Bluetooth()
+        self.audio = Audio()
+        self.lock_command = lock_command
+        self.style = style
+
+    def start(self, qtile):
+        create_task(self._start())
+
+    async def _start(self):
+        system = await self.pool.lease("system", "menus").connect()
+        for name, started in (
+            ("power", self.power.start(system)),
+            ("bluetooth", self.bluetooth.start(system)),
+            ("audio", self.audio.start()),
+        ):
+            try:
+                await started
+            except Exception as e:
+                # A missing service only disables its menu
+                logger.warning("menus: %s unavailable: %s", name, e)
+
+    def _show(self, qtile, entries):
+        """entries: [(text, callback or None)]"""
+        from qtile_extras.popup.toolkit import PopupGridLayout, PopupText
+
+        style = dict(self.style)
+        border = style.pop("border", None)
+        controls = [
+            PopupText(
+                row=row,
+                col=0,
+                text=text,
+                can_focus=callback is not None,
+                h_align="left",
+                mouse_callbacks={"Button1": callback} if callback else {},
+                **style,
+            )
+            for row, (text, callback) in enumerate(entries)
+        ]
+        layout = PopupGridLayout(
+            qtile,
+            rows=len(controls),
+            cols=1,
+            width=320,
+            height=36 * len(controls),
+            border=border,
+            border_width=1,
+            controls=controls,
+            close_on_click=True,
+        )
+        layout.show(relative_to=3, relative_to_bar=True)
+
+    def show_power(self, qtile):
+        entries = []
+        if self.lock_command:
+            entries.append(("  Lock", lambda: self.procs.spawn(self.lock_command)))
+        entries.append(("󰍃  Log out", qtile.shutdown))
+        for member, label in Power.ACTIONS:
+            if self.power.available.get(member):
+                entries.append((label, lambda m=member: self.power.run(m)))
+        self._show(qtile, entries)
+
+    def show_bluetooth(self, qtile):
+        bt = self.bluetooth
+        entries = [("󰂯  Turn off" if bt.powered else "󰂲  Turn on", bt.toggle_power)]
+        if bt.powered:
+            for path, device in bt.paired():
+                symbol = "" if device.get("Connected") else "󰂲"
+                entries.append(
+                    (f"{symbol}  {device['Name']}", lambda p=path: bt.toggle_device(p))
+                )
+        self._show(qtile, entries)
+
+    def show_audio(self, qtile):
+        entries = [
+            (
+                f"{'󰓃' if name == self.audio.default else '  '}  {description}",
+                lambda n=name: self.audio.select(n),
+            )
+            for name, description in self.audio.sinks
+        ]
+        self._show(qtile, entries or [("No outputs", None)])
@@ -0,0 +1,330 @@
+# In-process search over the Obsidian vault, replacing notes.sh/notegrep.sh
+#
+# The vault is indexed once (title, lowercased text and a trigram -> note
+# postings map), persisted between sessions, and kept fresh with inotify.
+# Content queries intersect the postings of the query's trigrams and only
+# substring-check the survivors, so a search takes a few milliseconds
+# instead of a grep over the whole vault.
+#
+#     python -m notes.main ~/Obsidian "some words"
+
+import asyncio
+import os
+import pickle
+import sys
+import time
+import urllib.parse
+
+from libqtile.log_utils import logger
+from libqtile.utils import create_task
+
+import watcher.main as watcher
+from pickers.main import rofi
+
+INDEX_VERSION = 1
+SKIP_DIRS = {".obsidian", ".trash", ".git"}
+
+
+def trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class NoteIndex:
+    def __init__(self, vault, cache=None):
+        self.vault = vault
+        self.cache = cache
+        self.ids = {}  # path -> note id
+        self.notes = {}  # note id -> [path, mtime_ns, title, text]
+        self.postings = {}  # trigram -> set of note ids
+        self.next_id = 0
+        # Bumped on every change; saving runs in a thread, this tells whether
+        # the index changed while it was being written
+        self.version = 0
+        self.saved_version = 0
+
+    @property
+    def dirty(self):
+        return self.version != self.saved_version
+
+    # Building
+    def _add(self, path, mtime_ns, text):
+        self._remove(path)
+        note_id = self.next_id
+        self.next_id += 1
+        title = os.path.splitext(os.path.relpath(path, self.vault))[0]
+        text = text.lower()
+        self.ids[path] = note_id
+        self.notes[note_id] = [path, mtime_ns, title, text]
+        for gram in trigrams(text) | trigrams(title.lower()):
+            self.postings.setdefault(gram, set()).add(note_id)
+        self.version += 1
+
+    def _remove(self, path):
+        note_id = self.ids.pop(path, None)
+        if note_id is None:
+            return
+        _, _, title, text = self.notes.pop(note_id)
+        for gram in trigrams(text) | trigrams(title.lower()):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(note_id)
+                if not posting:
+                    del self.postings[gram]
+        self.version += 1
+
+    def update(self, path):
+        """Re-read one note, or drop it if it's gone"""
+        if not path.endswith(".md"):
+            return
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with open(path, errors="replace") as f:
+                text = f.read()
+        except OSError:
+            self._remove(path)
+            return
+        self._add(path, mtime_ns, text)
+
+    def known(self):
+        return {path: self.notes[note_id][1] for path, note_id in self.ids.items()}
+
+    def scan(self, known=None):
+        """Return (changed paths, removed paths) compared to known mtimes"""
+        known = self.known() if known is None else known
+        seen, changed = set(), []
+        for directory, dirs, files in os.walk(self.vault):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+            for name in files:
+                if not name.endswith(".md"):
+                    continue
+                path = os.path.join(directory, name)
+                seen.add(path)
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                if known.get(path) != mtime_ns:
+                    changed.append(path)
+        return changed, [p for p in known if p not in seen]
+
+    def refresh(self):
+        changed, removed = self.scan()
+        for path in removed:
+            self._remove(path)
+        for path in changed:
+            self.update(path)
+
+    # Persistence
+    def load(self):
+        try:
+            with open(self.cache, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return False
+        if state.get("version") != INDEX_VERSION or state.get("vault") != self.vault:
+            return False
+        self.ids = state["ids"]
+        self.notes = state["notes"]
+        self.postings = state["postings"]
+        self.next_id = state["next_id"]
+        return True
+
+    def save(self):
+        """Write the index out, False if it changed meanwhile and wasn't written"""
+        if not self.cache or not self.dirty:
+            return True
+        version = self.version
+        os.makedirs(os.path.dirname(self.cache), exist_ok=True)
+        state = {
+            "version": INDEX_VERSION,
+            "vault": self.vault,
+            "ids": self.ids,
+            "notes": self.notes,
+            "postings": self.postings,
+            "next_id": self.next_id,
+        }
+        tmp = self.cache + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except RuntimeError:
+            # A dict or set changed size under pickle
+            os.unlink(tmp)
+            return False
+        if self.version != version:
+            # Changed while pickled, the file may hold half of a change
+            os.unlink(tmp)
+            return False
+        os.replace(tmp, self.cache)
+        self.saved_version = version
+        return True
+
+    # Queries
+    def titles(self):
+        """Every note title, most recently modified first"""
+        notes = sorted(self.notes.values(), key=lambda n: -n[1])
+        return [title for _, _, title, _ in notes]
+
+    def path_for_title(self, title):
+        for path, _, note_title, _ in self.notes.values():
+            if note_title == title:
+                return path
+        return None
+
+    def search(self, query, limit=50):
+        """Return [(title, path, snippet)] for notes containing query"""
+        query = query.lower().strip()
+        if not query:
+            return []
+        if len(query) < 3:
+            candidates = self.notes.keys()
+        else:
+            postings = sorted(
+                (self.postings.get(g, set()) for g in trigrams(query)), key=len
+            )
+            candidates = set.intersection(*postings) if postings else set()
+
+        results = []
+        for note_id in candidates:
+            path, mtime_ns, title, text = self.notes[note_id]
+            pos = text.find(query)
+            if pos < 0 and query not in title.lower():
+                continue
+            snippet = ""
+            if pos >= 0:
+                snippet = text[max(0, pos - 30) : pos + len(query) + 50].replace(
+                    "\n", " "
+                )
+            results.append((mtime_ns, title, path, snippet))
+        results.sort(key=lambda r: -r[0])
+        return [(title, path, snippet) for _, title, path, snippet in results[:limit]]
+
+
+class NoteService:
+    """Keeps a NoteIndex fresh inside qtile and serves the pickers"""
+
+    def __init__(self, vault, cache, procs, open_command=None, save_delay=30):
+        self.index = NoteIndex(vault, cache)
+        self.procs = procs
+        self.open_command = open_command or self.open_in_obsidian
+        self.save_delay = save_delay
+        self.watcher = None
+        self._building = None
+        self._save_pending = False
+
+    @staticmethod
+    def open_in_obsidian(path):
+        return ["xdg-open", "obsidian://open?path=" + urllib.parse.quote(path)]
+
+    def start(self, qtile):
+        self.qtile = qtile
+        self.watcher = watcher.Watcher()
+        self.watcher.add_tree(self.index.vault, skip=SKIP_DIRS)
+        asyncio.get_running_loop().add_reader(self.watcher.fd, self._on_events)
+        # Loading the saved index and catching up with edits made while qtile
+        # wasn't running can take a while on a big vault, do it off the event
+        # loop and swap the result in. Events seen meanwhile are replayed.
+        self._building = set()
+        future = qtile.run_in_executor(self._build, self.index.vault, self.index.cache)
+        future.add_done_callback(self._built)
+
+    @staticmethod
+    def _build(vault, cache):
+        index = NoteIndex(vault, cache)
+        index.load()
+        index.refresh()
+        return index
+
+    def _built(self, future):
+        building, self._building = self._building, None
+        try:
+            index = future.result()
+        except Exception:
+            logger.exception(
+                "notes: building the index failed, keeping it up to date from here"
+            )
+            return
+        for path in building:
+            index.update(path)
+        self.index = index
+        self._schedule_save()
+
+    def _on_events(self):
+        events = self.watcher.read()
+        if self._building is not None:
+            self._building.update(path for path, _ in events if path)
+            return
+        for path, mask in events:
+            if path is None:
+                self.index.refresh()
+            elif mask & watcher.IN_ISDIR:
+                if mask & (watcher.IN_CREATE | watcher.IN_MOVED_TO):
+                    self.watcher.add_tree(path, skip=SKIP_DIRS)
+                    self.index.refresh()
+                elif mask & (watcher.IN_DELETE | watcher.IN_MOVED_FROM):
+                    self.watcher.remove(path)
+                    self.index.refresh()
+            else:
+                self.index.update(path)
+        self._schedule_save()
+
+    def _schedule_save(self):
+        if self.index.dirty and not self._save_pending:
+            self._save_pending = True
+            self.qtile.call_later(self.save_delay, self._save)
+
+    def _save(self):
+        self._save_pending = False
+        future = self.qtile.run_in_executor(self.index.save)
+        future.add_done_callback(self._saved)
+
+    def _saved(self, future):
+        if future.exception() is not None:
+            logger.error("notes: saving the index failed: %s", future.exception())
+        # Changed while it was being pickled, try again later
+        self._schedule_save()
+
+    def _open(self, path):
+        self.procs.spawn(self.open_command(path))
+
+    # Pickers
+    async def _pick_title(self):
+        title = await rofi(self.index.titles(), "Notes")
+        path = self.index.path_for_title(title) if title else None
+        if path:
+            self._open(path)
+
+    async def _pick_content(self):
+        query = await rofi([], "Grep notes")
+        if not query:
+            return
+        results = self.index.search(query)
+        lines = [f"{title}  ·  {snippet}" for title, _, snippet in results]
+        choice = await rofi(lines, query, "-format", "i")
+        if choice.isdigit():
+            self._open(results[int(choice)][1])
+
+    def pick_title(self, qtile):
+        create_task(self._pick_title())
+
+    def pick_content(self, qtile):
+        create_task(self._pick_content())
+
+    def stop(self):
+        self.index.save()
+
+
+if __name__ == "__main__":
+    vault, query = sys.argv[1], " ".join(sys.argv[2:])
+    index = NoteIndex(os.path.abspath(os.path.expanduser(vault)))
+    start = time.perf_counter()
+    index.refresh()
+    print(
+        f"indexed {len(index.notes)} notes in {(time.perf_counter() - start) * 1000:.0f} ms"
+    )
+    start = time.perf_counter()
+    results = index.search(query)
+    elapsed = (time.perf_counter() - start) * 1000
+    for title, _, snippet in results:
+        print(f"{title}: {snippet}")
+    print(f"{len(results)} results in {elapsed:.2f} ms")
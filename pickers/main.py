@@ -0,0 +1,22 @@
+# rofi -dmenu pickers, shared by the note search and the app launcher
+#
+# rofi is started straight from the event loop and fed its lines on stdin,
+# nothing is written to disk or run through a shell.
+
+import asyncio
+
+
+async def rofi(lines, prompt, *args):
+    """The line picked (or what rofi's -format gives), "" if cancelled"""
+    proc = await asyncio.create_subprocess_exec(
+        "rofi",
+        "-dmenu",
+        "-i",
+        "-p",
+        prompt,
+        *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    out, _ = await proc.communicate("\n".join(lines).encode())
+    return out.decode().strip() if proc.returncode == 0 else ""
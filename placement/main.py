@@ -0,0 +1,284 @@
+# Declarative placement of new windows
+#
+# Rules say where a window goes when it's first managed: its group, whether
+# it floats (and where), whether it's sticky, and its TreeTab section. They
+# are compiled once:
+#   - rules naming a wm_class (the Wayland app id, or any WM_CLASS entry) go
+#     in a dict keyed by the lowercased class
+#   - title-only rules are merged into one alternation (two: those anchored
+#     with ^ are only tried at the start), so a window that no title rule
+#     wants costs a regex search or two; a pattern that can't be merged (it
+#     has groups a backreference could point at, or inline flags that only
+#     work at the very start) is searched on its own every time
+# For each attribute the first matching rule in declaration order wins, so a
+# class rule can set the group and a later title rule still make it float.
+#
+# Like windowing/main.py nothing here imports libqtile, the simulation's fake
+# windows go through the same code:
+#
+#     python -m placement.main --rules 10 100 1000 --windows 5000
+
+import re
+import time
+
+import windowing.main as windowing
+
+ATTRIBUTES = ("group", "floating", "sticky", "section")
+
+
+class Rule:
+    __slots__ = ("wm_class", "title", "group", "floating", "sticky", "section")
+
+    def __init__(
+        self,
+        wm_class=None,
+        title=None,
+        group=None,
+        floating=None,
+        sticky=None,
+        section=None,
+    ):
+        """floating is True, (x, y) or (x, y, width, height); title a regex"""
+        if wm_class is None and title is None:
+            raise ValueError("a placement rule needs a wm_class or a title")
+        self.wm_class = wm_class
+        self.title = title
+        self.group = group
+        self.floating = floating
+        self.sticky = sticky
+        self.section = section
+
+    def actions(self):
+        return {a: getattr(self, a) for a in ATTRIBUTES if getattr(self, a) is not None}
+
+
+def anchored(pattern):
+    """Whether a regex starts with ^ for every alternative"""
+    if not pattern.startswith("^"):
+        return False
+    depth, escaped, in_class = 0, False, False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return False
+    return True
+
+
+def mergeable(pattern):
+    """Whether a regex means the same as one alternative among others"""
+    try:
+        return re.compile(f"(?:{pattern})").groups == 0
+    except re.error:
+        return False
+
+
+# The TreeTab sections, shared by config.py and the offline harnesses
+SECTION_RULES = (
+    Rule(title="Zulip", section="MESSAGING"),
+    Rule(title="Microsoft Teams", section="MESSAGING"),
+    Rule(title="LibreOffice", section="OFFICE"),
+    Rule(title="[Tt]hunderbird", section="EMAIL"),
+)
+
+
+class PlacementRules:
+    def __init__(self, rules, default_section="APPS", skip_groups=()):
+        self.rules = list(rules)
+        self.default_section = default_section
+        self.skip_groups = set(skip_groups)
+        self.actions = [rule.actions() for rule in self.rules]
+        self.by_class = {}  # lowercased class -> [(index, title regex or None)]
+        title_only = []
+        for i, rule in enumerate(self.rules):
+            if rule.wm_class is not None:
+                title = re.compile(rule.title) if rule.title is not None else None
+                self.by_class.setdefault(rule.wm_class.lower(), []).append((i, title))
+            else:
+                title_only.append(i)
+        self.title_rules = [(i, re.compile(self.rules[i].title)) for i in title_only]
+        self.unmerged = [
+            (i, regex)
+            for i, regex in self.title_rules
+            if not mergeable(self.rules[i].title)
+        ]
+        # Anchored patterns only need trying at the start of the title, so
+        # they get an alternation of their own, used with match()
+        patterns = [
+            self.rules[i].title for i in title_only if mergeable(self.rules[i].title)
+        ]
+        at_start = [p[1:] for p in patterns if anchored(p)]
+        anywhere = [p for p in patterns if not anchored(p)]
+        self.titles = [
+            (method, re.compile("|".join(f"(?:{p})" for p in patterns)))
+            for method, patterns in (("match", at_start), ("search", anywhere))
+            if patterns
+        ]
+        self.placed = 0
+        self.total = 0
+        self.worst = 0
+
+    def matching(self, wm_classes, title):
+        """Indices of the rules matching a window, in declaration order"""
+        matched = []
+        for wm_class in wm_classes:
+            for i, pattern in self.by_class.get(wm_class.lower(), ()):
+                if pattern is None or pattern.search(title):
+                    matched.append(i)
+        if any(getattr(regex, method)(title) for method, regex in self.titles):
+            # Some title rule matched, find out which ones
+            matched.extend(
+                i for i, pattern in self.title_rules if pattern.search(title)
+            )
+        else:
+            matched.extend(i for i, pattern in self.unmerged if pattern.search(title))
+        matched.sort()
+        return matched
+
+    def decide(self, wm_classes, title):
+        decision = {}
+        for i in self.matching(wm_classes, title):
+            for attribute, value in self.actions[i].items():
+                decision.setdefault(attribute, value)
+            if len(decision) == len(ATTRIBUTES):
+                break
+        return decision
+
+    def decide_window(self, window):
+        return self.decide(window.get_wm_class() or (), window.name or "")
+
+    def section(self, window):
+        """TreeTab sorter: the window's section"""
+        return self.decide_window(window).get("section", self.default_section)
+
+    def apply(self, qtile, window):
+        """client_managed: place a new window as the rules say"""
+        if window.group is not None and window.group.name in self.skip_groups:
+            return
+        start = time.perf_counter_ns()
+        decision = self.decide_window(window)
+        group = decision.get("group")
+        if group is not None and group in qtile.groups_map:
+            window.togroup(group)
+        floating = decision.get("floating")
+        if floating is True:
+            window.floating = True
+        elif floating:
+            window.set_position_floating(*floating[:2])
+            if len(floating) == 4:
+                window.set_size_floating(*floating[2:])
+        if decision.get("sticky") and window not in windowing.sticky_windows:
+            windowing.sticky_windows.append(window)
+        if "section" in decision and window.group is not None:
+            layout = getattr(window.group, "layout", None)
+            if layout is not None and layout.name == "treetab":
+                layout.sort_windows(self.section)
+        elapsed = time.perf_counter_ns() - start
+        self.placed += 1
+        self.total += elapsed
+        self.worst = max(self.worst, elapsed)
+
+    def stats(self):
+        mean = self.total / self.placed / 1000 if self.placed else 0
+        return (
+            f"{len(self.rules)} rules, {self.placed} windows placed, "
+            f"mean {mean:.1f} µs, max {self.worst / 1000:.1f} µs"
+        )
+
+
+def linear(rules, wm_classes, title):
+    """Every rule tried in turn, as a list of Match objects would be"""
+    decision = {}
+    classes = [c.lower() for c in wm_classes]
+    for rule in rules:
+        if rule.wm_class is not None and rule.wm_class.lower() not in classes:
+            continue
+        if rule.title is not None and not re.search(rule.title, title):
+            continue
+        for attribute, value in rule.actions().items():
+            decision.setdefault(attribute, value)
+    return decision
+
+
+def synthetic_rules(count):
+    """Rules like config.py's, padded out with plausible apps"""
+    from simulation.main import APPS
+
+    rules = [
+        Rule(title="Zulip", section="MESSAGING"),
+        Rule(title="Microsoft Teams", section="MESSAGING"),
+        Rule(title="LibreOffice", section="OFFICE"),
+        Rule(title="Thunderbird", section="EMAIL"),
+        Rule(wm_class="firefox", title="^Picture-in-Picture$", floating=(1164, 38)),
+    ]
+    for wm_class, _ in APPS:
+        rules.append(Rule(wm_class=wm_class, group=str(len(rules) % 5 + 1)))
+    i = 0
+    while len(rules) < count:
+        if i % 3:
+            rules.append(Rule(wm_class=f"org.example.app{i}", group="2"))
+        else:
+            rules.append(Rule(title=f"^Settings {i}( —|$)", floating=True))
+        i += 1
+    return rules[:count]
+
+
+def bench(rule_counts, windows, seed):
+    import random
+    import statistics
+
+    from simulation.main import APPS, FakeQtile, FakeWindow
+
+    rng = random.Random(seed)
+    qtile = FakeQtile()
+    mapped = [
+        FakeWindow(qtile, wm_class, f"{name} — document {rng.randrange(1000)}")
+        for wm_class, name in (rng.choice(APPS) for _ in range(windows))
+    ]
+    print(f"{windows} windows mapped, µs per window")
+    print(f"{'rules':>6}{'compiled':>10}{'p99':>8}{'linear':>10}{'p99':>8}")
+    for count in rule_counts:
+        rules = synthetic_rules(count)
+        engine = PlacementRules(rules)
+        columns = []
+        for decide in (
+            lambda w: engine.decide_window(w),
+            lambda w: linear(rules, w.get_wm_class(), w.name),
+        ):
+            samples = []
+            for window in mapped:
+                start = time.perf_counter_ns()
+                decide(window)
+                samples.append(time.perf_counter_ns() - start)
+            samples.sort()
+            columns.append(statistics.fmean(samples) / 1000)
+            columns.append(samples[int(len(samples) * 0.99)] / 1000)
+        for window in mapped[:100]:
+            assert engine.decide_window(window) == linear(
+                rules, window.get_wm_class(), window.name
+            )
+        print(
+            f"{count:>6}"
+            + "".join(f"{c:>{w}.1f}" for c, w in zip(columns, (10, 8, 10, 8)))
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cost of placing a mapped window")
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--windows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    bench(args.rules, args.windows, args.seed)
@@ -0,0 +1,135 @@
+# Failure policy for polling widgets (ThreadPoolText and its subclasses)
+#
+# Mixed in before the widget class, PollPolicy replaces ThreadPoolText's
+# timer_setup so that a poll that raises:
+#   - shows failure_text, and is retried after update_interval * 2^n, capped
+#     at max_backoff and jittered so failing widgets don't retry in lockstep
+#   - after trip_after failures in a row, parks the widget: nothing is polled
+#     until rearm() is called (e.g. on link-up) or, if probe_interval is set,
+#     a single probe poll succeeds
+# force_update (GenPollCommand's Button1) polls in the executor too, and gives
+# a parked widget one more try.
+# Counters are kept per widget: qtile cmd-obj -o widget <name> -f poll_stats
+
+import random
+import weakref
+
+from libqtile.command.base import expose_command
+from libqtile.log_utils import logger
+
+widgets = weakref.WeakSet()
+
+
+class PollPolicy:
+    policy_defaults = [
+        ("max_backoff", 600, "Longest retry delay after failures, in seconds"),
+        ("jitter", 0.2, "Retry delays are scaled by a random factor of 1 +/- jitter"),
+        ("trip_after", 5, "Consecutive failures before the widget is parked"),
+        (
+            "probe_interval",
+            None,
+            "Seconds before a parked widget tries once more, None waits for rearm()",
+        ),
+        ("failure_text", "⚠", "Text shown while polling fails, can use {error}"),
+    ]
+
+    def __init__(self, *args, **config):
+        super().__init__(*args, **config)
+        self.add_defaults(PollPolicy.policy_defaults)
+        self.failures = 0
+        self.consecutive = 0
+        self.parked = False
+        self.last_error = None
+        self.future = None
+        self._timer = None
+        widgets.add(self)
+
+    def timer_setup(self):
+        if self.parked:
+            return
+        self.future = self.qtile.run_in_executor(self.poll)
+        self.future.add_done_callback(self._polled)
+
+    def _schedule(self, delay, callback):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self.timeout_add(delay, callback)
+
+    def _polled(self, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._failed(e)
+            return
+        if result is None:
+            return  # ThreadPoolText's way of saying "stop polling"
+        self.consecutive = 0
+        self.update(result)
+        if self.update_interval is not None:
+            self._schedule(self.update_interval, self.timer_setup)
+
+    def _failed(self, error):
+        self.failures += 1
+        self.consecutive += 1
+        self.last_error = str(error) or type(error).__name__
+        self.update(self.failure_text.format(error=self.last_error))
+        if self.consecutive >= self.trip_after:
+            self.parked = True
+            logger.warning(
+                "%s: parked after %d failures: %s",
+                self.name,
+                self.consecutive,
+                self.last_error,
+            )
+            if self.probe_interval is not None:
+                self._schedule(self.probe_interval, self._probe)
+            return
+        delay = min(self.max_backoff, (self.update_interval or 1) * 2**self.consecutive)
+        self._schedule(
+            delay * random.uniform(1 - self.jitter, 1 + self.jitter), self.timer_setup
+        )
+
+    def _probe(self):
+        # Half open: one more try, the next failure parks it again
+        self.parked = False
+        self.consecutive = self.trip_after - 1
+        self.timer_setup()
+
+    def rearm(self):
+        """Poll now and forget past failures, e.g. once the source is back"""
+        self.parked = False
+        self.consecutive = 0
+        if self.future is not None and not self.future.done():
+            return  # The poll in flight reschedules itself
+        if self._timer is not None:
+            self._timer.cancel()
+        self.timer_setup()
+
+    @expose_command()
+    def force_update(self):
+        """Poll now, off the event loop; a parked widget gets one more try"""
+        if self.future is not None and not self.future.done():
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.parked:
+            self._probe()
+        else:
+            self.timer_setup()
+
+    @expose_command()
+    def poll_stats(self):
+        return {
+            "failures": self.failures,
+            "consecutive": self.consecutive,
+            "parked": self.parked,
+            "last_error": self.last_error,
+        }
+
+
+def stats():
+    lines = []
+    for w in sorted(widgets, key=lambda w: w.name):
+        state = "parked" if w.parked else "ok"
+        lines.append(f"{w.name}: {state}, {w.failures} failures, last: {w.last_error}")
+    return "\n".join(lines) or "no polling widgets"
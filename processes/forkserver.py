@@ -0,0 +1,192 @@
+# Small helper process that spawns children on qtile's behalf
+#
+# The helper is started once with posix_spawn of sys.executable and talks to
+# qtile over a SOCK_SEQPACKET socketpair, one pickled message per request:
+#     ("env", {...})            replace the environment children get
+#     ("spawn", path, argv)     posix_spawn, reply with the pid or -errno
+# It only imports the standard library, so every spawn starts from a process
+# a few MiB in size whatever qtile's own memory and fd table look like, and
+# the environment is only sent again when it changed. Children are reaped by
+# the helper (SIGCHLD is ignored there); qtile still follows them by pidfd.
+#
+#     python -m processes.forkserver --bench --heap-mb 1024
+
+import os
+import pickle
+import signal
+import socket
+import struct
+import sys
+
+REPLY = struct.Struct("i")
+
+
+def serve(fd):
+    sock = socket.socket(fileno=fd)
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    null = os.open(os.devnull, os.O_RDWR)
+    file_actions = [(os.POSIX_SPAWN_DUP2, null, i) for i in range(3)]
+    if hasattr(os, "POSIX_SPAWN_CLOSEFROM"):
+        file_actions.append((os.POSIX_SPAWN_CLOSEFROM, 3))
+    env = dict(os.environ)
+    while True:
+        message = sock.recv(1 << 20)
+        if not message:
+            return
+        kind, *args = pickle.loads(message)
+        if kind == "env":
+            (env,) = args
+            continue
+        path, argv = args
+        try:
+            # SIG_IGN survives exec, the children get the default back
+            pid = os.posix_spawn(
+                path,
+                argv,
+                env,
+                file_actions=file_actions,
+                setsid=True,
+                setsigdef=(signal.SIGCHLD,),
+            )
+        except OSError as e:
+            pid = -e.errno
+        sock.send(REPLY.pack(pid))
+
+
+class ForkServer:
+    """Client side, used by ProcessManager"""
+
+    def __init__(self, timeout=1):
+        self.timeout = timeout
+        self.sock = None
+        self.pid = None
+        self.env = None
+
+    def start(self):
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        os.set_inheritable(theirs.fileno(), True)
+        argv = [
+            sys.executable,
+            "-I",
+            "-S",
+            os.path.abspath(__file__),
+            str(theirs.fileno()),
+        ]
+        try:
+            self.pid = os.posix_spawn(sys.executable, argv, os.environ, setsid=True)
+        finally:
+            theirs.close()
+        ours.settimeout(self.timeout)
+        self.sock = ours
+        self.env = None
+
+    @property
+    def alive(self):
+        return self.sock is not None
+
+    def stop(self):
+        if self.sock is not None:
+            self.sock.close()  # The helper exits on EOF
+            self.sock = None
+
+    def spawn(self, path, argv, env):
+        """pid of the new child; raises OSError if the helper is gone"""
+        if env is not self.env:
+            self.sock.send(pickle.dumps(("env", env), pickle.HIGHEST_PROTOCOL))
+            self.env = env
+        self.sock.send(pickle.dumps(("spawn", path, argv), pickle.HIGHEST_PROTOCOL))
+        reply = self.sock.recv(REPLY.size)
+        if len(reply) != REPLY.size:
+            self.stop()
+            raise ConnectionError("fork server went away")
+        (pid,) = REPLY.unpack(reply)
+        if pid < 0:
+            raise OSError(-pid, os.strerror(-pid), argv[0])
+        return pid
+
+
+def bench(iterations, heap_mb):
+    import statistics
+    import time
+
+    # Make this process look like a compositor that has been running a while
+    heap = [bytearray(1024 * 1024) for _ in range(heap_mb)]
+    for block in heap:
+        block[::4096] = b"x" * len(block[::4096])
+
+    path = "/bin/true"
+    env = dict(os.environ)
+
+    def fork_exec():
+        # The child's copy of the CLOEXEC pipe closes on exec
+        r, w = os.pipe2(os.O_CLOEXEC)
+        pid = os.fork()
+        if pid == 0:
+            os.execve(path, [path], env)
+        os.close(w)
+        os.read(r, 1)
+        os.close(r)
+        return pid
+
+    def direct():
+        return os.posix_spawn(path, [path], env)
+
+    server = ForkServer()
+    server.start()
+
+    def helper():
+        return server.spawn(path, [path], env)
+
+    print(
+        f"{'path':<14}{'mean µs':>10}{'p50 µs':>10}{'p99 µs':>10}   (parent heap {heap_mb} MiB)"
+    )
+    for name, spawn in (
+        ("fork+exec", fork_exec),
+        ("posix_spawn", direct),
+        ("fork server", helper),
+    ):
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter_ns()
+            pid = spawn()
+            samples.append(time.perf_counter_ns() - start)
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass  # the fork server reaps its own children
+        samples.sort()
+        print(
+            f"{name:<14}{statistics.fmean(samples) / 1000:>10.0f}"
+            f"{samples[len(samples) // 2] / 1000:>10.0f}"
+            f"{samples[int(len(samples) * 0.99)] / 1000:>10.0f}"
+        )
+    server.stop()
+    del heap
+
+    # What every spawn paid for its environment before it was cached, and the
+    # check ProcessManager.environment() now does instead
+    for name, build in (
+        ("copy env", lambda: dict(os.environ)),
+        ("check cache", lambda: os.environ._data != source),
+    ):
+        source = dict(os.environ._data)
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            build()
+        elapsed = (time.perf_counter_ns() - start) / iterations / 1000
+        print(f"{name:<14}{elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1].isdigit():
+        serve(int(sys.argv[1]))
+        sys.exit()
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fork server spawn latency")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--heap-mb", type=int, default=512)
+    args = parser.parse_args()
+    bench(args.iterations, args.heap_mb)
@@ -0,0 +1,351 @@
+# Child processes started by the config: spawned, tracked, reaped and capped
+#
+# Every helper, script and app the config starts goes through here:
+#   - commands are split with shlex and started with posix_spawn, only going
+#     through /bin/sh when the command really uses shell syntax
+#   - each child gets a pidfd on the event loop, so its exit is noticed (and
+#     the child reaped) as it happens rather than whenever SIGCHLD is handled
+#   - children of a capped class still running after CONFINE_AFTER are moved
+#     into a transient systemd scope under a per-class slice with CPU and
+#     memory limits, so a runaway script can't take the session down; the
+#     many that exit sooner cost no systemd round trip
+#   - commands run for their output (from poll threads) are tracked and
+#     capped the same way, as "helpers" unless told otherwise
+#   - spawn latency and the live children per class are kept for stats()
+#
+# The environment handed to children is built once and reused. It's rebuilt
+# when os.environ's raw bytes dict no longer equals a snapshot of it, a C
+# level dict comparison that catches changed values as well as new or removed
+# variables for a fraction of the cost of copying the environment.
+#
+# qtile's own SIGCHLD handler may reap a child first, the pidfd still tells
+# us it's gone, only the exit status is lost then. output(check=True) counts
+# a lost status as a failure, it can't tell it from one.
+
+import asyncio
+import os
+import shlex
+import select
+import shutil
+import signal
+import subprocess
+import time
+
+from libqtile.log_utils import logger
+from libqtile.utils import create_task
+
+from processes.forkserver import ForkServer
+
+SHELL_SYNTAX = set("|&;<>()$`*?[]{}~\\")
+CONFINE_AFTER = 2  # seconds
+
+
+def split(command):
+    """argv for a command, through /bin/sh only when it needs a shell"""
+    if not isinstance(command, str):
+        return list(command)
+    if SHELL_SYNTAX.isdisjoint(command):
+        return shlex.split(command)
+    return ["/bin/sh", "-c", command]
+
+
+def age(pid="self"):
+    """Seconds since a process started"""
+    with open(f"/proc/{pid}/stat") as f:
+        # The command name may hold spaces and parens, fields follow the last )
+        fields = f.read().rsplit(")", 1)[1].split()
+    started = int(fields[19]) / os.sysconf("SC_CLK_TCK")  # since boot
+    return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+
+
+class Child:
+    __slots__ = ("pid", "pidfd", "argv", "kind", "started", "status")
+
+    def __init__(self, pid, pidfd, argv, kind):
+        self.pid = pid
+        self.pidfd = pidfd
+        self.argv = argv
+        self.kind = kind
+        self.started = time.monotonic()
+        self.status = None
+
+
+class ProcessManager:
+    def __init__(self, limits=None, pool=None, history=512, forkserver=False):
+        # kind -> {"MemoryMax": bytes, "CPUQuota": percent}, kinds not listed
+        # are tracked but left in qtile's cgroup
+        self.limits = limits or {}
+        self.pool = pool
+        self.forkserver = ForkServer() if forkserver else None
+        self._env = None
+        self._env_source = None
+        self._loop = None
+        self.children = {}  # pid -> Child
+        self.paths = {}  # executable name -> path
+        self.latencies = []
+        self.history = history
+        self.spawned = 0
+        self.failed = 0
+        self._slices = set()
+        self._slice_lock = asyncio.Lock()
+        self._null = os.open(os.devnull, os.O_RDWR | os.O_CLOEXEC)
+        self._default_actions = self._file_actions(None)
+
+    def setenv(self, name, value=None):
+        """Set (or with None, unset) a variable for qtile and the children"""
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+        self._env = None
+
+    def environment(self):
+        """The environment children get, rebuilt when it was changed"""
+        if self._env is None or os.environ._data != self._env_source:
+            self._env_source = dict(os.environ._data)
+            env = dict(os.environ)
+            # qtile's virtualenv shouldn't leak into the apps it starts
+            env.pop("VIRTUAL_ENV", None)
+            self._env = env
+            self.paths.clear()  # $PATH may have changed
+        return self._env
+
+    def _resolve(self, name):
+        if "/" in name:
+            return name
+        path = self.paths.get(name)
+        if path is None:
+            path = shutil.which(name)
+            if path is not None:
+                self.paths[name] = path
+        return path
+
+    def _file_actions(self, stdout):
+        actions = [
+            (os.POSIX_SPAWN_DUP2, self._null, 0),
+            (os.POSIX_SPAWN_DUP2, stdout if stdout is not None else self._null, 1),
+            (os.POSIX_SPAWN_DUP2, self._null, 2),
+        ]
+        if hasattr(os, "POSIX_SPAWN_CLOSEFROM"):
+            actions.append((os.POSIX_SPAWN_CLOSEFROM, 3))
+        return actions
+
+    def _spawn(self, argv, env, stdout=None):
+        env = env if env is not None else self.environment()
+        path = self._resolve(argv[0])
+        if path is None:
+            self.failed += 1
+            logger.error("processes: couldn't find `%s`", argv[0])
+            return -1
+        start = time.perf_counter_ns()
+        try:
+            if stdout is None and self.forkserver is not None:
+                pid = self._spawn_via_server(path, argv, env)
+            else:
+                actions = (
+                    self._default_actions
+                    if stdout is None
+                    else self._file_actions(stdout)
+                )
+                pid = os.posix_spawn(path, argv, env, file_actions=actions, setsid=True)
+        except OSError as e:
+            # A stale cached path, e.g. after a package update
+            self.paths.pop(argv[0], None)
+            self.failed += 1
+            logger.warning("processes: failed to execute %s: %s", argv, e)
+            return -1
+        self.latencies.append(time.perf_counter_ns() - start)
+        if len(self.latencies) > self.history:
+            del self.latencies[: -self.history]
+        self.spawned += 1
+        return pid
+
+    def _spawn_via_server(self, path, argv, env):
+        if not self.forkserver.alive:
+            self.forkserver.start()
+        try:
+            return self.forkserver.spawn(path, argv, env)
+        except (ConnectionError, TimeoutError):
+            logger.warning("processes: fork server went away, restarting it")
+            self.forkserver.stop()
+            return os.posix_spawn(
+                path, argv, env, file_actions=self._default_actions, setsid=True
+            )
+
+    def spawn(self, command, kind="apps", env=None):
+        """Start command in the background, returns its pid or -1"""
+        argv = split(command)
+        pid = self._spawn(argv, env)
+        if pid < 0:
+            return pid
+        try:
+            pidfd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return pid  # Already gone and reaped
+        child = Child(pid, pidfd, argv, kind)
+        self.children[pid] = child
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(pidfd, self._reap, child)
+        self._confine_later(child)
+        return pid
+
+    def run(self, qtile, command, kind="apps"):
+        """For keys and mouse callbacks: lazy.function(procs.run, "cmd")"""
+        self.spawn(command, kind)
+
+    def run_helper(self, qtile, command):
+        self.spawn(command, "helpers")
+
+    def output(self, command, timeout=10, check=False, kind="helpers"):
+        """Run command to completion and return its stdout, for poll threads
+
+        With check, a non-zero exit raises subprocess.CalledProcessError, as
+        does an exit status lost to qtile's SIGCHLD handler (returncode None).
+        """
+        argv = split(command)
+        read_fd, write_fd = os.pipe2(os.O_CLOEXEC)
+        try:
+            pid = self._spawn(argv, None, stdout=write_fd)
+        finally:
+            os.close(write_fd)
+        if pid < 0:
+            os.close(read_fd)
+            raise FileNotFoundError(argv[0])
+        child = Child(pid, None, argv, kind)
+        self.children[pid] = child
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._confine_later, child)
+        deadline = time.monotonic() + timeout
+        chunks = []
+        with os.fdopen(read_fd, "rb") as out:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([out], [], [], remaining)[0]:
+                    os.kill(pid, signal.SIGKILL)
+                    break
+                chunk = out.read1(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        output = b"".join(chunks).decode(errors="replace")
+        try:
+            _, status = os.waitpid(pid, 0)
+        except ChildProcessError:
+            status = None  # qtile's SIGCHLD handler got there first
+        finally:
+            self.children.pop(pid, None)
+        if check and status != 0:
+            code = None if status is None else os.waitstatus_to_exitcode(status)
+            raise subprocess.CalledProcessError(code, argv, output)
+        return output
+
+    def _reap(self, child):
+        asyncio.get_running_loop().remove_reader(child.pidfd)
+        try:
+            result = os.waitid(os.P_PIDFD, child.pidfd, os.WEXITED | os.WNOHANG)
+            child.status = result.si_status if result else None
+        except ChildProcessError:
+            pass
+        os.close(child.pidfd)
+        del self.children[child.pid]
+        if child.status:
+            logger.info(
+                "processes: %s exited with %s after %.1fs",
+                child.argv[0],
+                child.status,
+                time.monotonic() - child.started,
+            )
+
+    # cgroups, through systemd on the session bus
+    async def _call_systemd(self, member, signature, body):
+        return await self.pool.call(
+            "session",
+            "org.freedesktop.systemd1",
+            "/org/freedesktop/systemd1",
+            "org.freedesktop.systemd1.Manager",
+            member,
+            signature,
+            body,
+        )
+
+    def _limit_properties(self, kind):
+        from dbus_fast import Variant
+
+        limits = self.limits[kind]
+        props = []
+        if "MemoryMax" in limits:
+            props.append(["MemoryMax", Variant("t", limits["MemoryMax"])])
+        if "CPUQuota" in limits:
+            props.append(
+                ["CPUQuotaPerSecUSec", Variant("t", limits["CPUQuota"] * 10000)]
+            )
+        return props
+
+    def _confine_later(self, child):
+        if child.kind not in self.limits or self.pool is None:
+            return
+
+        def confine():
+            if self.children.get(child.pid) is child:
+                create_task(self._confine(child))
+
+        asyncio.get_running_loop().call_later(CONFINE_AFTER, confine)
+
+    async def _confine(self, child):
+        from dbus_fast import Variant
+
+        slice_name = f"qtile-{child.kind}.slice"
+        try:
+            async with self._slice_lock:
+                if slice_name not in self._slices:
+                    await self._start_slice(slice_name, child.kind)
+                    self._slices.add(slice_name)
+            await self._call_systemd(
+                "StartTransientUnit",
+                "ssa(sv)a(sa(sv))",
+                [
+                    f"qtile-{child.kind}-{child.pid}.scope",
+                    "fail",
+                    [
+                        ["PIDs", Variant("au", [child.pid])],
+                        ["Slice", Variant("s", slice_name)],
+                        ["CollectMode", Variant("s", "inactive-or-failed")],
+                    ],
+                    [],
+                ],
+            )
+        except Exception as e:
+            # Also when the child exited before systemd got to it
+            logger.debug("processes: couldn't confine %s: %s", child.argv[0], e)
+
+    async def _start_slice(self, slice_name, kind):
+        try:
+            await self._call_systemd(
+                "StartTransientUnit",
+                "ssa(sv)a(sa(sv))",
+                [slice_name, "replace", self._limit_properties(kind), []],
+            )
+        except RuntimeError as e:
+            # Left from before a restart, with the same limits
+            if "UnitExists" not in str(e):
+                raise
+
+    def stats(self):
+        import statistics
+
+        lines = [f"{self.spawned} spawned, {self.failed} failed"]
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            lines.append(
+                f"spawn latency mean {statistics.fmean(ordered) / 1000:.0f} µs, "
+                f"p99 {ordered[int(len(ordered) * 0.99)] / 1000:.0f} µs"
+            )
+        counts = {}
+        # Poll threads add and remove theirs meanwhile
+        for child in list(self.children.values()):
+            counts[child.kind] = counts.get(child.kind, 0) + 1
+        lines.append(
+            "live: "
+            + (", ".join(f"{k} {n}" for k, n in sorted(counts.items())) or "none")
+        )
+        return "\n".join(lines)
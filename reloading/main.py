@@ -0,0 +1,447 @@
+# Incremental config reload
+#
+# Evaluates config.py into a scratch namespace, diffs it against the objects
+# qtile is running (keys, float rules, widget parameters, layout themes and a
+# few plain settings) and applies only the differences. Widgets that didn't
+# change are left alone, so they keep their caches and poll timers.
+#
+# Anything structural (widgets added, removed or reordered, different groups,
+# screens or layouts, or a widget parameter that only takes effect when the
+# widget is configured) falls back to qtile's full reload_config().
+#
+# The config builds its services (process manager, bus pool, indexes...) with
+# keep(), which builds each one once per qtile process and hands the same
+# object back to every later evaluation: an incremental one here, or qtile's
+# full reload_config(), which re-runs this module in its old namespace. The
+# new keys and widgets are bound to services that are actually running, and
+# no second copy is left holding fds, sockets or finalized widgets. starting()
+# tells the config's startup hooks (fired again after a full reload) which
+# services still need starting.
+#
+# A new palette doesn't go through the config at all: recolour() swaps each
+# old colour for its new one wherever a widget, decoration, bar or layout
+# was given it, through the same in-place appliers, then redraws.
+
+import time
+import types
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.widget.base import _TextBox
+
+SETTINGS = (
+    "follow_mouse_focus",
+    "bring_front_click",
+    "cursor_warp",
+    "auto_fullscreen",
+    "auto_minimize",
+    "focus_on_window_activation",
+)
+
+# Callbacks are closures over the old module, they never compare equal
+IGNORED_PARAMS = {"mouse_callbacks"}
+
+# Widget parameters taken positionally, so not in _user_config. Widgets of
+# the config's own can list theirs in a positional_params class attribute.
+POSITIONAL_PARAMS = {"TextBox": ("text",)}
+
+# name -> service, and the names started, for the life of the qtile process:
+# a full reload re-runs this module in the same namespace
+_services = globals().get("_services", {})
+_started = globals().get("_started", set())
+_evaluating = False
+
+
+class _Discard:
+    """Stand-in for hook.subscribe while the new config is evaluated"""
+
+    def __getattr__(self, name):
+        return lambda func: func
+
+
+class Structural(Exception):
+    pass
+
+
+def evaluating():
+    """Whether the config is being evaluated for an incremental reload"""
+    return _evaluating
+
+
+def keep(name, build):
+    """The service called name, built with build() the first time it's asked for"""
+    try:
+        return _services[name]
+    except KeyError:
+        if _evaluating:
+            raise Structural(f"new {name}") from None
+    service = _services[name] = build()
+    return service
+
+
+def starting(name):
+    """True once per qtile process for the service called name: start it now"""
+    if name in _started:
+        return False
+    _started.add(name)
+    return True
+
+
+def evaluate(config):
+    """Run the config file without letting it subscribe hooks or build services"""
+    import runpy
+
+    global _evaluating
+    subscribe = hook.subscribe
+    hook.subscribe = _Discard()
+    _evaluating = True
+    try:
+        return types.SimpleNamespace(
+            **runpy.run_path(config.file_path, run_name="config_reload")
+        )
+    finally:
+        _evaluating = False
+        hook.subscribe = subscribe
+
+
+def normalize(value):
+    """Reduce a value to something comparable across two config evaluations"""
+    if isinstance(value, types.FunctionType):
+        cells = tuple(normalize(c.cell_contents) for c in value.__closure__ or ())
+        return (value.__qualname__, cells)
+    if isinstance(value, types.MethodType):
+        return (value.__qualname__, type(value.__self__).__name__)
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if hasattr(value, "selectors") and hasattr(value, "name"):  # LazyCall
+        return (
+            value.name,
+            normalize(value.selectors),
+            normalize(value.args),
+            normalize(value.kwargs),
+        )
+    if hasattr(value, "_rules"):  # Match
+        return ("Match", normalize(value._rules))
+    return value
+
+
+def values(obj):
+    """The parameters obj was made with, by name"""
+    config = {
+        k: v
+        for k, v in getattr(obj, "_user_config", {}).items()
+        if k not in IGNORED_PARAMS
+    }
+    names = getattr(
+        obj, "positional_params", POSITIONAL_PARAMS.get(type(obj).__name__, ())
+    )
+    for name in names:
+        config[name] = getattr(obj, name, None)
+    return config
+
+
+def params(obj):
+    return {k: normalize(v) for k, v in values(obj).items()}
+
+
+def _set_plain(widget, name, value):
+    setattr(widget, name, value)
+
+
+def _set_foreground(widget, name, value):
+    widget.foreground = value
+    if widget.layout is not None:
+        widget.layout.colour = value
+
+
+def _set_font(widget, name, value):
+    widget.font = value
+    if widget.layout is not None:
+        widget.layout.font_family = value
+
+
+def _set_fontsize(widget, name, value):
+    if value is None and widget.layout is not None:
+        # What _configure would have made of it
+        value = widget.bar.height - widget.bar.height / 5
+    widget.fontsize = value
+    if widget.layout is not None:
+        widget.layout.font_size = value
+
+
+def _set_text(widget, name, value):
+    setattr(widget, name, value)
+    # The text setter formats it into the layout
+    widget.text = widget.text
+
+
+# Parameters a configured widget can take in place; anything else is only
+# read when the widget is configured, and needs a rebuild
+APPLIERS = {"padding": _set_plain, "background": _set_plain}
+TEXT_APPLIERS = {
+    "foreground": _set_foreground,
+    "font": _set_font,
+    "fontsize": _set_fontsize,
+    "fmt": _set_text,
+    "text": _set_text,
+}
+
+
+def applier(widget, name):
+    if name in APPLIERS:
+        return APPLIERS[name]
+    if isinstance(widget, _TextBox):
+        return TEXT_APPLIERS.get(name)
+    return None
+
+
+def key_id(key):
+    return (tuple(sorted(key.modifiers)), key.key)
+
+
+def diff_keys(old, new):
+    """Return (removed, added) keys, a changed key shows up in both"""
+    old_map = {key_id(k): k for k in old}
+    new_map = {key_id(k): k for k in new}
+    removed, added = [], []
+    for kid, key in old_map.items():
+        other = new_map.get(kid)
+        if other is None or normalize(other.commands) != normalize(key.commands):
+            removed.append(key)
+    for kid, key in new_map.items():
+        other = old_map.get(kid)
+        if other is None or normalize(other.commands) != normalize(key.commands):
+            added.append(key)
+    return removed, added
+
+
+def diff_params(old_objs, new_objs, what):
+    """Pair objects by position and return [(index, {param: value})]"""
+    if [type(o).__name__ for o in old_objs] != [type(o).__name__ for o in new_objs]:
+        raise Structural(what)
+    changes = []
+    for i, (old, new) in enumerate(zip(old_objs, new_objs)):
+        old_params, new_params = params(old), params(new)
+        # A dropped parameter means going back to its default, needs a rebuild
+        if old_params.keys() - new_params.keys():
+            raise Structural(f"{what}[{i}]")
+        new_values = values(new)
+        changed = {
+            k: new_values[k]
+            for k, v in new_params.items()
+            if old_params.get(k, object()) != v
+        }
+        if changed:
+            changes.append((i, changed))
+    return changes
+
+
+def bars(screen):
+    return [(pos, getattr(screen, pos)) for pos in ("top", "bottom", "left", "right")]
+
+
+def diff_widgets(old_screens, new_screens):
+    """Return [(screen index, position, widget index, {param: value})]"""
+    if len(old_screens) != len(new_screens):
+        raise Structural("screens")
+    changes = []
+    for s, (old, new) in enumerate(zip(old_screens, new_screens)):
+        for (pos, old_bar), (_, new_bar) in zip(bars(old), bars(new)):
+            if (old_bar is None) != (new_bar is None):
+                raise Structural(f"screen {s} {pos} bar")
+            if old_bar is None:
+                continue
+            if params(old_bar) != params(new_bar):
+                raise Structural(f"screen {s} {pos} bar")
+            for i, changed in diff_params(
+                old_bar.widgets, new_bar.widgets, f"{pos} bar"
+            ):
+                for name in changed:
+                    if applier(old_bar.widgets[i], name) is None:
+                        raise Structural(f"{pos} bar[{i}].{name}")
+                changes.append((s, pos, i, changed))
+    return changes
+
+
+def diff(config, new):
+    """Work out what changed between the running config and a new namespace"""
+    if [(type(g).__name__, g.name) for g in config.groups] != [
+        (type(g).__name__, g.name) for g in new.groups
+    ]:
+        raise Structural("groups")
+
+    old_rules = normalize(config.floating_layout.float_rules)
+    new_rules = normalize(new.floating_layout.float_rules)
+
+    return types.SimpleNamespace(
+        keys=diff_keys(config.keys, new.keys),
+        float_rules=new.floating_layout.float_rules if old_rules != new_rules else None,
+        widgets=diff_widgets(config.screens, new.screens),
+        layouts=diff_params(config.layouts, new.layouts, "layouts"),
+        settings={
+            name: getattr(new, name)
+            for name in SETTINGS
+            if hasattr(new, name) and getattr(config, name, None) != getattr(new, name)
+        },
+    )
+
+
+def apply(qtile, changes):
+    config = qtile.config
+
+    removed, added = changes.keys
+    for key in removed:
+        qtile.ungrab_key(key)
+        config.keys.remove(key)
+    for key in added:
+        qtile.grab_key(key)
+        config.keys.append(key)
+
+    if changes.float_rules is not None:
+        config.floating_layout.float_rules = changes.float_rules
+        for group in qtile.groups:
+            group.floating_layout.float_rules = changes.float_rules
+
+    dirty_bars = set()
+    for s, pos, i, changed in changes.widgets:
+        bar = getattr(config.screens[s], pos)
+        widget = bar.widgets[i]
+        for name, value in changed.items():
+            applier(widget, name)(widget, name, value)
+            if name in widget._user_config:
+                widget._user_config[name] = value
+        if hasattr(bar, "draw"):
+            dirty_bars.add(bar)
+    for bar in dirty_bars:
+        bar.draw()
+
+    if changes.layouts:
+        for i, changed in changes.layouts:
+            config.layouts[i]._user_config.update(changed)
+            for name, value in changed.items():
+                setattr(config.layouts[i], name, value)
+            for group in qtile.groups:
+                if i < len(group.layouts):
+                    for name, value in changed.items():
+                        setattr(group.layouts[i], name, value)
+        for group in qtile.groups:
+            if group.screen is not None:
+                group.layout_all()
+
+    for name, value in changes.settings.items():
+        setattr(config, name, value)
+
+
+def summary(changes):
+    removed, added = changes.keys
+    return (
+        f"keys -{len(removed)} +{len(added)}, "
+        f"float rules {'replaced' if changes.float_rules is not None else 'unchanged'}, "
+        f"{len(changes.widgets)} widgets, {len(changes.layouts)} layouts, "
+        f"{len(changes.settings)} settings"
+    )
+
+
+def reload_changed(qtile):
+    """Apply only what changed in config.py, or fall back to a full reload"""
+    start = time.monotonic()
+    try:
+        changes = diff(qtile.config, evaluate(qtile.config))
+    except Structural as e:
+        logger.info("reload: %s changed structurally, doing a full reload", e)
+        qtile.reload_config()
+        return
+    except Exception:
+        logger.exception("reload: new config failed to evaluate, keeping the old one")
+        return
+
+    apply(qtile, changes)
+    logger.info(
+        "reload: applied %s in %.1f ms",
+        summary(changes),
+        (time.monotonic() - start) * 1000,
+    )
+
+
+# Palette changes
+def swap(value, mapping):
+    """value with every colour in mapping replaced, lists of colours included"""
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(swap(v, mapping) for v in value)
+    return value
+
+
+def _recoloured(obj, mapping):
+    """{name: new colour} for obj's configured colours that mapping changes"""
+    changed = {}
+    for name, value in getattr(obj, "_user_config", {}).items():
+        if name in IGNORED_PARAMS:
+            continue
+        value = getattr(obj, name, value)
+        new = swap(value, mapping)
+        if new != value:
+            changed[name] = new
+    return changed
+
+
+def _set_widget(widget, name, value):
+    (applier(widget, name) or _set_plain)(widget, name, value)
+
+
+def recolour(qtile, mapping, screens=None, styles=()):
+    """Replace old colours by new ones (mapping) in place, and redraw
+
+    Covers the widgets and their decorations and the bars of screens (default
+    qtile.screens), every group's layouts, and the popup style dicts in styles.
+    """
+    start = time.monotonic()
+    screens = list(qtile.screens if screens is None else screens)
+    bars = [
+        bar
+        for screen in screens
+        for bar in (screen.top, screen.bottom, screen.left, screen.right)
+        if bar is not None and hasattr(bar, "widgets")
+    ]
+    # widgets_map also has those a closed WidgetBox holds
+    widgets = dict.fromkeys(
+        [*qtile.widgets_map.values(), *(w for b in bars for w in b.widgets)]
+    )
+    layouts = dict.fromkeys([*qtile.config.layouts, qtile.config.floating_layout])
+    for group in qtile.groups:
+        layouts.update(dict.fromkeys([*group.layouts, group.floating_layout]))
+    targets = [(w, _set_widget) for w in widgets]
+    targets += [(d, _set_plain) for w in widgets for d in getattr(w, "decorations", ())]
+    targets += [(obj, _set_plain) for obj in (*bars, *layouts)]
+
+    # Everything is read before anything is set: layouts are shallow copies
+    # of the config's and share its _user_config
+    changes = [
+        (obj, set_value, _recoloured(obj, mapping)) for obj, set_value in targets
+    ]
+    for obj, set_value, changed in changes:
+        for name, value in changed.items():
+            set_value(obj, name, value)
+            obj._user_config[name] = value
+
+    for style in styles:
+        for name, value in style.items():
+            style[name] = swap(value, mapping)
+
+    for bar in bars:
+        # A parked screen's bars are drawn when its output is back
+        if any(bar.screen is screen for screen in qtile.screens):
+            bar.draw()
+    for group in qtile.groups:
+        if group.screen is not None:
+            group.layout_all()
+    logger.info(
+        "recolour: %d colours, %d widgets, %d layouts in %.1f ms",
+        len(mapping),
+        len(widgets),
+        len(layouts),
+        (time.monotonic() - start) * 1000,
+    )
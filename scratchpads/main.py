@@ -0,0 +1,217 @@
+# DropDown lifecycle management for the "6" ScratchPad
+#
+# - prewarms chosen dropdowns after startup, one at a time while the session
+#   is idle (the CPUs mostly idle since the last look, per /proc/stat, and
+#   the previous one mapped), and hides them as soon as their window maps.
+#   qtile starts them at normal priority: a niced dropdown couldn't be
+#   un-niced when opened without CAP_SYS_NICE
+# - remembers when each dropdown was last opened and how long it took
+# - sums resident memory of each dropdown's process tree from /proc and
+#   closes the least recently used hidden ones when over a memory budget;
+#   /proc is read in an executor, a few hundred processes take a while
+
+import os
+import time
+
+from libqtile.log_utils import logger
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def process_table():
+    """Return ({pid: [child pids]}, {pid: rss bytes}) for every process"""
+    children, rss = {}, {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm can contain spaces and parens, the fields after it can't
+        fields = stat[stat.rindex(b")") + 2 :].split()
+        pid = int(entry.name)
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss[pid] = int(fields[21]) * PAGE_SIZE
+    return children, rss
+
+
+def cpu_times():
+    """(busy, total) jiffies of all CPUs so far"""
+    with open("/proc/stat", "rb") as f:
+        fields = [int(v) for v in f.readline().split()[1:8]]
+    # user nice system idle iowait irq softirq
+    return sum(fields) - fields[3] - fields[4], sum(fields)
+
+
+def tree_rss(pid, children, rss):
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        total += rss.get(p, 0)
+        stack.extend(children.get(p, ()))
+    return total
+
+
+class DropDownManager:
+    def __init__(
+        self,
+        scratchpad="6",
+        prewarm=(),
+        prewarm_delay=30,
+        max_busy=0.25,
+        memory_budget=3 * 1024**3,
+        min_idle=15 * 60,
+        check_interval=60,
+    ):
+        self.scratchpad = scratchpad
+        self.prewarm = list(prewarm)
+        self.prewarm_delay = prewarm_delay
+        self.max_busy = max_busy
+        self.memory_budget = memory_budget
+        self.min_idle = min_idle
+        self.check_interval = check_interval
+        self.last_used = {}
+        self.latency = {}
+        self.memory = {}
+        self._pending = {}
+        self._hide_on_map = set()
+        self._cpu = None
+
+    def pad(self, qtile):
+        return qtile.groups_map[self.scratchpad]
+
+    def window_name(self, qtile, window):
+        for name, toggler in self.pad(qtile).dropdowns.items():
+            if toggler.window is window:
+                return name
+        return None
+
+    # Hooks, wired up in config.py
+    def startup(self, qtile):
+        self._cpu = cpu_times()
+        if self.prewarm:
+            qtile.call_later(self.prewarm_delay, self._prewarm_next, qtile, 0)
+        qtile.call_later(self.check_interval, self._check, qtile)
+
+    def client_managed(self, qtile, window):
+        name = self.window_name(qtile, window)
+        if name is None:
+            return
+        if name in self._hide_on_map:
+            self._hide_on_map.discard(name)
+            self.pad(qtile).dropdowns[name].hide()
+            logger.info("dropdowns: prewarmed %s", name)
+        elif name in self._pending:
+            self._opened(name, cold=True)
+
+    # Commands
+    def toggle(self, qtile, name):
+        pad = self.pad(qtile)
+        self.last_used[name] = time.monotonic()
+        self._pending[name] = time.perf_counter()
+        self._hide_on_map.discard(name)
+        warm = name in pad.dropdowns
+        pad.dropdown_toggle(name)
+        if warm:
+            self._opened(name, cold=False)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            name: {
+                "last_open_ms": self.latency.get(name),
+                "idle_s": (
+                    now - self.last_used[name] if name in self.last_used else None
+                ),
+                "rss_mib": self.memory.get(name, 0) / 1024**2,
+            }
+            for name in set(self.latency) | set(self.memory) | set(self.last_used)
+        }
+
+    def _opened(self, name, cold):
+        start = self._pending.pop(name, None)
+        if start is None:
+            return
+        self.latency[name] = (time.perf_counter() - start) * 1000
+        logger.info(
+            "dropdowns: %s %s in %.0f ms",
+            name,
+            "started" if cold else "toggled",
+            self.latency[name],
+        )
+
+    def _idle(self):
+        """Whether the CPUs were mostly idle since the last call"""
+        busy, total = cpu_times()
+        last_busy, last_total = self._cpu
+        self._cpu = busy, total
+        if total <= last_total:
+            return True
+        return (busy - last_busy) / (total - last_total) <= self.max_busy
+
+    def _prewarm_next(self, qtile, i, waited=0):
+        # The previous one gets a few intervals to map before it's given up on
+        if self._hide_on_map and waited < 3:
+            waited += 1
+        elif self._idle():
+            self._prewarm(qtile, self.prewarm[i])
+            i += 1
+            waited = 0
+        if i < len(self.prewarm):
+            qtile.call_later(self.prewarm_delay, self._prewarm_next, qtile, i, waited)
+
+    def _prewarm(self, qtile, name):
+        pad = self.pad(qtile)
+        if name in pad.dropdowns:
+            return
+        # Counts as used now, or it would be the first to go
+        self.last_used.setdefault(name, time.monotonic())
+        self._hide_on_map.add(name)
+        pad.dropdown_toggle(name)
+
+    def _check(self, qtile):
+        future = qtile.run_in_executor(process_table)
+        future.add_done_callback(lambda f: self._checked(qtile, f))
+
+    def _checked(self, qtile, future):
+        try:
+            self._evict(qtile, *future.result())
+        except Exception:
+            logger.exception("dropdowns: memory check failed")
+        finally:
+            qtile.call_later(self.check_interval, self._check, qtile)
+
+    def _evict(self, qtile, children, rss):
+        dropdowns = self.pad(qtile).dropdowns
+        self.memory = {}
+        for name, toggler in dropdowns.items():
+            pid = toggler.window.get_pid()
+            if pid:
+                self.memory[name] = tree_rss(pid, children, rss)
+
+        total = sum(self.memory.values())
+        if total <= self.memory_budget:
+            return
+
+        now = time.monotonic()
+        idle = sorted(
+            (
+                name
+                for name, toggler in dropdowns.items()
+                if not toggler.visible
+                and now - self.last_used.get(name, 0) > self.min_idle
+            ),
+            key=lambda name: self.last_used.get(name, 0),
+        )
+        for name in idle:
+            if total <= self.memory_budget:
+                break
+            logger.info(
+                "dropdowns: closing %s (%.0f MiB) to stay under budget",
+                name,
+                self.memory.get(name, 0) / 1024**2,
+            )
+            total -= self.memory.pop(name, 0)
+            dropdowns[name].window.kill()
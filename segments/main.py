@@ -0,0 +1,231 @@
+# Bar separators drawn by the widgets next to them
+#
+# A "|" TextBox between every pair of widgets costs a widget each: its own
+# drawer and surface, a pango layout, and a clear + show_layout + copy to the
+# bar window on every redraw. Here the glyph is rendered once per (text, font,
+# size, colour, height) into a shared image surface, and compose() folds each
+# SEP marker in a widget list into a Separator decoration on the widget before
+# it: the widget grows by the glyph's width and paints the surface at its
+# right edge as part of its own redraw (when it clears its background, before
+# its content), a single paint call.
+#
+#     widget_list = segments.compose([SEP, widget.Clock(), SEP], foreground=...)
+#
+# A SEP with no widget before it (the start of a bar) becomes a SeparatorWidget,
+# which paints the same surface. Like any decorated widget, a widget that hides
+# itself (length 0) takes its separator with it.
+#
+#     python -m segments.main --bench     # redraw cost, TextBoxes vs decorations
+
+import functools
+
+import cairocffi
+from libqtile import bar, pangocffi
+from libqtile.utils import rgb
+from libqtile.widget import base
+from qtile_extras.widget import modify
+from qtile_extras.widget.decorations import _Decoration
+
+SEP = object()
+
+style_defaults = [
+    ("text", "|", "Separator glyph"),
+    ("font", "sans", "Font of the glyph"),
+    ("fontsize", 14, "Font size of the glyph"),
+    ("foreground", "ffffff", "Colour of the glyph"),
+    ("padding", 5, "Space either side of the glyph"),
+]
+
+
+def _layout(ctx, text, font, fontsize):
+    layout = ctx.create_layout()
+    layout.set_font_description(
+        pangocffi.FontDescription.from_string(f"{font} {fontsize}px")
+    )
+    layout.set_text(text)
+    return layout
+
+
+@functools.lru_cache(maxsize=32)
+def glyph_size(text, font, fontsize):
+    surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, 1, 1)
+    layout = _layout(
+        pangocffi.patch_cairo_context(cairocffi.Context(surface)), text, font, fontsize
+    )
+    size = layout.get_pixel_size()
+    layout.finalize()
+    return size
+
+
+@functools.lru_cache(maxsize=32)
+def glyph(text, font, fontsize, colour, height, padding):
+    """(surface, width) with text laid out as a TextBox in a bar that high"""
+    text_width, text_height = glyph_size(text, font, fontsize)
+    width = text_width + 2 * padding
+    surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, height)
+    ctx = pangocffi.patch_cairo_context(cairocffi.Context(surface))
+    layout = _layout(ctx, text, font, fontsize)
+    ctx.set_source_rgba(*rgb(colour))
+    ctx.move_to(padding, int(height / 2 - text_height / 2) + 1)
+    ctx.show_layout(layout)
+    layout.finalize()
+    surface.flush()
+    return surface, width
+
+
+class Separator(_Decoration):
+    """Decoration painting the glyph in the extra width at its widget's right edge
+
+    Decorations are drawn inside drawer.clear, before the widget's content, so
+    this relies on the content staying within the widget's own length.
+    """
+
+    defaults = style_defaults
+
+    def __init__(self, **config):
+        _Decoration.__init__(self, **config)
+        self.add_defaults(Separator.defaults)
+        # The widget's length is read before anything is drawn
+        self._extrawidth = glyph_size(self.text, self.font, self.fontsize)[0]
+        self._extrawidth += 2 * self.padding
+
+    def draw(self):
+        surface, width = glyph(
+            self.text,
+            self.font,
+            self.fontsize,
+            self.foreground,
+            self.height,
+            self.padding,
+        )
+        self.ctx.save()
+        self.ctx.set_source_surface(surface, self.parent.length - width, 0)
+        self.ctx.paint()
+        self.ctx.restore()
+
+
+class SeparatorWidget(base._Widget):
+    """The glyph on its own, for the start of a bar"""
+
+    defaults = style_defaults
+
+    def __init__(self, **config):
+        base._Widget.__init__(self, bar.CALCULATED, **config)
+        self.add_defaults(SeparatorWidget.defaults)
+
+    def calculate_length(self):
+        return glyph_size(self.text, self.font, self.fontsize)[0] + 2 * self.padding
+
+    def draw(self):
+        surface, width = glyph(
+            self.text,
+            self.font,
+            self.fontsize,
+            self.foreground,
+            self.bar.height,
+            self.padding,
+        )
+        self.drawer.clear(self.background or self.bar.background)
+        self.drawer.ctx.set_source_surface(surface, 0, 0)
+        self.drawer.ctx.paint()
+        self.drawer.draw(offsetx=self.offsetx, offsety=self.offsety, width=width)
+
+
+def compose(items, **style):
+    """Bar widget list with every SEP folded into the widget before it"""
+    widgets = []
+    for item in items:
+        if item is not SEP:
+            widgets.append(item)
+            continue
+        previous = widgets[-1] if widgets else None
+        if previous is None or isinstance(previous, SeparatorWidget):
+            widgets.append(SeparatorWidget(**style))
+            continue
+        # Gives the class qtile_extras' decoration support, as its own
+        # widget classes have
+        modify(type(previous), initialise=False)
+        previous.decorations = [
+            *getattr(previous, "decorations", []),
+            Separator(**style),
+        ]
+    return widgets
+
+
+def bench(separators, iterations, height):
+    """Time one bar refresh's worth of separator drawing, both ways"""
+    import statistics
+    import time
+
+    font, fontsize, padding, colour = "sans", 14, 5, "ffffff"
+    bar_surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, 2560, height)
+    bar_ctx = cairocffi.Context(bar_surface)
+
+    # What a TextBox does on draw(): its own surface, cleared, the layout
+    # shown and the result copied to the bar
+    boxes = []
+    for _ in range(separators):
+        surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, 40, height)
+        ctx = pangocffi.patch_cairo_context(cairocffi.Context(surface))
+        layout = ctx.create_layout()
+        layout.set_font_description(
+            pangocffi.FontDescription.from_string(f"{font} {fontsize}px")
+        )
+        layout.set_text("|")
+        boxes.append((surface, ctx, layout))
+
+    def textboxes():
+        for x, (surface, ctx, layout) in enumerate(boxes):
+            ctx.save()
+            ctx.set_operator(cairocffi.OPERATOR_SOURCE)
+            ctx.set_source_rgba(0, 0, 0, 0.5)
+            ctx.rectangle(0, 0, 40, height)
+            ctx.fill()
+            ctx.restore()
+            ctx.set_source_rgba(*rgb(colour))
+            ctx.move_to(padding, 4)
+            ctx.show_layout(layout)
+            bar_ctx.set_source_surface(surface, x * 40, 0)
+            bar_ctx.paint()
+
+    # The neighbouring widget is redrawn anyway, it only gains a paint
+    neighbour = cairocffi.Context(
+        cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, 200, height)
+    )
+
+    def decorations():
+        surface, width = glyph("|", font, fontsize, colour, height, padding)
+        for _ in range(separators):
+            neighbour.set_source_surface(surface, 200 - width, 0)
+            neighbour.paint()
+
+    print(f"{separators} separators, {iterations} bar refreshes")
+    print(f"{'path':<14}{'widgets':>9}{'draws':>7}{'mean µs':>10}{'p99 µs':>10}")
+    # draws: fill, show_layout and paint per TextBox, one paint per decoration
+    for name, draw, widgets, draws in (
+        ("TextBox", textboxes, separators, 3 * separators),
+        ("decoration", decorations, 0, separators),
+    ):
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter_ns()
+            draw()
+            bar_surface.flush()
+            samples.append(time.perf_counter_ns() - start)
+        samples.sort()
+        print(
+            f"{name:<14}{widgets:>9}{draws:>7}{statistics.fmean(samples) / 1000:>10.0f}"
+            f"{samples[int(len(samples) * 0.99)] / 1000:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Separator redraw cost")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--separators", type=int, default=25)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--height", type=int, default=24)
+    args = parser.parse_args()
+    bench(args.separators, args.iterations, args.height)
@@ -0,0 +1,234 @@
+# Session snapshot and restore
+#
+# Keeps where every window lives (group, floating geometry, sticky) and each
+# group's layout state in an append-only log, one compact JSON array per
+# line:
+#
+#     ["w", id, app, title, pid, group, floating, x, y, width, height, sticky]
+#     ["d", id]
+#     ["g", group, layout, ratio]
+#
+# A window's id is "<session>:<wid>", the session part new for every qtile
+# run: wids start from 1 again after a restart, and a saved window must not
+# be mistaken for (or deleted along with) a new one that got its old wid.
+#
+# Changes are appended as they happen (debounced), and the log is compacted
+# to the current state whenever it is loaded. On startup every window that
+# maps is matched against the snapshot through dicts keyed on (pid, app),
+# (app, title) and app, so restoring stays O(1) per window no matter how many
+# windows were saved.
+
+import json
+import os
+import uuid
+from collections import deque
+
+import windowing.main as windowing
+
+WINDOW = "w"
+DELETE = "d"
+GROUP = "g"
+
+
+def window_record(window, id):
+    wm_class = window.get_wm_class() or [""]
+    return [
+        WINDOW,
+        id,
+        wm_class[0],
+        window.name or "",
+        window.get_pid() or 0,
+        window.group.name if window.group else None,
+        bool(window.floating),
+        window.x,
+        window.y,
+        window.width,
+        window.height,
+        window in windowing.sticky_windows,
+    ]
+
+
+def group_record(group):
+    layout = group.layout
+    return [GROUP, group.name, layout.name, getattr(layout, "ratio", None)]
+
+
+def load(path):
+    """Fold the log into ({id: window record}, {group: group record})"""
+    windows, groups = {}, {}
+    try:
+        f = open(path)
+    except FileNotFoundError:
+        return windows, groups
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn write from a crash
+            if record[0] == WINDOW:
+                windows[record[1]] = record
+            elif record[0] == DELETE:
+                windows.pop(record[1], None)
+            elif record[0] == GROUP:
+                groups[record[1]] = record
+    return windows, groups
+
+
+class Index:
+    """Match new windows to saved records, each record is used at most once"""
+
+    def __init__(self, records):
+        self.claimed = set()
+        self.by_pid = {}
+        self.by_title = {}
+        self.by_app = {}
+        for i, record in enumerate(records):
+            _, _, app, title, pid, *_ = record
+            self.by_pid.setdefault((pid, app), deque()).append(i)
+            self.by_title.setdefault((app, title), deque()).append(i)
+            self.by_app.setdefault(app, deque()).append(i)
+        self.records = records
+
+    def _take(self, table, key):
+        candidates = table.get(key)
+        while candidates:
+            i = candidates.popleft()
+            if i not in self.claimed:
+                self.claimed.add(i)
+                return self.records[i]
+        return None
+
+    def match(self, app, title, pid):
+        return (
+            self._take(self.by_pid, (pid, app))
+            or self._take(self.by_title, (app, title))
+            or self._take(self.by_app, app)
+        )
+
+    def __len__(self):
+        return len(self.records) - len(self.claimed)
+
+
+class Session:
+    def __init__(self, path, flush_delay=2, skip_groups=()):
+        self.path = path
+        self.id = uuid.uuid4().hex[:12]
+        self.flush_delay = flush_delay
+        self.skip_groups = set(skip_groups)
+        self.index = Index([])
+        self.groups = {}
+        self.written = {}
+        self.dirty = set()
+        self.deleted = set()
+        self.restored = set()
+        self.fd = None
+        self._flush_pending = False
+
+    def load(self):
+        windows, self.groups = load(self.path)
+        self.index = Index(list(windows.values()))
+        # Saved windows stay in the log until they are matched or forgotten,
+        # so a crash during startup doesn't lose them
+        self._compact([*windows.values(), *self.groups.values()])
+
+    def window_id(self, window):
+        return f"{self.id}:{window.wid}"
+
+    def _compact(self, records):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        os.replace(tmp, self.path)
+        self.written = {}
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+
+    # Restore
+    def restore_groups(self, qtile):
+        for group in qtile.groups:
+            record = self.groups.get(group.name)
+            if record is None:
+                continue
+            _, _, layout, ratio = record
+            if group.layout.name != layout:
+                group.setlayout(layout)
+            if ratio is not None and hasattr(group.layout, "ratio"):
+                group.layout.ratio = ratio
+            if group.screen is not None:
+                group.layout_all()
+
+    def restore_window(self, qtile, window):
+        if window.wid in self.restored or not len(self.index):
+            return
+        # ScratchPad windows are placed by their DropDown, not by us
+        if window.group is not None and window.group.name in self.skip_groups:
+            return
+        wm_class = window.get_wm_class() or [""]
+        record = self.index.match(wm_class[0], window.name or "", window.get_pid() or 0)
+        if record is None:
+            return
+        self.restored.add(window.wid)
+        _, saved_id, _, _, _, group, floating, x, y, width, height, sticky = record
+        self.deleted.add(saved_id)
+        self.changed(qtile, window)
+        if (
+            group in qtile.groups_map
+            and group not in self.skip_groups
+            and (window.group is None or window.group.name != group)
+        ):
+            window.togroup(group)
+        if floating:
+            window.set_position_floating(x, y)
+            window.set_size_floating(width, height)
+        if sticky and window not in windowing.sticky_windows:
+            windowing.sticky_windows.append(window)
+
+    def forget_unmatched(self, qtile):
+        """Drop saved windows that never came back"""
+        for i, record in enumerate(self.index.records):
+            if i not in self.index.claimed:
+                self.deleted.add(record[1])
+        self.index = Index([])
+        self.changed(qtile)
+
+    # Snapshot
+    def changed(self, qtile, window=None):
+        if window is not None:
+            self.dirty.add(window)
+        if not self._flush_pending:
+            self._flush_pending = True
+            qtile.call_later(self.flush_delay, self.flush, qtile)
+
+    def removed(self, qtile, window):
+        self.dirty.discard(window)
+        self.deleted.add(self.window_id(window))
+        self.changed(qtile)
+
+    def flush(self, qtile):
+        self._flush_pending = False
+        records = [[DELETE, id] for id in self.deleted]
+        for id in self.deleted:
+            self.written.pop((WINDOW, id), None)
+        self.deleted.clear()
+
+        for window in self.dirty:
+            if window.group is not None and window.group.name not in self.skip_groups:
+                records.append(window_record(window, self.window_id(window)))
+        self.dirty.clear()
+
+        for group in qtile.groups:
+            if group.layout is not None:
+                records.append(group_record(group))
+
+        # Only append what actually differs from what's already on disk
+        new = []
+        for r in records:
+            if r[0] == DELETE or self.written.get((r[0], r[1])) != r:
+                new.append(r)
+                if r[0] != DELETE:
+                    self.written[(r[0], r[1])] = r
+        if new and self.fd is not None:
+            data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in new)
+            os.write(self.fd, data.encode())
@@ -0,0 +1,375 @@
+# Offline harness for the window logic in windowing/main.py
+#
+# Builds a fake qtile (groups, screens, windows) that behaves closely enough
+# to the real one for the custom window functions, then times them over a
+# scripted scenario:
+#
+#     python -m simulation.main --windows 500 --sticky 20 --iterations 200
+
+import argparse
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+
+import placement.main as placement
+import windowing.main as windowing
+
+GROUPS = (
+    ("1", 0),
+    ("2", 0),
+    ("3", 0),
+    ("4", 0),
+    ("5", 0),
+    ("11", 1),
+    ("12", 1),
+    ("13", 1),
+)
+
+APPS = (
+    ("firefox", "Mozilla Firefox"),
+    ("com.mitchellh.ghostty", "ghostty"),
+    ("thunar", "Thunar"),
+    ("thunderbird", "Thunderbird"),
+    ("zulip", "Zulip"),
+    ("libreoffice-writer", "LibreOffice Writer"),
+    ("teams-for-linux", "Microsoft Teams"),
+    ("obsidian", "Obsidian"),
+)
+
+_wids = itertools.count(1)
+
+
+class FakeWindow:
+    def __init__(self, qtile, wm_class, name, floating=False, pid=None):
+        self.qtile = qtile
+        self.wid = next(_wids)
+        self.wm_class = wm_class
+        self.name = name
+        self.pid = pid if pid is not None else 1000 + self.wid
+        self.floating = floating
+        self.group = None
+        self.layer = 0
+        self.x = self.y = 0
+        self.width, self.height = 800, 600
+
+    def __repr__(self):
+        return f"<FakeWindow {self.wid} {self.wm_class}>"
+
+    def info(self):
+        return {
+            "id": self.wid,
+            "name": self.name,
+            "wm_class": [self.wm_class],
+            "floating": self.floating,
+            "group": self.group.name if self.group else None,
+        }
+
+    def get_pid(self):
+        return self.pid
+
+    def get_wm_class(self):
+        return [self.wm_class]
+
+    def togroup(self, group_name=None, switch_group=False):
+        if group_name is None:
+            group = self.qtile.current_group
+        else:
+            group = self.qtile.groups_map[group_name]
+        if group is self.group:
+            return
+        if self.group is not None:
+            self.group.remove(self)
+        group.add(self)
+        if switch_group:
+            group.toscreen()
+
+    def bring_to_front(self):
+        self.layer = self.qtile.next_layer()
+
+    def change_layer(self, up=True):
+        self.layer += 1 if up else -1
+
+    def set_position_floating(self, x, y):
+        self.floating = True
+        self.x, self.y = x, y
+
+    def set_size_floating(self, w, h):
+        self.floating = True
+        self.width, self.height = w, h
+
+    def kill(self):
+        if self.group is not None:
+            self.group.remove(self)
+        self.qtile.fire("client_killed", self)
+
+
+class FakeGroup:
+    def __init__(self, qtile, name, screen_affinity=None):
+        self.qtile = qtile
+        self.name = name
+        self.screen_affinity = screen_affinity
+        self.windows = []
+        self.current_window = None
+        self.screen = None
+        self._focus_history = []
+
+    def __repr__(self):
+        return f"<FakeGroup {self.name}>"
+
+    def add(self, window):
+        window.group = self
+        self.windows.append(window)
+        self.focus(window)
+
+    def remove(self, window):
+        self.windows.remove(window)
+        window.group = None
+        if window in self._focus_history:
+            self._focus_history.remove(window)
+        if self.current_window is window:
+            self.current_window = (
+                self._focus_history[-1] if self._focus_history else None
+            )
+
+    def focus(self, window):
+        if window is None:
+            return
+        if self.current_window is not None:
+            self._focus_history.append(self.current_window)
+            del self._focus_history[:-16]
+        self.current_window = window
+
+    def _step(self, offset):
+        if not self.windows:
+            return
+        if self.current_window is None:
+            self.focus(self.windows[0])
+            return
+        i = self.windows.index(self.current_window)
+        self.focus(self.windows[(i + offset) % len(self.windows)])
+
+    def next_window(self):
+        self._step(1)
+
+    def previous_window(self):
+        self._step(-1)
+
+    def focus_back(self):
+        if self._focus_history:
+            self.current_window = self._focus_history.pop()
+
+    def toscreen(self, screen=None):
+        screen = screen or self.qtile.current_screen
+        screen.set_group(self)
+
+
+class FakeScreen:
+    def __init__(self, qtile, index):
+        self.qtile = qtile
+        self.index = index
+        self.group = None
+        self.previous_group = None
+
+    def set_group(self, group):
+        if group is self.group:
+            return
+        old, other = self.group, group.screen
+        if other is not None:
+            # Swap, the same way qtile does when the group is shown elsewhere
+            other.group = old
+            if old is not None:
+                old.screen = other
+        elif old is not None:
+            old.screen = None
+        self.previous_group, self.group = old, group
+        group.screen = self
+        self.qtile.fire("setgroup")
+
+    def _cycle(self, offset):
+        groups = self.qtile.groups
+        i = groups.index(self.group)
+        self.set_group(groups[(i + offset) % len(groups)])
+
+    def next_group(self):
+        self._cycle(1)
+
+    def prev_group(self):
+        self._cycle(-1)
+
+    def toggle_group(self):
+        if self.previous_group is not None:
+            self.set_group(self.previous_group)
+
+
+class FakeQtile:
+    def __init__(self, screens=2, groups=GROUPS):
+        self.groups = [FakeGroup(self, name, affinity) for name, affinity in groups]
+        self.groups_map = {g.name: g for g in self.groups}
+        self.screens = [FakeScreen(self, i) for i in range(screens)]
+        self.current_screen = self.screens[0]
+        self._layer = 0
+        self._hooks = {}
+        for screen in self.screens:
+            for group in self.groups:
+                if group.screen is None and (
+                    group.screen_affinity in (None, screen.index) or screens == 1
+                ):
+                    screen.group, group.screen = group, screen
+                    break
+
+    @property
+    def current_group(self):
+        return self.current_screen.group
+
+    @property
+    def current_window(self):
+        return self.current_group.current_window
+
+    @property
+    def windows_map(self):
+        return {w.wid: w for g in self.groups for w in g.windows}
+
+    def focus_screen(self, index):
+        self.current_screen = self.screens[index]
+
+    def next_layer(self):
+        self._layer += 1
+        return self._layer
+
+    def subscribe(self, event, func):
+        self._hooks.setdefault(event, []).append(func)
+
+    def fire(self, event, *args):
+        for func in self._hooks.get(event, ()):
+            func(*args)
+
+    def map_window(self, window, group_name=None):
+        window.togroup(group_name)
+        self.fire("client_managed", window)
+        return window
+
+
+def populate(qtile, windows=500, sticky=20, seed=0):
+    """Spread `windows` windows over the groups, `sticky` of them sticky"""
+    rng = random.Random(seed)
+    windowing.sticky_windows.clear()
+    created = []
+    for i in range(windows):
+        wm_class, name = APPS[i % len(APPS)]
+        group = qtile.groups[i % len(qtile.groups)]
+        win = FakeWindow(qtile, wm_class, f"{name} {i}", floating=rng.random() < 0.1)
+        created.append(qtile.map_window(win, group.name))
+    for win in rng.sample(created, min(sticky, len(created))):
+        windowing.toggle_sticky_windows(qtile, win)
+    return created
+
+
+def simulated_qtile(windows=500, sticky=20, screens=2, seed=0):
+    """A fake qtile wired up like config.py wires the real one"""
+    qtile = FakeQtile(screens=screens)
+    qtile.subscribe("setgroup", lambda: windowing.move_sticky_windows(qtile))
+    qtile.subscribe("client_killed", windowing.remove_sticky_windows)
+    populate(qtile, windows, sticky, seed)
+    return qtile
+
+
+def operations(qtile):
+    """The scripted scenario: (name, callable) pairs run round-robin"""
+    names = [g.name for g in qtile.groups]
+    targets = itertools.cycle(names)
+    group_switch = {name: windowing.go_to_group(name) for name in names}
+
+    def go_to_next():
+        group_switch[next(targets)](qtile)
+
+    sections = placement.PlacementRules(placement.SECTION_RULES)
+
+    def sort_current():
+        for win in qtile.current_group.windows:
+            sections.section(win)
+
+    def toggle_current_sticky():
+        windowing.toggle_sticky_windows(qtile)
+        windowing.toggle_sticky_windows(qtile)
+
+    def next_then_prev():
+        windowing.window_to_next_group(qtile)
+        windowing.window_to_prev_group(qtile)
+
+    return [
+        ("cycle_windows", lambda: windowing.cycle_windows(qtile.current_group)),
+        ("window_to_next_group", next_then_prev),
+        ("float_to_front", lambda: windowing.float_to_front(qtile)),
+        ("toggle_sticky_windows", toggle_current_sticky),
+        ("move_sticky_windows", lambda: windowing.move_sticky_windows(qtile)),
+        ("go_to_group", go_to_next),
+        ("section", sort_current),
+    ]
+
+
+def measure(func, iterations):
+    """Return (latencies in ns, peak bytes per call, net blocks per call)"""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        func()
+        latencies.append(time.perf_counter_ns() - start)
+
+    # Allocation pass is separate so tracemalloc overhead doesn't skew timing
+    peaks = []
+    tracemalloc.start()
+    try:
+        before = sum(
+            s.count for s in tracemalloc.take_snapshot().statistics("filename")
+        )
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - current)
+        after = sum(s.count for s in tracemalloc.take_snapshot().statistics("filename"))
+    finally:
+        tracemalloc.stop()
+    return latencies, peaks, (after - before) / iterations
+
+
+def run(windows=500, sticky=20, screens=2, iterations=200, seed=0):
+    qtile = simulated_qtile(windows, sticky, screens, seed)
+    results = {}
+    for name, func in operations(qtile):
+        latencies, peaks, blocks = measure(func, iterations)
+        latencies.sort()
+        results[name] = {
+            "mean_us": statistics.fmean(latencies) / 1000,
+            "p50_us": latencies[len(latencies) // 2] / 1000,
+            "p99_us": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            / 1000,
+            "peak_kib": max(peaks) / 1024,
+            "net_blocks": blocks,
+        }
+    return results
+
+
+def report(results):
+    print(
+        f"{'operation':<24}{'mean µs':>10}{'p50 µs':>10}{'p99 µs':>10}{'peak KiB':>10}{'blocks':>8}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:<24}{r['mean_us']:>10.1f}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}"
+            f"{r['peak_kib']:>10.1f}{r['net_blocks']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the window logic offline")
+    parser.add_argument("--windows", type=int, default=500)
+    parser.add_argument("--sticky", type=int, default=20)
+    parser.add_argument("--screens", type=int, default=2)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    report(run(args.windows, args.sticky, args.screens, args.iterations, args.seed))
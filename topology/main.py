@@ -0,0 +1,153 @@
+# Screens per output, kept across hotplug instead of rebuilt
+#
+# qtile hands config.screens out by index, and finalizes the bars of a screen
+# whose output went away, so an output that comes back gets a bare Screen (or
+# the config builds the bars, their widgets and pollers all over again), and
+# after docking the laptop's bars can end up on the external monitor.
+#
+# The manager keeps a pool of Screens, each built once by the config's
+# builders and keyed by (output identity, role), where the role is the
+# output's position among those present: 0 gets the main bars, 1 the second
+# screen's, and so on. On a screen change it reorders config.screens to match
+# the outputs present and lets qtile reconfigure; a screen whose output left
+# has its bar windows hidden rather than finalized, and shown again, widgets
+# and all, when its output returns. A full config reload empties the pool. Groups are then shown on the screen of
+# their screen_affinity (see windowing.remap_groups).
+#
+# For an incremental reload, preview() builds throwaway Screens from the new
+# builders to diff against; pooled screens of absent outputs keep what they
+# were built with until a full reload.
+#
+# Dock/undock reconfiguration times and built/reused counts go in stats().
+
+import time
+
+from libqtile.config import Screen
+from libqtile.log_utils import logger
+
+import windowing.main as windowing
+
+
+def identity(output):
+    """Stable name of a wlroots output: make, model and serial, else connector"""
+    wlr_output = output.wlr_output
+    parts = [p for p in (wlr_output.make, wlr_output.model, wlr_output.serial) if p]
+    return " ".join(parts) or wlr_output.name
+
+
+class ScreenManager:
+    def __init__(self, builders):
+        # builders[role]() -> Screen, the last one is used for any further roles
+        self.builders = builders
+        self.pool = {}  # (identity, role) -> Screen
+        self.screens = []  # the list given to qtile as config.screens
+        self.parked = set()
+        self.reconfiguring = False
+        self.built = 0
+        self.reused = 0
+        self.timings = {"dock": [], "undock": [], "change": []}
+
+    def outputs(self, qtile):
+        """Identities of the outputs qtile will make screens of, in its order"""
+        core = qtile.core
+        if not hasattr(core, "get_screen_info"):
+            # No backend yet (qtile check, docs): one screen per builder
+            return [None] * len(self.builders)
+        if not hasattr(core, "get_enabled_outputs"):
+            # X11: no names to go by, the geometry will have to do
+            return [f"{s.x},{s.y} {s.width}x{s.height}" for s in core.get_screen_info()]
+        # qtile aliases outputs at the same position, the first one wins
+        seen = {}
+        for output in core.get_enabled_outputs():
+            info = output.get_screen_info()
+            seen.setdefault((info.x, info.y), identity(output))
+        return list(seen.values())
+
+    def initial(self, qtile):
+        """config.screens for the outputs present at config load"""
+        self.screens[:] = self._screens_for(self.outputs(qtile))
+        return self.screens
+
+    def preview(self, builders):
+        """Screens from these builders for the roles in use, neither pooled nor shown"""
+        return [
+            builders[min(screen.role, len(builders) - 1)]() for screen in self.screens
+        ]
+
+    def _screens_for(self, identities):
+        screens = []
+        for role, name in enumerate(identities):
+            key = (name, role)
+            screen = self.pool.get(key)
+            if screen is None:
+                builder = self.builders[min(role, len(self.builders) - 1)]
+                screen = self.pool[key] = builder()
+                screen.finalize_gaps = self._finalizer(screen)
+                self.built += 1
+            elif screen in self.parked:
+                self.reused += 1
+            screen.role = role
+            screens.append(screen)
+        return screens
+
+    def _finalizer(self, screen):
+        def finalize_gaps():
+            if self.reconfiguring:
+                # Its output went away, keep the bars for when it's back
+                for gap in screen.gaps:
+                    if getattr(gap, "window", None) is not None:
+                        gap.window.hide()
+                self.parked.add(screen)
+                return
+            # Config reload or shutdown: everything goes, parked ones too, and
+            # the config builds new ones
+            Screen.finalize_gaps(screen)
+            for parked in self.parked - {screen}:
+                Screen.finalize_gaps(parked)
+            self.parked.clear()
+            self.pool.clear()
+
+        return finalize_gaps
+
+    def reconfigure(self, qtile):
+        """screen_change handler, in place of reconfigure_screens = True"""
+        start = time.perf_counter_ns()
+        before = len(qtile.screens)
+        self.screens[:] = self._screens_for(self.outputs(qtile))
+        self.reconfiguring = True
+        try:
+            qtile.reconfigure_screens()
+        finally:
+            self.reconfiguring = False
+        for screen in self.screens:
+            if screen in self.parked:
+                self.parked.discard(screen)
+                for gap in screen.gaps:
+                    if getattr(gap, "window", None) is not None:
+                        gap.window.unhide()
+                        gap.draw()
+        windowing.remap_groups(qtile, [s.role for s in qtile.screens])
+        elapsed = time.perf_counter_ns() - start
+        after = len(qtile.screens)
+        kind = "dock" if after > before else "undock" if after < before else "change"
+        self.timings[kind].append(elapsed)
+        logger.info(
+            "topology: %s, %d -> %d screens in %.1f ms",
+            kind,
+            before,
+            after,
+            elapsed / 1e6,
+        )
+
+    def stats(self):
+        lines = [
+            f"{len(self.pool)} screens pooled, {self.built} built, "
+            f"{self.reused} re-attached, {len(self.parked)} parked"
+        ]
+        for kind, samples in self.timings.items():
+            if samples:
+                lines.append(
+                    f"{kind}: {len(samples)}x, mean {sum(samples) / len(samples) / 1e6:.1f} ms, "
+                    f"max {max(samples) / 1e6:.1f} ms"
+                )
+        return "\n".join(lines)
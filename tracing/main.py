@@ -0,0 +1,247 @@
+# Event trace recorder and replayer
+#
+# With QTILE_TRACE=1 in qtile's environment, config.py records group
+# switches, window maps/kills/focus and key presses to an append-only binary
+# log. The replayer feeds a log back through the window logic against the
+# fake qtile from simulation/main.py and times every event, so a hitch can
+# be reproduced offline:
+#
+#     python -m tracing.main replay ~/.cache/qtile/events.trace
+#     python -m tracing.main dump ~/.cache/qtile/events.trace
+#
+# File layout: the 4 byte magic, then records of
+#     monotonic ns (u64) | event (u8) | payload length (u16) | payload
+# Payload fields are utf-8 joined by \x1f.
+
+import os
+import struct
+import time
+
+MAGIC = b"QTR1"
+RECORD = struct.Struct("<QBH")
+SEP = "\x1f"
+MAX_SIZE = 16 * 1024 * 1024
+
+KEY = 1
+GROUP = 2
+MAP = 3
+KILL = 4
+FOCUS = 5
+SCREEN = 6
+
+EVENT_NAMES = {
+    KEY: "key",
+    GROUP: "setgroup",
+    MAP: "client_managed",
+    KILL: "client_killed",
+    FOCUS: "client_focus",
+    SCREEN: "screen_change",
+}
+
+
+class Recorder:
+    def __init__(self, path, max_size=MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.fd = None
+        self.size = 0
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_size:
+            os.replace(self.path, self.path + ".1")
+        # O_APPEND keeps every record a single atomic write, so a crash can
+        # at worst lose the event being written, never corrupt earlier ones
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self.size = os.fstat(self.fd).st_size
+        if self.size == 0:
+            self.size = os.write(self.fd, MAGIC)
+
+    def record(self, event, *fields):
+        if self.fd is None:
+            self.open()
+        elif self.size > self.max_size:
+            # A long session: start a new log, keeping the last one as .1
+            self.close()
+            self.open()
+        payload = SEP.join(str(f) for f in fields).encode()[:0xFFFF]
+        record = RECORD.pack(time.monotonic_ns(), event, len(payload)) + payload
+        self.size += os.write(self.fd, record)
+
+    def key(self, spec):
+        self.record(KEY, spec)
+
+    def group(self, name):
+        self.record(GROUP, name)
+
+    def window_mapped(self, window):
+        wm_class = window.get_wm_class() or [""]
+        self.record(MAP, window.wid, wm_class[0], window.name or "")
+
+    def window_killed(self, window):
+        self.record(KILL, window.wid)
+
+    def window_focused(self, window):
+        self.record(FOCUS, window.wid)
+
+    def screens_changed(self, count):
+        self.record(SCREEN, count)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def key_spec(modifiers, key):
+    return "+".join(sorted(modifiers) + [key])
+
+
+def read(path):
+    """Yield (timestamp ns, event, fields) from a trace file"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not an event trace")
+    offset = len(MAGIC)
+    while offset + RECORD.size <= len(data):
+        ts, event, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break  # Torn final record
+        fields = data[offset : offset + length].decode(errors="replace").split(SEP)
+        offset += length
+        yield ts, event, fields
+
+
+# Replay
+def key_actions():
+    """Map recorded key specs to the window logic they trigger in config.py"""
+    import placement.main as placement
+    import windowing.main as windowing
+
+    sections = placement.PlacementRules(placement.SECTION_RULES)
+    mod, ctrl, shift = "mod4", "control", "shift"
+    actions = {
+        key_spec([mod, shift], "Tab"): lambda q: windowing.cycle_windows(
+            q.current_group
+        ),
+        key_spec([mod, shift], "Page_Up"): windowing.window_to_next_group,
+        key_spec([mod, shift], "Page_Down"): windowing.window_to_prev_group,
+        key_spec([mod], "d"): windowing.float_to_front,
+        key_spec([mod, shift], "f"): windowing.toggle_sticky_windows,
+        key_spec(["mod1"], "r"): lambda q: [
+            sections.section(w) for w in q.current_group.windows
+        ],
+        key_spec([mod], "Tab"): lambda q: q.current_screen.toggle_group(),
+    }
+    for name in "12345":
+        actions[key_spec([mod], name)] = windowing.go_to_group(name)
+    for name in "123":
+        actions[key_spec([mod, ctrl], name)] = windowing.go_to_group("1" + name)
+    return actions
+
+
+def replay(path, screens=2):
+    """Run a trace through the window logic and return per-event timings"""
+    from simulation.main import FakeWindow, simulated_qtile
+
+    qtile = simulated_qtile(windows=0, sticky=0, screens=screens)
+    actions = key_actions()
+    windows = {}
+
+    def on_group(name):
+        group = qtile.groups_map.get(name)
+        if group is not None:
+            group.toscreen()
+
+    def on_map(wid, wm_class="", name=""):
+        win = FakeWindow(qtile, wm_class, name)
+        windows[wid] = qtile.map_window(win)
+
+    def on_kill(wid):
+        win = windows.pop(wid, None)
+        if win is not None:
+            win.kill()
+
+    def on_focus(wid):
+        win = windows.get(wid)
+        if win is not None and win.group is not None:
+            win.group.focus(win)
+
+    def on_key(spec):
+        action = actions.get(spec)
+        if action is not None:
+            action(qtile)
+
+    handlers = {
+        KEY: on_key,
+        GROUP: on_group,
+        MAP: on_map,
+        KILL: on_kill,
+        FOCUS: on_focus,
+        SCREEN: lambda count: None,
+    }
+
+    timings = []
+    for ts, event, fields in read(path):
+        handler = handlers.get(event)
+        if handler is None:
+            continue
+        start = time.perf_counter_ns()
+        handler(*fields)
+        timings.append((ts, event, fields, time.perf_counter_ns() - start))
+    return timings
+
+
+def report(timings, slowest=10):
+    import statistics
+
+    by_event = {}
+    for _, event, _, ns in timings:
+        by_event.setdefault(event, []).append(ns)
+
+    print(f"{'event':<16}{'count':>8}{'mean µs':>10}{'p99 µs':>10}{'max µs':>10}")
+    for event, values in sorted(by_event.items()):
+        values.sort()
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+        print(
+            f"{EVENT_NAMES[event]:<16}{len(values):>8}"
+            f"{statistics.fmean(values) / 1000:>10.1f}{p99 / 1000:>10.1f}{values[-1] / 1000:>10.1f}"
+        )
+
+    if timings:
+        start = timings[0][0]
+        print(f"\nslowest {slowest}:")
+        for ts, event, fields, ns in sorted(timings, key=lambda t: -t[3])[:slowest]:
+            print(
+                f"  +{(ts - start) / 1e9:>9.3f}s {EVENT_NAMES[event]:<16}"
+                f"{' '.join(fields):<40.40} {ns / 1000:.1f} µs"
+            )
+
+
+def dump(path):
+    start = None
+    for ts, event, fields in read(path):
+        start = ts if start is None else start
+        print(
+            f"+{(ts - start) / 1e9:>9.3f}s {EVENT_NAMES.get(event, event):<16}{' '.join(fields)}"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Inspect or replay a qtile event trace"
+    )
+    parser.add_argument("command", choices=["replay", "dump"])
+    parser.add_argument(
+        "path", nargs="?", default=os.path.expanduser("~/.cache/qtile/events.trace")
+    )
+    parser.add_argument("--screens", type=int, default=2)
+    args = parser.parse_args()
+    if args.command == "dump":
+        dump(args.path)
+    else:
+        report(replay(args.path, args.screens))
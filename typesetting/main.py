@@ -0,0 +1,274 @@
+# Shaped text layouts shared between text widgets
+#
+# TaskList sizes every title with a throwaway layout on each bar draw, then
+# sets each title (and its truncated width) on its one layout in turn, so
+# every focus or title change re-shapes every title on the bar. GroupBox does
+# the same per group label, and Clock/TextBox re-shape on every update even
+# when the text comes round again.
+#
+# Here a pango layout is kept per (text, markup, font, size, width, wrap):
+#   - widgets of the classes given to install() get a CachedTextLayout whose
+#     text, width and font setters swap in the matching shaped layout, laying
+#     it out only on a miss
+#   - those widgets' drawers read max_layout_size from the same layouts,
+#     other drawers (popups, other widgets) are left as they are
+#   - entries are evicted least recently used first once their estimated size
+#     passes max_bytes; a widget still holding an evicted layout keeps it alive
+#     until it moves on (pango layouts are freed by refcount)
+#
+#     python -m typesetting.main --bench     # title churn, TaskList style
+
+import collections
+
+import cairocffi
+from libqtile import pangocffi, utils
+from libqtile.backend.base import drawer
+from libqtile.log_utils import logger
+
+# Rough cost of a shaped single line layout: the PangoLayout and its line,
+# and per character the text, a glyph and its log cluster
+LAYOUT_BYTES = 2048
+CHAR_BYTES = 40
+
+
+class LayoutCache:
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()  # key -> (layout, cost)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Layouts only need a context for its font options, one will do
+        self._ctx = pangocffi.patch_cairo_context(
+            cairocffi.Context(cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, 1, 1))
+        )
+
+    def layout(self, text, markup, family, size, width, wrap):
+        key = (text, markup, family, size, width, wrap)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+        self.misses += 1
+        layout = self._build(text, markup, family, size, width, wrap)
+        cost = LAYOUT_BYTES + CHAR_BYTES * len(text)
+        self.entries[key] = (layout, cost)
+        self.bytes += cost
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+        return layout
+
+    def _build(self, text, markup, family, size, width, wrap):
+        # As TextLayout's constructor and setters would set it up
+        layout = self._ctx.create_layout()
+        layout.set_alignment(pangocffi.ALIGN_CENTER)
+        if not wrap:
+            layout.set_ellipsize(pangocffi.ELLIPSIZE_END)
+        layout.set_font_description(
+            pangocffi.FontDescription.from_string(f"{family} {size}px")
+        )
+        if markup:
+            try:
+                attrs, text, _ = pangocffi.parse_markup(text or "")
+                layout.set_attributes(attrs)
+            except pangocffi.BadMarkup as e:
+                logger.warning(e)
+        layout.set_text(utils.scrub_to_utf8(text))
+        if width is not None:
+            layout.set_width(pangocffi.units_from_double(width))
+        layout.get_pixel_size()  # Shape it now, once
+        return layout
+
+    def max_layout_size(self, texts, family, size, markup=False):
+        """Drawer.max_layout_size, from cached layouts"""
+        widths, heights = [], []
+        for text in texts:
+            w, h = self.layout(text, markup, family, size, None, True).get_pixel_size()
+            widths.append(w)
+            heights.append(h)
+        return max(widths), max(heights)
+
+    def install(self, classes):
+        """Cache the text layouts and layout sizes of these widget classes"""
+        for classdef in classes:
+            self._adopt(classdef)
+
+    def _adopt(self, classdef):
+        if "_cached_layouts" in vars(classdef):
+            return
+        original = classdef._configure
+        cache = self
+
+        def _configure(self, qtile, bar):
+            original(self, qtile, bar)
+            # Sizing throwaway layouts (TaskList, GroupBox), for this widget only
+            self.drawer.max_layout_size = cache.max_layout_size
+            # Only the layout the widget keeps, not those it makes on the fly
+            layout = getattr(self, "layout", None)
+            if type(layout) is drawer.TextLayout:
+                # The text as given, markup and all
+                text = getattr(self, "formatted_text", layout.text)
+                self.layout = CachedTextLayout(cache, layout, text)
+
+        classdef._configure = _configure
+        classdef._cached_layouts = True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return (
+            f"{len(self.entries)} layouts, ~{self.bytes / 1024:.0f} KiB, "
+            f"{self.hits}/{lookups} hits ({self.hits / lookups if lookups else 0:.0%}), "
+            f"{self.evictions} evicted"
+        )
+
+
+class CachedTextLayout(drawer.TextLayout):
+    """A TextLayout that swaps in shaped layouts from the cache
+
+    Setters only note what changed, the layout is looked up when next used,
+    so setting the text and then the width is one lookup.
+    """
+
+    def __init__(self, cache, source, text):
+        self.cache = cache
+        self.drawer, self.colour = source.drawer, source.colour
+        self.font_shadow = source.font_shadow
+        self.markup = source.markup
+        self.wrap = source.layout.get_ellipsize() != pangocffi.ELLIPSIZE_END
+        self.family = source.font_family
+        self.size = source.font_size
+        self._width = source._width
+        self._text = text
+        self._layout = None
+        source.finalize()
+
+    @property
+    def layout(self):
+        if self._layout is None:
+            self._layout = self.cache.layout(
+                self._text, self.markup, self.family, self.size, self._width, self.wrap
+            )
+        return self._layout
+
+    def finalize(self):
+        self._layout = None
+
+    @property
+    def text(self):
+        return self.layout.get_text()
+
+    @text.setter
+    def text(self, value):
+        value = "" if value is None else value
+        if value != self._text:
+            self._text = value
+            self._layout = None
+
+    @property
+    def width(self):
+        if self._width is not None:
+            return self._width
+        return self.layout.get_pixel_size()[0]
+
+    @width.setter
+    def width(self, value):
+        if value != self._width:
+            self._width = value
+            self._layout = None
+
+    def reset_width(self):
+        self.width = None
+
+    def fontdescription(self):
+        # A new one: the layout's own is shared through the cache
+        return pangocffi.FontDescription.from_string(f"{self.family} {self.size}px")
+
+    @property
+    def font_family(self):
+        return self.family
+
+    @font_family.setter
+    def font_family(self, font):
+        self.family = font
+        self._layout = None
+
+    @property
+    def font_size(self):
+        return self.size
+
+    @font_size.setter
+    def font_size(self, size):
+        self.size = size
+        self._layout = None
+
+
+def bench(windows, changes, max_width):
+    """A TaskList of windows, one of them a browser whose title keeps changing"""
+    import time
+
+    family, size = "sans", 14
+    titles = [f"Window {i} - some document title.txt" for i in range(windows)]
+    surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, 2560, 24)
+
+    class Drawer:
+        # Only what TextLayout needs of a drawer
+        ctx = pangocffi.patch_cairo_context(cairocffi.Context(surface))
+
+        def set_source_rgb(self, colour):
+            pass
+
+    def draw_bar(textlayout, sizes):
+        # TaskList.draw: size every box, then lay every title out at its width
+        for title in titles:
+            width = min(sizes(title), max_width)
+            textlayout.text = title
+            textlayout.width = width
+            textlayout.height
+
+    def uncached_sizes(title):
+        layout = drawer.TextLayout(Drawer(), "", "fff", family, size, None)
+        layout.text = title
+        width = layout.width
+        layout.finalize()
+        return width
+
+    cache = LayoutCache()
+    plain = drawer.TextLayout(Drawer(), "", "fff", family, size, None, wrap=False)
+    cached = CachedTextLayout(
+        cache,
+        drawer.TextLayout(Drawer(), "", "fff", family, size, None, wrap=False),
+        "",
+    )
+
+    def cached_sizes(title):
+        return cache.max_layout_size([title], family, size)[0]
+
+    print(f"{windows} windows, {changes} title changes, max width {max_width}px")
+    for name, textlayout, sizes in (
+        ("uncached", plain, uncached_sizes),
+        ("cached", cached, cached_sizes),
+    ):
+        start = time.perf_counter_ns()
+        for change in range(changes):
+            # A page loading: the title cycles through a few states
+            titles[0] = f"({change % 8}) Inbox - Mail — Browser"
+            draw_bar(textlayout, sizes)
+        elapsed = (time.perf_counter_ns() - start) / changes / 1000
+        print(f"{name:<10}{elapsed:>10.0f} µs per bar draw")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Text layout cache, title churn")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--windows", type=int, default=12)
+    parser.add_argument("--changes", type=int, default=2000)
+    parser.add_argument("--max-width", type=int, default=300)
+    args = parser.parse_args()
+    bench(args.windows, args.changes, args.max_width)
@@ -0,0 +1,237 @@
+# systemd unit and network link state, pushed to widgets by signals
+#
+# Units: one Subscribe() call to systemd and a single match rule covering
+# PropertiesChanged on every unit object, fanned out by object path to the
+# callbacks interested in that unit, so any number of units can be watched
+# over one subscription and nothing polls.
+#
+# Links: an rtnetlink socket joined to the link multicast group, handed to
+# the event loop, so a VPN's tunnel interface going up or down is seen as it
+# happens. The initial state of both comes from one dump/GetAll each.
+#
+#     python -m units.main          # print link changes as they happen
+
+import asyncio
+import socket
+import struct
+
+from libqtile.utils import create_task
+
+SYSTEMD = "org.freedesktop.systemd1"
+SYSTEMD_PATH = "/org/freedesktop/systemd1"
+SYSTEMD_MANAGER = "org.freedesktop.systemd1.Manager"
+SYSTEMD_UNIT = "org.freedesktop.systemd1.Unit"
+PROPERTIES = "org.freedesktop.DBus.Properties"
+
+NLMSGHDR = struct.Struct("IHHII")
+IFINFOMSG = struct.Struct("BxHiII")
+RTATTR = struct.Struct("HH")
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTMGRP_LINK = 0x1
+IFLA_IFNAME = 3
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+
+
+def parse_links(data):
+    """Yield (name, up) for every link message in a netlink datagram"""
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+            _, _, _, flags, _ = IFINFOMSG.unpack_from(data, offset + NLMSGHDR.size)
+            attr = offset + NLMSGHDR.size + IFINFOMSG.size
+            while attr + RTATTR.size <= offset + length:
+                attr_len, attr_type = RTATTR.unpack_from(data, attr)
+                if attr_len < RTATTR.size:
+                    break
+                if attr_type == IFLA_IFNAME:
+                    name = (
+                        data[attr + RTATTR.size : attr + attr_len]
+                        .rstrip(b"\0")
+                        .decode()
+                    )
+                    up = (
+                        msg_type == RTM_NEWLINK
+                        and flags & (IFF_UP | IFF_RUNNING) == IFF_UP | IFF_RUNNING
+                    )
+                    yield name, up
+                    break
+                attr += (attr_len + 3) & ~3
+        offset += (length + 3) & ~3
+
+
+class LinkMonitor:
+    def __init__(self):
+        self.links = {}  # name -> up
+        self.callbacks = {}  # name -> [callback(up)]
+        self.sock = None
+
+    def watch(self, name, callback):
+        self.callbacks.setdefault(name, []).append(callback)
+        callback(self.links.get(name, False))
+
+    def unwatch(self, name, callback):
+        self.callbacks.get(name, []).remove(callback)
+
+    def start(self):
+        self.sock = socket.socket(
+            socket.AF_NETLINK,
+            socket.SOCK_RAW | socket.SOCK_NONBLOCK,
+            socket.NETLINK_ROUTE,
+        )
+        self.sock.bind((0, RTMGRP_LINK))
+        request = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        header = NLMSGHDR.pack(
+            NLMSGHDR.size + len(request), RTM_GETLINK, NLM_F_REQUEST | NLM_F_DUMP, 1, 0
+        )
+        self.sock.send(header + request)
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self.sock.recv(64 * 1024)
+            except BlockingIOError:
+                return
+            for name, up in parse_links(data):
+                if self.links.get(name) != up:
+                    self.links[name] = up
+                    for callback in self.callbacks.get(name, ()):
+                        callback(up)
+
+    def stop(self):
+        if self.sock is not None:
+            asyncio.get_running_loop().remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+
+
+class UnitMonitor:
+    def __init__(self, pool):
+        self.pool = pool
+        self.bus = None
+        self.paths = {}  # object path -> unit name
+        self.states = {}  # unit name -> (ActiveState, SubState)
+        self.callbacks = {}  # unit name -> [callback(active state, sub state)]
+        self.links = LinkMonitor()
+
+    def watch(self, unit, callback):
+        """Call callback(active_state, sub_state) now and on every change"""
+        first = unit not in self.callbacks
+        self.callbacks.setdefault(unit, []).append(callback)
+        if unit in self.states:
+            callback(*self.states[unit])
+        elif first and self.bus is not None:
+            create_task(self._resolve(unit))
+
+    def unwatch(self, unit, callback):
+        """Stop calling callback, e.g. for a widget finalized by a config reload"""
+        self.callbacks.get(unit, []).remove(callback)
+
+    def watch_link(self, name, callback):
+        self.links.watch(name, callback)
+
+    def unwatch_link(self, name, callback):
+        self.links.unwatch(name, callback)
+
+    def start(self, qtile):
+        self.links.start()
+        create_task(self._start())
+
+    def stop(self):
+        self.links.stop()
+        if self.bus is not None:
+            self.bus.disconnect()
+            self.bus = None
+
+    async def _call(self, path, interface, member, signature="", body=()):
+        from dbus_fast import Message, MessageType
+
+        reply = await self.bus.call(
+            Message(
+                destination=SYSTEMD,
+                path=path,
+                interface=interface,
+                member=member,
+                signature=signature,
+                body=list(body),
+            )
+        )
+        if reply.message_type == MessageType.ERROR:
+            raise RuntimeError(f"{member}: {reply.error_name} {reply.body}")
+        return reply.body
+
+    async def _start(self):
+        from dbus_fast import Message
+
+        self.bus = await self.pool.lease("system", "units").connect()
+        self.bus.add_message_handler(self._on_message)
+        # One rule for every unit, systemd only emits them once subscribed
+        await self.bus.call(
+            Message(
+                destination="org.freedesktop.DBus",
+                path="/org/freedesktop/DBus",
+                interface="org.freedesktop.DBus",
+                member="AddMatch",
+                signature="s",
+                body=[
+                    f"type='signal',sender='{SYSTEMD}',interface='{PROPERTIES}',"
+                    f"member='PropertiesChanged',path_namespace='{SYSTEMD_PATH}/unit'"
+                ],
+            )
+        )
+        await self._call(SYSTEMD_PATH, SYSTEMD_MANAGER, "Subscribe")
+        for unit in list(self.callbacks):
+            await self._resolve(unit)
+
+    async def _resolve(self, unit):
+        # LoadUnit also works for units that aren't running yet
+        (path,) = await self._call(
+            SYSTEMD_PATH, SYSTEMD_MANAGER, "LoadUnit", "s", [unit]
+        )
+        self.paths[path] = unit
+        (props,) = await self._call(path, PROPERTIES, "GetAll", "s", [SYSTEMD_UNIT])
+        self._update(unit, props["ActiveState"].value, props["SubState"].value)
+
+    def _on_message(self, message):
+        unit = self.paths.get(message.path)
+        if unit is None or message.member != "PropertiesChanged":
+            return
+        interface, changed, _ = message.body
+        if interface == SYSTEMD_UNIT and "ActiveState" in changed:
+            sub_state = (
+                changed["SubState"].value
+                if "SubState" in changed
+                else self.states.get(unit, ("", ""))[1]
+            )
+            self._update(unit, changed["ActiveState"].value, sub_state)
+
+    def _update(self, unit, active_state, sub_state):
+        if self.states.get(unit) == (active_state, sub_state):
+            return
+        self.states[unit] = (active_state, sub_state)
+        for callback in self.callbacks.get(unit, ()):
+            callback(active_state, sub_state)
+
+
+if __name__ == "__main__":
+
+    async def follow():
+        links = LinkMonitor()
+        links.start()
+        await asyncio.sleep(0.1)
+        for name in links.links:
+            links.watch(
+                name, lambda up, name=name: print(f"{name} -> {'up' if up else 'down'}")
+            )
+        await asyncio.Event().wait()
+
+    asyncio.run(follow())
@@ -0,0 +1,106 @@
+# Minimal inotify wrapper for keeping in-process indexes fresh
+#
+# No extra dependencies: inotify is reached through ctypes, and the fd is
+# meant to be handed to the event loop with loop.add_reader(), after which
+# read() returns the batched events without blocking.
+
+import ctypes
+import os
+import struct
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# Everything that means "the set or content of files in here changed"
+CHANGES = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT = struct.Struct("iIII")
+
+# The process's own symbols, libc among them: find_library("c") would run
+# ldconfig on every import
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.inotify_init1.argtypes = [ctypes.c_int]
+_libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+_libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+
+def _check(result):
+    if result < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return result
+
+
+class Watcher:
+    def __init__(self):
+        self.fd = _check(_libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        self.paths = {}
+        self.watches = {}
+
+    def fileno(self):
+        return self.fd
+
+    def add(self, path, mask=CHANGES):
+        wd = _check(_libc.inotify_add_watch(self.fd, os.fsencode(path), mask))
+        self.paths[wd] = path
+        self.watches[path] = wd
+        return wd
+
+    def add_tree(self, root, mask=CHANGES, skip=()):
+        """Watch root and every directory below it, except names in skip"""
+        for directory, dirs, _ in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in skip]
+            try:
+                self.add(directory, mask | IN_ONLYDIR)
+            except OSError:
+                pass
+
+    def remove(self, path):
+        wd = self.watches.pop(path, None)
+        if wd is not None:
+            self.paths.pop(wd, None)
+            _libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        """Return [(full path, mask)] for every pending event"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were dropped, the caller should rescan
+                    events.append((None, mask))
+                    continue
+                directory = self.paths.get(wd)
+                if mask & IN_IGNORED:
+                    self.paths.pop(wd, None)
+                    self.watches.pop(directory, None)
+                    continue
+                if directory is None:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name)) if name else directory
+                events.append((path, mask))
+
+    def close(self):
+        os.close(self.fd)
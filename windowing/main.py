@@ -0,0 +1,120 @@
+# Window management logic used by config.py
+#
+# Nothing in here imports libqtile, so every function can be driven by the
+# fake qtile in simulation/main.py as well as by the real one.
+
+sticky_windows = []
+
+# Screen index per screen_affinity, set by remap_groups() on every screen
+# change. Until then affinity n means screen n.
+affinity_screens = {}
+
+
+def cycle_windows(group, forwards=True):
+    current = group.current_window
+    if current:
+        current.change_layer()
+
+        if forwards:
+            group.next_window()
+        else:
+            group.previous_window()
+
+    current = group.current_window
+    if current:
+        current.bring_to_front()
+
+
+def window_to_prev_group(qtile):
+    i = qtile.groups.index(qtile.current_group)
+    if qtile.current_window is not None and i != 0:
+        qtile.current_window.togroup(qtile.groups[i - 1].name)
+        qtile.current_screen.prev_group()
+
+
+def window_to_next_group(qtile):
+    i = qtile.groups.index(qtile.current_group)
+    if qtile.current_window is not None and i != 6:
+        qtile.current_window.togroup(qtile.groups[i + 1].name)
+        qtile.current_screen.next_group()
+
+
+def float_to_front(qtile):
+    """Bring all floating windows of the group to front"""
+    for window in qtile.current_group.windows:
+        if window.floating:
+            window.bring_to_front()
+
+
+# Sticky Window Functionality
+def toggle_sticky_windows(qtile, window=None):
+    if window is None:
+        window = qtile.current_screen.group.current_window
+    if window in sticky_windows:
+        sticky_windows.remove(window)
+    else:
+        sticky_windows.append(window)
+    return window
+
+
+def move_sticky_windows(qtile):
+    for window in sticky_windows:
+        window.togroup()
+        window.bring_to_front()
+        qtile.current_screen.group.focus_back()
+
+
+def remove_sticky_windows(window):
+    if window in sticky_windows:
+        sticky_windows.remove(window)
+
+
+# Groups
+def affinity_screen(qtile, group):
+    """Index of the screen a group belongs on, None for the current one"""
+    affinity = group.screen_affinity
+    index = affinity_screens.get(affinity, None if affinity_screens else affinity)
+    if index is None or index >= len(qtile.screens):
+        return None
+    return index
+
+
+def remap_groups(qtile, roles):
+    """After a screen change, show each screen a group with its affinity
+
+    roles[i] is the affinity screen i stands for.
+    """
+    affinity_screens.clear()
+    for index, role in enumerate(roles):
+        affinity_screens.setdefault(role, index)
+    for screen, role in zip(qtile.screens, roles):
+        if screen.group is not None and screen.group.screen_affinity == role:
+            continue
+        for group in qtile.groups:
+            if group.screen_affinity == role and group.screen is None:
+                screen.set_group(group)
+                break
+
+
+def go_to_group(name: str):
+    def _inner(qtile):
+        index = affinity_screen(qtile, qtile.groups_map[name])
+        if index is not None:
+            qtile.focus_screen(index)
+        qtile.groups_map[name].toscreen()
+
+    return _inner
+
+
+def go_to_group_and_move_window(name: str):
+    def _inner(qtile):
+        index = affinity_screen(qtile, qtile.groups_map[name])
+        if index is None:
+            qtile.current_window.togroup(name, switch_group=True)
+            return
+
+        qtile.current_window.togroup(name, switch_group=False)
+        qtile.focus_screen(index)
+        qtile.groups_map[name].toscreen()
+
+    return _inner